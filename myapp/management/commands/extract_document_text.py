@@ -0,0 +1,67 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from ...model.department import Document, ExtractedText
+from ...utils.extraction import EXTRACTABLE_EXTENSIONS, EXTRACTION_WORKERS, extract_document_text, \
+    record_extraction_error
+
+
+class Command(BaseCommand):
+    help = 'Extracts the text of documents uploaded before text extraction existed and adds it to the search index. ' \
+           'Files are extracted once, an interrupted run continues where it stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=EXTRACTION_WORKERS)
+        parser.add_argument('--after-id', type=int, default=0, help='Skip documents up to this id')
+
+    def create_executor(self):
+        # Spawned so workers never share this process's database connection
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=django.setup)
+
+    def extract_batch(self, documents, document_ids):
+        try:
+            list(self.executor.map(extract_document_text, document_ids))
+            return
+        except BrokenProcessPool:
+            self.executor = self.create_executor()
+        # A worker died, e.g. killed for running out of memory: one file at a time finds the file that kills it
+        for document_id in documents.filter(pk__in=document_ids).values_list('pk', flat=True):
+            try:
+                self.executor.submit(extract_document_text, document_id).result()
+            except BrokenProcessPool:
+                self.executor = self.create_executor()
+                record_extraction_error(document_id, 'The extraction worker stopped while reading this file')
+                self.stderr.write(f'Document {document_id} stopped the extraction worker, recorded as unreadable')
+
+    def handle(self, *args, **options):
+        # Documents without a digest are not in the blob store yet, run migrate_documents_to_blobs first
+        documents = Document.objects.filter(extension__in=EXTRACTABLE_EXTENSIONS).exclude(sha256='') \
+            .exclude(Exists(ExtractedText.objects.filter(sha256=OuterRef('sha256'))))
+
+        extracted = 0
+        last_id = options['after_id']
+        self.workers = options['workers']
+        self.executor = self.create_executor()
+        try:
+            while True:
+                batch = list(documents.filter(pk__gt=last_id).order_by('pk')
+                             .values_list('pk', 'sha256')[:options['batch_size']])
+                if not batch:
+                    break
+                # One document per content, extract_document_text indexes the duplicates too
+                document_ids = list({sha256: pk for pk, sha256 in reversed(batch)}.values())
+                self.extract_batch(documents, document_ids)
+                extracted += len(document_ids)
+                last_id = batch[-1][0]
+                self.stdout.write(f'Extracted {extracted} files, up to document {last_id}')
+        finally:
+            self.executor.shutdown()
+        failed = ExtractedText.objects.exclude(error='').count()
+        self.stdout.write(self.style.SUCCESS(f'Extracted {extracted} files, {failed} files could not be read so far'))
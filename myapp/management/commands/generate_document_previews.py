@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from ...model.department import Document
+from ...utils.previews import generate_previews
+
+
+class Command(BaseCommand):
+    help = 'Generates missing thumbnails and previews for image documents uploaded before previews existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--overwrite', action='store_true', help='Render existing previews again')
+
+    def handle(self, *args, **options):
+        # Documents without a digest are not in the blob store yet, run migrate_documents_to_blobs first
+        documents = Document.objects.filter(file_kind='image').exclude(sha256='')
+
+        generated = 0
+        failed = 0
+        seen = set()
+        last_id = 0
+        while True:
+            batch = list(documents.filter(pk__gt=last_id).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            for document in batch:
+                last_id = document.pk
+                if document.sha256 in seen:
+                    continue
+                seen.add(document.sha256)
+                try:
+                    generated += generate_previews(document, overwrite=options['overwrite'])
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Document {document.pk}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Generated {generated} previews, {failed} documents failed'))
@@ -0,0 +1,34 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from ...model.department import Document
+
+
+class Command(BaseCommand):
+    help = 'Moves documents stored before the blob store into content-addressed blobs, merging duplicates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        migrated = 0
+        missing = 0
+        last_id = 0
+        while True:
+            batch = list(Document.objects.filter(sha256='', pk__gt=last_id).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            for document in batch:
+                last_id = document.pk
+                if not os.path.exists(document.doc.path):
+                    missing += 1
+                    self.stderr.write(f'Document {document.pk}: file {document.doc.name} not found')
+                    continue
+                with open(document.doc.path, 'rb') as file:
+                    # Saving releases the old file through the Document signals
+                    document.doc = File(file, name=os.path.basename(document.doc.name))
+                    document.save()
+                migrated += 1
+        self.stdout.write(self.style.SUCCESS(f'Migrated {migrated} documents, {missing} files missing'))
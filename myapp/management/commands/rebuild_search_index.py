@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...utils.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rewrites the search index rows of all documents, including the text extracted from their files.'
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} documents'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...utils.stats import rebuild_storage_stats, rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the storage statistics and daily upload rollups used by the dashboards.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rows = rebuild_storage_stats()
+            daily_rows = rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} storage statistics rows and {daily_rows} daily rows'))
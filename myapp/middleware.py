@@ -1,6 +1,11 @@
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
+# Active users are those seen in the last 10 minutes, a write per minute is precise enough
+LAST_ACTIVITY_UPDATE_INTERVAL = timedelta(minutes=1)
+
 
 class UpdateLastActivityMiddleware:
     def __init__(self, get_response):
@@ -10,8 +15,8 @@ class UpdateLastActivityMiddleware:
         response = self.get_response(request)
 
         if request.user.is_authenticated:
-            user_model = get_user_model()
-            user = user_model.objects.get(pk=request.user.pk)
-            user.last_activity_time = timezone.now()
-            user.save(update_fields=['last_activity_time'])
+            now = timezone.now()
+            last_activity_time = request.user.last_activity_time
+            if last_activity_time is None or now - last_activity_time >= LAST_ACTIVITY_UPDATE_INTERVAL:
+                get_user_model().objects.filter(pk=request.user.pk).update(last_activity_time=now)
         return response
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.4 on 2026-10-18 16:48
+
+from django.db import migrations, models
+import myapp.utils.common
+import myapp.utils.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_upload_session'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='doc',
+            field=models.FileField(storage=myapp.utils.storage.ContentAddressedStorage(), upload_to=myapp.utils.common.document_upload_path),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 3.2.4 on 2026-10-18 16:56
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Classification of stored file names as of this migration, kept here so later changes to the app's helpers
+# never change what the migration does
+FILE_KIND_EXTENSIONS = {
+    'pdf': ['pdf'],
+    'ppt': ['ppt', 'pptx'],
+    'word': ['doc', 'docx'],
+    'excel': ['xls', 'xlsx'],
+    'image': ['jpg', 'jpeg', 'png'],
+}
+
+
+def get_extension(file_name):
+    return os.path.splitext(file_name or '')[1][1:].lower()[:10]
+
+
+def get_file_kind(file_name):
+    extension = get_extension(file_name)
+    for file_kind, extensions in FILE_KIND_EXTENSIONS.items():
+        if extension in extensions:
+            return file_kind
+    return 'other'
+
+
+def populate_storage_stats(apps, schema_editor):
+    Document = apps.get_model('myapp', 'Document')
+    DocumentStorageStat = apps.get_model('myapp', 'DocumentStorageStat')
+    totals = {}
+    rows = Document.objects.values_list('user_id', 'cat__dep_id', 'cat_id', 'sub_cat_id', 'doc', 'size')
+    for user_id, dep_id, cat_id, sub_cat_id, name, size in rows.iterator():
+        key = (user_id, dep_id, cat_id, sub_cat_id, get_file_kind(name))
+        count, total_size = totals.get(key, (0, 0))
+        totals[key] = (count + 1, total_size + (size or 0))
+    DocumentStorageStat.objects.bulk_create([
+        DocumentStorageStat(user_id=user_id, dep_id=dep_id, cat_id=cat_id, sub_cat_id=sub_cat_id, file_kind=file_kind,
+                            file_count=count, total_size=total_size)
+        for (user_id, dep_id, cat_id, sub_cat_id, file_kind), (count, total_size) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_blob_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentStorageStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_kind', models.CharField(max_length=10)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('cat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.category')),
+                ('dep', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.department')),
+                ('sub_cat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.subcategory')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'dep', 'cat', 'sub_cat', 'file_kind')},
+            },
+        ),
+        migrations.RunPython(populate_storage_stats, migrations.RunPython.noop),
+    ]
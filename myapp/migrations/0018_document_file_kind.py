@@ -0,0 +1,61 @@
+# Generated by Django 3.2.4 on 2026-10-18 16:58
+
+import os
+
+from django.db import migrations, models
+
+# Classification of stored file names as of this migration, kept here so later changes to the app's helpers
+# never change what the migration does
+FILE_KIND_EXTENSIONS = {
+    'pdf': ['pdf'],
+    'ppt': ['ppt', 'pptx'],
+    'word': ['doc', 'docx'],
+    'excel': ['xls', 'xlsx'],
+    'image': ['jpg', 'jpeg', 'png'],
+}
+
+
+def get_extension(file_name):
+    return os.path.splitext(file_name or '')[1][1:].lower()[:10]
+
+
+def get_file_kind(file_name):
+    extension = get_extension(file_name)
+    for file_kind, extensions in FILE_KIND_EXTENSIONS.items():
+        if extension in extensions:
+            return file_kind
+    return 'other'
+
+
+def populate_file_kind(apps, schema_editor):
+    Document = apps.get_model('myapp', 'Document')
+    batch = []
+    for document in Document.objects.only('id', 'doc').iterator():
+        document.extension = get_extension(document.doc.name)
+        document.file_kind = get_file_kind(document.doc.name)
+        batch.append(document)
+        if len(batch) >= 1000:
+            Document.objects.bulk_update(batch, ['extension', 'file_kind'])
+            batch = []
+    Document.objects.bulk_update(batch, ['extension', 'file_kind'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_document_storage_stat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='extension',
+            field=models.CharField(blank=True, db_index=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='file_kind',
+            field=models.CharField(blank=True, db_index=True, max_length=10),
+        ),
+        migrations.RunPython(populate_file_kind, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.2.4 on 2026-10-18 17:07
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def populate_daily_stats(apps, schema_editor):
+    Document = apps.get_model('myapp', 'Document')
+    DocumentDailyStat = apps.get_model('myapp', 'DocumentDailyStat')
+    totals = Document.objects.annotate(day=TruncDate('upload_time')) \
+        .values('day', 'cat__dep_id', 'cat_id', 'file_kind') \
+        .annotate(file_count=Count('id'), total_size=Sum('size')).order_by()
+    DocumentDailyStat.objects.bulk_create([
+        DocumentDailyStat(day=total['day'], dep_id=total['cat__dep_id'], cat_id=total['cat_id'],
+                          file_kind=total['file_kind'], file_count=total['file_count'],
+                          total_size=total['total_size'] or 0)
+        for total in totals.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_report_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('file_kind', models.CharField(max_length=10)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('cat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.category')),
+                ('dep', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='myapp.department')),
+            ],
+            options={
+                'unique_together': {('day', 'dep', 'cat', 'file_kind')},
+            },
+        ),
+        migrations.RunPython(populate_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 3.2.4 on 2026-10-18 17:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SEARCH_COLUMNS = ['name', 'category', 'sub_category', 'uploader', 'doc_type', 'content']
+
+# Punctuation is replaced so that file names like quarterly_report.pdf are split into words
+POSTGRES_SQL = [
+    """
+    ALTER TABLE myapp_documentsearchindex ADD COLUMN vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', regexp_replace(name, '[^[:alnum:]]+', ' ', 'g')), 'A') ||
+        setweight(to_tsvector('simple', regexp_replace(category || ' ' || sub_category, '[^[:alnum:]]+', ' ', 'g')),
+                  'B') ||
+        setweight(to_tsvector('simple', regexp_replace(uploader || ' ' || doc_type, '[^[:alnum:]]+', ' ', 'g')),
+                  'C') ||
+        setweight(to_tsvector('simple', content), 'D')
+    ) STORED
+    """,
+    'CREATE INDEX myapp_documentsearchindex_vector ON myapp_documentsearchindex USING GIN (vector)',
+]
+POSTGRES_REVERSE_SQL = ['ALTER TABLE myapp_documentsearchindex DROP COLUMN vector']
+
+# External content FTS5 table over myapp_documentsearchindex, kept in sync by triggers.
+# Note that SQLite rebuilds tables on most schema changes, which drops these triggers.
+SQLITE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE myapp_documentsearchindex_fts USING fts5(
+        {', '.join(SEARCH_COLUMNS)}, content='myapp_documentsearchindex', content_rowid='document_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER myapp_documentsearchindex_fts_insert AFTER INSERT ON myapp_documentsearchindex BEGIN
+        INSERT INTO myapp_documentsearchindex_fts(rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.document_id, {', '.join(f'new.{column}' for column in SEARCH_COLUMNS)});
+    END
+    """,
+    f"""
+    CREATE TRIGGER myapp_documentsearchindex_fts_delete AFTER DELETE ON myapp_documentsearchindex BEGIN
+        INSERT INTO myapp_documentsearchindex_fts(myapp_documentsearchindex_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.document_id, {', '.join(f'old.{column}' for column in SEARCH_COLUMNS)});
+    END
+    """,
+    f"""
+    CREATE TRIGGER myapp_documentsearchindex_fts_update AFTER UPDATE ON myapp_documentsearchindex BEGIN
+        INSERT INTO myapp_documentsearchindex_fts(myapp_documentsearchindex_fts, rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES ('delete', old.document_id, {', '.join(f'old.{column}' for column in SEARCH_COLUMNS)});
+        INSERT INTO myapp_documentsearchindex_fts(rowid, {', '.join(SEARCH_COLUMNS)})
+        VALUES (new.document_id, {', '.join(f'new.{column}' for column in SEARCH_COLUMNS)});
+    END
+    """,
+]
+SQLITE_REVERSE_SQL = [
+    'DROP TRIGGER myapp_documentsearchindex_fts_insert',
+    'DROP TRIGGER myapp_documentsearchindex_fts_delete',
+    'DROP TRIGGER myapp_documentsearchindex_fts_update',
+    'DROP TABLE myapp_documentsearchindex_fts',
+]
+
+
+def run_vendor_sql(statements):
+    # Other databases have no full-text index, myapp.utils.search falls back to LIKE there
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def populate_search_index(apps, schema_editor):
+    Document = apps.get_model('myapp', 'Document')
+    DocumentSearchIndex = apps.get_model('myapp', 'DocumentSearchIndex')
+    rows = Document.objects.values_list('id', 'name', 'cat__cat_name', 'sub_cat__sub_cat_name', 'user__username',
+                                        'doc_type').order_by('id')
+    DocumentSearchIndex.objects.bulk_create((
+        DocumentSearchIndex(document_id=document_id, name=name, category=category or '',
+                            sub_category=sub_category or '', uploader=uploader or '', doc_type=doc_type)
+        for document_id, name, category, sub_category, uploader, doc_type in rows.iterator()
+    ), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_document_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSearchIndex',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='myapp.document')),
+                ('name', models.CharField(max_length=255)),
+                ('category', models.CharField(max_length=255)),
+                ('sub_category', models.CharField(max_length=255)),
+                ('uploader', models.CharField(max_length=255)),
+                ('doc_type', models.CharField(max_length=100)),
+                ('content', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(run_vendor_sql({'postgresql': POSTGRES_SQL, 'sqlite': SQLITE_SQL}),
+                             run_vendor_sql({'postgresql': POSTGRES_REVERSE_SQL, 'sqlite': SQLITE_REVERSE_SQL})),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.4 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0021_document_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('text', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+                ('extracted_on', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.4 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0022_extracted_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'name', 'id'], name='document_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'size', 'id'], name='document_user_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['user', 'doc_type', 'id'], name='document_user_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['sub_cat', 'file_kind', 'upload_time'], name='document_subcat_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['cat', 'file_kind', 'upload_time'], name='document_cat_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['cat', 'doc_type'], name='document_cat_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grievance',
+            index=models.Index(fields=['user', 'created_date'], name='grievance_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.4 on 2026-10-18 18:05
+
+import os
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import TruncDate
+
+
+def restore_byte_sizes(apps, schema_editor):
+    # update_document used to store the size of a replaced file in whole MB. Those documents predate the blob
+    # store and have no digest, their size is read from the file again and the storage rollups follow it
+    Document = apps.get_model('myapp', 'Document')
+    DocumentStorageStat = apps.get_model('myapp', 'DocumentStorageStat')
+    DocumentDailyStat = apps.get_model('myapp', 'DocumentDailyStat')
+    storage = Document._meta.get_field('doc').storage
+    rows = Document.objects.filter(sha256='').annotate(day=TruncDate('upload_time')).values_list(
+        'id', 'user_id', 'cat__dep_id', 'cat_id', 'sub_cat_id', 'file_kind', 'day', 'doc', 'size')
+    for document_id, user_id, dep_id, cat_id, sub_cat_id, file_kind, day, name, size in rows.iterator():
+        try:
+            # The old update_document also stored absolute paths
+            path = name if os.path.isabs(name) else storage.path(name)
+        except SuspiciousFileOperation:
+            continue
+        if not os.path.isfile(path) or os.path.getsize(path) == size:
+            continue
+        change = os.path.getsize(path) - size
+        Document.objects.filter(pk=document_id).update(size=F('size') + change)
+        DocumentStorageStat.objects.filter(user_id=user_id, dep_id=dep_id, cat_id=cat_id, sub_cat_id=sub_cat_id,
+                                           file_kind=file_kind).update(total_size=F('total_size') + change)
+        DocumentDailyStat.objects.filter(day=day, dep_id=dep_id, cat_id=cat_id, file_kind=file_kind) \
+            .update(total_size=F('total_size') + change)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0023_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_byte_sizes, migrations.RunPython.noop),
+    ]
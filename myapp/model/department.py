@@ -1,7 +1,12 @@
-from django.db import models
+import os
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
 
 from ..models import User
-from ..utils.common import document_upload_path
+from ..utils.common import document_upload_path, get_extension, get_file_kind
+from ..utils.storage import blob_storage, blob_digest
 
 
 class Department(models.Model):
@@ -26,10 +31,174 @@ class Document(models.Model):
     cat = models.ForeignKey(Category, on_delete=models.CASCADE, default=1)
     sub_cat = models.ForeignKey(SubCategory, on_delete=models.CASCADE, default=2)
     name = models.CharField(max_length=255)
-    doc = models.FileField(upload_to=document_upload_path)  # FileField for the uploaded document
+    # Content-addressed, identical uploads share one blob
+    doc = models.FileField(upload_to=document_upload_path, storage=blob_storage)
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)  # Empty for files stored before blobs
     doc_type = models.CharField(max_length=100)
+    # Derived from the stored file name, so type filters and counts can use an index instead of suffix scans
+    extension = models.CharField(max_length=10, blank=True, db_index=True)
+    file_kind = models.CharField(max_length=10, blank=True, db_index=True)  # pdf, ppt, image, word, excel or other
     size = models.IntegerField()
     upload_time = models.DateTimeField(auto_now_add=True)  # Timestamp of upload
 
+    class Meta:
+        # Access paths of the listings and reports, guarded by the query plan tests in myapp/tests.py
+        indexes = [
+            # A user's documents sorted by name, size or type, the id keeps cursor pages in index order
+            models.Index(fields=['user', 'name', 'id'], name='document_user_name_idx'),
+            models.Index(fields=['user', 'size', 'id'], name='document_user_size_idx'),
+            models.Index(fields=['user', 'doc_type', 'id'], name='document_user_type_idx'),
+            # Admin document table of a sub category or category, per file type and by upload time
+            models.Index(fields=['sub_cat', 'file_kind', 'upload_time'], name='document_subcat_kind_idx'),
+            models.Index(fields=['cat', 'file_kind', 'upload_time'], name='document_cat_kind_idx'),
+            # Storage reports of a category per document type
+            models.Index(fields=['cat', 'doc_type'], name='document_cat_type_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def set_file_fields(self):
+        # Also called by code paths that insert with bulk_create, which skips save()
+        self.sha256 = blob_digest(self.doc.name)
+        self.extension = get_extension(self.doc.name)
+        self.file_kind = get_file_kind(self.doc.name)
+
+    def save(self, *args, **kwargs):
+        # Commit a newly assigned file first so the blob digest is known before the row is written
+        if self.doc and not self.doc._committed:
+            self.doc.save(self.doc.name, self.doc.file, save=False)
+        self.set_file_fields()
+        # The row commits together with its blob reference and statistics, see myapp.signals
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)  # Storage path of the shared file
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)  # 0 from the release of the last reference until the file is deleted
+
+
+class DocumentStorageStat(models.Model):
+    """
+    Running file count and byte total per owner, location and file kind,
+    kept up to date by the Document signals (see myapp.signals) so that the
+    dashboards never have to scan documents.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    dep = models.ForeignKey(Department, on_delete=models.CASCADE)
+    cat = models.ForeignKey(Category, on_delete=models.CASCADE)
+    sub_cat = models.ForeignKey(SubCategory, on_delete=models.CASCADE)
+    file_kind = models.CharField(max_length=10)  # pdf, ppt, image, word, excel or other
+    file_count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['user', 'dep', 'cat', 'sub_cat', 'file_kind']
+
+
+class DocumentDailyStat(models.Model):
+    """
+    File count and bytes of the documents uploaded per day, location and
+    file kind, kept up to date by the Document signals like
+    DocumentStorageStat. Backs the storage growth time series.
+    """
+    day = models.DateField()  # Upload date in the TIME_ZONE setting
+    dep = models.ForeignKey(Department, on_delete=models.CASCADE)
+    cat = models.ForeignKey(Category, on_delete=models.CASCADE)
+    file_kind = models.CharField(max_length=10)
+    file_count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['day', 'dep', 'cat', 'file_kind']
+
+
+class DocumentSearchIndex(models.Model):
+    """
+    Searchable text of a document, kept up to date by myapp.signals. The
+    database indexes it itself: a generated tsvector column with a GIN index
+    on PostgreSQL and an FTS5 table on SQLite, see migration 0021 and
+    myapp.utils.search.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='search')
+    name = models.CharField(max_length=255)
+    category = models.CharField(max_length=255)
+    sub_category = models.CharField(max_length=255)
+    uploader = models.CharField(max_length=255)
+    doc_type = models.CharField(max_length=100)
+    content = models.TextField(blank=True)  # Text extracted from the file
+
+
+class ExtractedText(models.Model):
+    """
+    Plain text of a stored file, keyed by content like the blobs so that a
+    file is extracted once however often it is uploaded. Written by
+    myapp.utils.extraction and copied into DocumentSearchIndex.content.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    text = models.TextField(blank=True)
+    error = models.TextField(blank=True)  # Why extraction failed, failed files are not tried again
+    extracted_on = models.DateTimeField(auto_now_add=True)
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    cat = models.ForeignKey(Category, on_delete=models.CASCADE)
+    sub_cat = models.ForeignKey(SubCategory, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)  # Final document name including the extension
+    doc_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    checksum = models.CharField(max_length=64, blank=True)  # Expected SHA-256 of the whole file
+    received_size = models.BigIntegerField(default=0)
+    next_chunk = models.IntegerField(default=0)
+    is_completed = models.BooleanField(default=False)
+    created_on = models.DateTimeField(auto_now_add=True)
+    updated_on = models.DateTimeField(auto_now=True)
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'upload_sessions', f'{self.id}.part')
+
+
+class DataVersion(models.Model):
+    """
+    Counter bumped by the signals in myapp.signals whenever documents or the
+    department tree change, so cached results can tell whether they are stale.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+
+class ReportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    SCOPE_ALL = 'all'  # Every department, requested by an admin
+    SCOPE_USER = 'user'  # The departments of the requesting user
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    scope = models.CharField(max_length=10)
+    filters = models.JSONField(default=dict)  # Normalized storage report filters
+    export_format = models.CharField(max_length=10)
+    cache_key = models.CharField(max_length=64, db_index=True)  # Hash of scope, filters, format and data version
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    error = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def artifact_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'reports', f'{self.cache_key}.{self.export_format}')
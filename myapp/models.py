@@ -71,6 +71,9 @@ class Grievance(models.Model):
     description = models.TextField()
     created_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_date'], name='grievance_user_created_idx')]
+
     def save(self, *args, **kwargs):
         if not self.gk_id:
             last_grievance = Grievance.objects.order_by('-gk_id').first()
@@ -0,0 +1,230 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .model.department import Document, Blob, Department, Category, SubCategory, DocumentStorageStat, \
+    DocumentDailyStat, ExtractedText
+from .models import User
+from .utils.caching import invalidate_dashboards
+from .utils.extraction import schedule_text_extraction
+from .utils.previews import delete_previews, generate_previews_safely
+from .utils.search import index_documents
+from .utils.versions import DOCUMENT_UPDATES_VERSION, SEARCH_VERSION, bump_data_version
+
+
+def retain_blob(sha256, name, size):
+    if not sha256:
+        return
+    # Locked so that deleting the blob once unreferenced (see delete_unreferenced_blob) waits for this transaction
+    blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                blob = Blob.objects.create(sha256=sha256, name=name, size=size, ref_count=0)
+        except IntegrityError:
+            # Another upload of the same content created the row first
+            blob = Blob.objects.select_for_update().get(sha256=sha256)
+    Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+    if blob.ref_count == 0 and not Document._meta.get_field('doc').storage.exists(blob.name):
+        # The storage reused the file of a blob whose deletion finished before the row was locked
+        raise FileNotFoundError(f'The stored file of {name} was deleted meanwhile, please upload it again')
+
+
+def release_blob(sha256, name):
+    if not sha256:
+        # Files stored before the blob store belong to a single document
+        if name:
+            storage = Document._meta.get_field('doc').storage
+            transaction.on_commit(lambda: storage.delete(name))
+        return
+    blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+    if blob is None or blob.ref_count <= 0:
+        return
+    Blob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') - 1)
+    if blob.ref_count == 1:
+        # The row stays, with no references, until the file is gone: uploads of the same content lock it meanwhile
+        transaction.on_commit(lambda: delete_unreferenced_blob(sha256))
+
+
+def delete_unreferenced_blob(sha256):
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256, ref_count=0).first()
+        if blob is None:
+            # Referenced again by an upload since it was released
+            return
+        Document._meta.get_field('doc').storage.delete(blob.name)
+        delete_previews(sha256)
+        ExtractedText.objects.filter(sha256=sha256).delete()
+        blob.delete()
+
+
+# Key fields of each statistics rollup maintained below
+STAT_KEY_FIELDS = {
+    DocumentStorageStat: ['user_id', 'dep_id', 'cat_id', 'sub_cat_id', 'file_kind'],
+    DocumentDailyStat: ['day', 'dep_id', 'cat_id', 'file_kind'],
+}
+
+
+def get_stat_keys(document, dep_ids):
+    if document.cat_id not in dep_ids:
+        dep_ids[document.cat_id] = Category.objects.filter(pk=document.cat_id).values_list('dep_id', flat=True).first()
+    dep_id = dep_ids[document.cat_id]
+    return {
+        DocumentStorageStat: (document.user_id, dep_id, document.cat_id, document.sub_cat_id, document.file_kind),
+        DocumentDailyStat: (timezone.localdate(document.upload_time), dep_id, document.cat_id, document.file_kind),
+    }
+
+
+def new_stat_changes():
+    return {model: defaultdict(lambda: (0, 0)) for model in STAT_KEY_FIELDS}
+
+
+def adjust_stats(changes):
+    """
+    Applies {model: {key: (count delta, size delta)}} to the statistics
+    rollups. Decrements never create rows: a missing row was removed by the
+    cascade that is deleting its documents.
+    """
+    for model, model_changes in changes.items():
+        for key_values, (count, size) in model_changes.items():
+            if not count and not size:
+                continue
+            key = dict(zip(STAT_KEY_FIELDS[model], key_values))
+            stats = model.objects.filter(**key)
+            updated = stats.update(file_count=F('file_count') + count, total_size=F('total_size') + size)
+            if updated or count < 0 or key['dep_id'] is None:
+                continue
+            try:
+                with transaction.atomic():
+                    model.objects.create(file_count=count, total_size=size, **key)
+            except IntegrityError:
+                # Created concurrently by another upload to the same place
+                stats.update(file_count=F('file_count') + count, total_size=F('total_size') + size)
+
+
+def count_documents(documents, sign, changes, dep_ids):
+    for document in documents:
+        for model, key in get_stat_keys(document, dep_ids).items():
+            count, size = changes[model][key]
+            changes[model][key] = (count + sign, size + sign * document.size)
+
+
+def on_documents_created(documents):
+    """
+    Bookkeeping for new documents. Called from post_save and directly by code
+    paths that insert documents with bulk_create, which sends no signals.
+    """
+    changes = new_stat_changes()
+    count_documents(documents, 1, changes, {})
+    adjust_stats(changes)
+    bump_data_version()
+    invalidate_dashboards(*[document.user_id for document in documents])
+    index_documents([document.pk for document in documents])
+    for document in documents:
+        retain_blob(document.sha256, document.doc.name, document.size)
+        schedule_previews(document)
+        schedule_text_extraction(document)
+
+
+def schedule_previews(document):
+    # Rendered once the upload is committed so a rollback leaves nothing behind
+    transaction.on_commit(lambda: generate_previews_safely(document))
+
+
+@receiver(pre_save, sender=Document)
+def remember_previous_document(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Document.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, created, **kwargs):
+    with transaction.atomic():
+        previous = getattr(instance, '_previous', None)
+        if created or previous is None:
+            on_documents_created([instance])
+        else:
+            changes = new_stat_changes()
+            dep_ids = {}
+            count_documents([previous], -1, changes, dep_ids)
+            count_documents([instance], 1, changes, dep_ids)
+            adjust_stats(changes)
+            bump_data_version()
+            bump_data_version(DOCUMENT_UPDATES_VERSION)
+            invalidate_dashboards(instance.user_id)
+            index_documents([instance.pk])
+            if previous.doc.name != instance.doc.name:
+                retain_blob(instance.sha256, instance.doc.name, instance.size)
+                release_blob(previous.sha256, previous.doc.name)
+                schedule_previews(instance)
+                schedule_text_extraction(instance)
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    with transaction.atomic():
+        changes = new_stat_changes()
+        count_documents([instance], -1, changes, {})
+        adjust_stats(changes)
+        bump_data_version()
+        invalidate_dashboards(instance.user_id)
+        release_blob(instance.sha256, instance.doc.name)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # Moving a category to another department moves its statistics along
+    if not created:
+        for model in STAT_KEY_FIELDS:
+            model.objects.filter(cat=instance).exclude(dep_id=instance.dep_id).update(dep_id=instance.dep_id)
+        bump_data_version()
+        bump_data_version(DOCUMENT_UPDATES_VERSION)
+        # Documents are searchable by category name
+        index_documents(Document.objects.filter(cat=instance).exclude(search__category=instance.cat_name)
+                        .values_list('id', flat=True))
+
+
+@receiver(post_save, sender=SubCategory)
+def sub_category_saved(sender, instance, created, **kwargs):
+    if not created:
+        if index_documents(Document.objects.filter(sub_cat=instance)
+                           .exclude(search__sub_category=instance.sub_cat_name).values_list('id', flat=True)):
+            bump_data_version(SEARCH_VERSION)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # Documents are searchable by uploader, only a renamed user needs them indexed again
+    if not created:
+        if index_documents(Document.objects.filter(user=instance).exclude(search__uploader=instance.username)
+                           .values_list('id', flat=True)):
+            bump_data_version(SEARCH_VERSION)
+
+
+@receiver(post_save, sender=Department)
+def department_saved(sender, instance, created, **kwargs):
+    # Reports show department names, a rename changes them
+    if not created:
+        bump_data_version()
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Department)
+def department_tree_deleted(sender, instance, **kwargs):
+    bump_data_version()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+def department_tree_changed(sender, instance, **kwargs):
+    # The admin dashboards list departments, categories and sub categories
+    invalidate_dashboards()
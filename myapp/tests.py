@@ -1,3 +1,1533 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import zlib
+from datetime import date
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from openpyxl import Workbook, load_workbook
+from rest_framework.test import APIClient
+
+from .model.department import Department, Category, SubCategory, Document, Blob, DocumentSearchIndex, \
+    DocumentDailyStat, DocumentStorageStat, ReportJob
+from .models import User, Grievance
+from .signals import STAT_KEY_FIELDS
+from .utils.analytics import DocumentSnapshot
+from .utils.caching import get_dashboard_cache
+from .utils.common import convert_size
+from .utils.extraction import extract_document_text, extract_text
+from .utils.jobs import REPORT_JOB_TIMEOUT, run_report_job
+from .utils.pagination import estimate_count, get_plan_estimate, paginate
+from .utils.previews import PREVIEW_SIZES, preview_name
+from .utils.search import rebuild_search_index
+from .utils.stats import rebuild_daily_stats, rebuild_storage_stats
+from .utils.streaming import BASE64_READ_SIZE, Base64File, stream_json
+from .utils.versions import DOCUMENT_LIST_VERSIONS
+
+# Tables that grow with use and must never be read in full by a scoped listing or report
+WATCHED_TABLES = ['myapp_document', 'myapp_grievance']
+FILE_TYPES = [('pdf', 'pdf'), ('docx', 'word'), ('xlsx', 'excel'), ('pptx', 'ppt'), ('png', 'image')]
+
+
+def get_table_aliases(sql):
+    # Subqueries refer to tables by aliases like U0, plans name the alias
+    aliases = {}
+    for table, alias in re.findall(r'"(%s)"(?:\s+(?:AS\s+)?"?(\w+)"?)?' % '|'.join(WATCHED_TABLES), sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'INNER', 'LEFT', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'WITH'):
+            aliases[alias] = table
+    return aliases
+
+
+def explain_sqlite(sql):
+    """
+    Full scans of watched tables in an SQLite plan and whether it sorts in
+    a temporary b-tree. SCAN, with or without an index, reads every row;
+    SEARCH looks rows up by an index condition.
+    """
+    aliases = get_table_aliases(sql)
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        details = [row[-1] for row in cursor.fetchall()]
+    scans = [detail for detail in details
+             if detail.startswith('SCAN ') and detail.split()[1] in aliases]
+    sorts = [detail for detail in details if 'TEMP B-TREE FOR ORDER BY' in detail]
+    return scans, sorts, details
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from iter_plan_nodes(child)
+
+
+def explain_postgresql(sql):
+    """
+    Full scans of watched tables in a PostgreSQL plan and its sort nodes.
+    Sequential scans and sorts are priced out first, so the small test
+    tables do not make them the cheaper choice: what remains has no index to
+    use. An index scan without an index condition reads the whole table too.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_sort = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(iter_plan_nodes(plan[0]['Plan']))
+    scans = [node for node in nodes if node.get('Relation Name') in WATCHED_TABLES and (
+        node['Node Type'] == 'Seq Scan' or
+        node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node)]
+    sorts = [node for node in nodes if node['Node Type'] in ('Sort', 'Incremental Sort')]
+    return scans, sorts, plan
+
+
+def explain(sql):
+    if connection.vendor == 'postgresql':
+        return explain_postgresql(sql)
+    return explain_sqlite(sql)
+
+
+class QueryPlanTests(TestCase):
+    """
+    Seeds a few users' documents and grievances, runs the listing and report
+    endpoints and EXPLAINs every query they send to the watched tables. A
+    query reading a whole watched table fails, as does one sorting rows an
+    index should return in order.
+
+    Not checked, as they read everything by design: the reports over all
+    documents (admin storage report and export without a category,
+    analytics, getUploadedFiles and the unscoped admin list_document). Report
+    jobs run the queries of the exports they queue, in a worker process.
+
+    Runs against SQLite by default and PostgreSQL when DB_NAME is set:
+    python manage.py test myapp.tests --settings=myproject.settings_test
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(f'user{number}@example.com', f'user{number}', 'Test', 'User',
+                                     f'900000000{number}', 'profile.png', password='password')
+            for number in range(4)
+        ]
+        cls.admin = User.objects.create_user('admin@example.com', 'admin', 'Test', 'Admin', '9100000000',
+                                             'profile.png', password='password', is_admin=True)
+        documents = []
+        grievances = []
+        for user in cls.users:
+            for dep_number in range(2):
+                department = Department.objects.create(dep_name=f'Department {dep_number}', user=user)
+                for cat_number in range(3):
+                    category = Category.objects.create(cat_name=f'Category {cat_number}', dep=department)
+                    for sub_cat_number in range(3):
+                        sub_category = SubCategory.objects.create(sub_cat_name=f'Sub {sub_cat_number}', cat=category)
+                        for number in range(40):
+                            extension, file_kind = FILE_TYPES[number % len(FILE_TYPES)]
+                            documents.append(Document(
+                                user=user, cat=category, sub_cat=sub_category,
+                                name=f'report {len(documents)}.{extension}', doc=f'blobs/{len(documents)}.{extension}',
+                                doc_type=extension, extension=extension, file_kind=file_kind,
+                                size=(len(documents) * 7919) % 100000,
+                            ))
+            for number in range(50):
+                grievances.append(Grievance(user=user, gk_id=f'G{len(grievances) + 1:04}', username=user.username,
+                                            title=f'Grievance {number}', description='Description'))
+        # Bulk inserted, no files to store and no signals to run
+        Document.objects.bulk_create(documents)
+        Grievance.objects.bulk_create(grievances)
+        # Searches must find documents, or their pages are never read
+        rebuild_search_index()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.user = cls.users[0]
+        cls.category = Category.objects.filter(dep__user=cls.user).first()
+        cls.sub_category = SubCategory.objects.filter(cat=cls.category).first()
+
+    def assert_queries_use_indexes(self, client, method, url, data, sorted_by_index):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data, format='json' if method == 'post' else None)
+            if response.streaming:
+                # Exports and archives query while they stream
+                b''.join(response.streaming_content)
+                response.close()
+        self.assertEqual(response.status_code, 200, getattr(response, 'data', None))
+
+        checked = 0
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not any(f'"{table}"' in sql for table in WATCHED_TABLES):
+                continue
+            checked += 1
+            scans, sorts, plan = explain(sql)
+            self.assertFalse(scans, f'Full table scan in\n{sql}\n{plan}')
+            if sorted_by_index and 'ORDER BY' in sql:
+                self.assertFalse(sorts, f'Sort outside an index in\n{sql}\n{plan}')
+        self.assertTrue(checked, f'No query on {", ".join(WATCHED_TABLES)} from {url}')
+
+    def test_user_document_listing(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('list_documents')
+        cases = [
+            ({'sort_by': 'name'}, True),
+            ({'sort_by': 'name', 'sort_order': 'desc', 'page_no': 3}, True),
+            ({'sort_by': 'size'}, True),
+            ({'sort_by': 'doc_type', 'sort_order': 'desc'}, True),
+            ({'sort_by': 'name', 'pagination': 'cursor'}, True),
+            ({'sort_by': 'size', 'count': 'none'}, True),
+            ({'sort_by': 'category'}, False),
+            ({'search_query': 'report'}, False),
+            ({'search_query': 'report', 'sort_by': 'relevance'}, False),
+            ({'search_query': 'report', 'pagination': 'cursor'}, False),
+        ]
+        for params, sorted_by_index in cases:
+            with self.subTest(**params):
+                data = {'no_of_entries': 10, 'include_content': False, **params}
+                self.assert_queries_use_indexes(client, 'post', url, data, sorted_by_index)
+
+    def test_admin_document_listing(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse('get_all_documents')
+        cases = [
+            ({'sub_cat_id': self.sub_category.pk, 'file_type': 'PDF', 'sort_by': 'last_modified'}, True),
+            ({'cat_id': self.category.pk, 'file_type': 'PDF', 'sort_by': 'last_modified', 'sort_order': 'desc'}, True),
+            ({'sub_cat_id': self.sub_category.pk}, False),
+            ({'cat_id': self.category.pk, 'sort_by': 'name'}, False),
+            ({'sub_cat_id': self.sub_category.pk, 'file_type': 'PDF', 'sort_by': 'last_modified',
+              'pagination': 'cursor'}, True),
+            ({'cat_id': self.category.pk, 'search_query': 'report', 'sort_by': 'relevance'}, False),
+            ({'sub_cat_id': self.sub_category.pk, 'search_query': 'report', 'pagination': 'cursor'}, False),
+        ]
+        for params, sorted_by_index in cases:
+            with self.subTest(**params):
+                data = {'no_of_entries': 10, 'include_content': False, **params}
+                self.assert_queries_use_indexes(client, 'post', url, data, sorted_by_index)
+
+    def test_storage_reports(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Both reports share a URL name
+        self.assert_queries_use_indexes(client, 'post', '/myapp/api/user/getDepartmentFileStorageReport/',
+                                        {'no_of_entries': 10}, False)
+
+        client.force_authenticate(self.admin)
+        self.assert_queries_use_indexes(client, 'post', '/myapp/api/admin/getDepartmentFileStorageReport/',
+                                        {'no_of_entries': 10, 'cat_id': self.category.pk, 'file_type': 'pdf'}, False)
+
+    def test_document_facets(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse('get_document_facets')
+        for params in [{}, {'cat_id': self.category.pk, 'facets': 'file_kind,sub_category,month',
+                            'search_query': 'report', 'start': '2020-01-01'}]:
+            with self.subTest(**params):
+                self.assert_queries_use_indexes(client, 'get', url, params, False)
+
+        client.force_authenticate(self.admin)
+        url = reverse('get_all_document_facets')
+        for params in [{'cat_id': self.category.pk},
+                       {'sub_cat_id': self.sub_category.pk, 'facets': 'uploader,month', 'search_query': 'report'}]:
+            with self.subTest(**params):
+                self.assert_queries_use_indexes(client, 'get', url, params, False)
+
+    def test_uploaded_files_tree(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse('get_uploaded_files_tree')
+        department = self.category.dep
+        cases = [
+            {'depth': 4, 'page_size': 2},
+            {'node': f'dep-{department.pk}', 'depth': 4},
+            {'node': f'cat-{self.category.pk}', 'expand': f'cat-{self.category.pk}-pdf'},
+            {'node': f'cat-{self.category.pk}-pdf', 'page_no': 2, 'page_size': 5},
+        ]
+        for params in cases:
+            with self.subTest(**params):
+                self.assert_queries_use_indexes(client, 'get', url, params, False)
+
+    def test_storage_growth(self):
+        # Read from the daily rollup alone, whatever the filters
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for params in [{}, {'dep_id': self.category.dep_id, 'group_by': 'file_kind', 'granularity': 'month'}]:
+            with self.subTest(**params), CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('get_storage_growth'), params)
+                self.assertEqual(response.status_code, 200, response.data)
+                self.assertFalse([query['sql'] for query in queries.captured_queries
+                                  if any(f'"{table}"' in query['sql'] for table in WATCHED_TABLES)])
+
+    def test_exports(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Both exports share a URL name
+        for export_format in ['xlsx', 'csv']:
+            with self.subTest(export_format=export_format):
+                self.assert_queries_use_indexes(client, 'post', '/myapp/api/user/downloadExcelReport/',
+                                                {'export_format': export_format}, False)
+
+        client.force_authenticate(self.admin)
+        self.assert_queries_use_indexes(client, 'post', '/myapp/api/admin/downloadExcelReport/',
+                                        {'export_format': 'ndjson', 'cat_id': self.category.pk}, False)
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            for document in Document.objects.filter(cat=self.category):
+                os.makedirs(os.path.dirname(document.doc.path), exist_ok=True)
+                with open(document.doc.path, 'wb') as file:
+                    file.write(b'content')
+            for params in [{'sub_cat_id': self.sub_category.pk}, {'cat_id': self.category.pk, 'file_type': 'PDF'}]:
+                with self.subTest(**params):
+                    self.assert_queries_use_indexes(client, 'post', reverse('download_all_documents'), params, False)
+
+    def test_grievance_listing(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_queries_use_indexes(client, 'get', reverse('view_grievance'), {}, False)
+
+    def test_unindexed_query_is_detected(self):
+        # Guards the plan checks themselves against a database that words its plans differently
+        scans, _, plan = explain('SELECT "id" FROM "myapp_document" WHERE "doc" LIKE \'%.pdf\'')
+        self.assertTrue(scans, plan)
+
+
+class MediaTestCase(TestCase):
+    """
+    Stores files in a temporary MEDIA_ROOT, for one user with a department,
+    a category and a sub category to upload into.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('blobs@example.com', 'blobs', 'Test', 'User', '9200000000',
+                                            'profile.png', password='password')
+        cls.department = Department.objects.create(dep_name='Department', user=cls.user)
+        cls.category = Category.objects.create(cat_name='Category', dep=cls.department)
+        cls.sub_category = SubCategory.objects.create(sub_cat_name='Sub', cat=cls.category)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_document(self, content, name='notes.txt', doc_type=None):
+        # Plain text by default, no previews or text extraction are queued
+        return Document.objects.create(user=self.user, cat=self.category, sub_cat=self.sub_category, name=name,
+                                       doc=ContentFile(content, name=name),
+                                       doc_type=doc_type or os.path.splitext(name)[1][1:], size=len(content))
+
+
+class BlobReferenceTests(MediaTestCase):
+    """
+    Reference counting of the shared blobs behind documents with identical
+    content, see retain_blob and release_blob in myapp.signals.
+    """
+
+    def assert_blob(self, document, ref_count):
+        blob = Blob.objects.filter(sha256=document.sha256).first()
+        if ref_count:
+            self.assertEqual(blob.ref_count, ref_count)
+            self.assertTrue(document.doc.storage.exists(blob.name))
+        else:
+            self.assertIsNone(blob)
+            self.assertFalse(document.doc.storage.exists(document.doc.name))
+
+    def test_upload_replace_and_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create_document(b'shared content')
+            second = self.create_document(b'shared content')
+        self.assertEqual(first.doc.name, second.doc.name)
+        self.assert_blob(first, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.doc = ContentFile(b'new content', name='notes.txt')
+            second.save()
+        self.assert_blob(first, 1)
+        self.assert_blob(second, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assert_blob(first, 0)
+        self.assert_blob(second, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assert_blob(second, 0)
+
+    def test_upload_during_release_keeps_the_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.create_document(b'released content')
+        with self.captureOnCommitCallbacks() as callbacks:
+            document.delete()
+        # Same content uploaded after the release committed, before its file was deleted
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = self.create_document(b'released content')
+        for callback in callbacks:
+            callback()
+        self.assert_blob(upload, 1)
+
+
+PNG_CONTENT = b'\x89PNG\r\n\x1a\n'
+
+
+class BulkUploadTests(MediaTestCase):
+    """
+    Documents created by bulk uploads of several files and of a zip archive
+    get ids, search index rows and blob references like single uploads.
+    """
+
+    def assert_uploaded(self, response, names):
+        self.assertEqual(response.status_code, 201, response.data)
+        ids = [entry['id'] for entry in response.data['files']]
+        self.assertEqual([entry['status'] for entry in response.data['files']], ['uploaded'] * len(names))
+        documents = Document.objects.in_bulk(ids)
+        self.assertEqual([documents[document_id].name for document_id in ids], names)
+        self.assertEqual(DocumentSearchIndex.objects.filter(document_id__in=ids).count(), len(names))
+        # The first two files have the same content
+        first, second, third = [documents[document_id] for document_id in ids]
+        self.assertEqual(first.doc.name, second.doc.name)
+        self.assertEqual(Blob.objects.get(sha256=first.sha256).ref_count, 2)
+        self.assertEqual(Blob.objects.get(sha256=third.sha256).ref_count, 1)
+
+    def test_files(self):
+        files = [SimpleUploadedFile(name, content, content_type='image/png') for name, content in
+                 [('a.png', PNG_CONTENT + b'same'), ('b.png', PNG_CONTENT + b'same'), ('c.png', PNG_CONTENT + b'c')]]
+        response = self.client.post(reverse('bulk_upload_documents'), {
+            'category': self.category.pk, 'sub_category': self.sub_category.pk, 'files': files}, format='multipart')
+        self.assert_uploaded(response, ['a.png', 'b.png', 'c.png'])
+
+    def test_zip_archive(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('scans/a.png', PNG_CONTENT + b'same')
+            zip_file.writestr('scans/b.png', PNG_CONTENT + b'same')
+            zip_file.writestr('c.png', PNG_CONTENT + b'c')
+            zip_file.writestr('__MACOSX/._a.png', b'metadata')
+        upload = SimpleUploadedFile('scans.zip', archive.getvalue(), content_type='application/zip')
+        response = self.client.post(reverse('bulk_upload_documents'), {
+            'category': self.category.pk, 'sub_category': self.sub_category.pk, 'archive': upload}, format='multipart')
+        self.assert_uploaded(response, ['a.png', 'b.png', 'c.png'])
+
+
+class StatisticsRollupTests(MediaTestCase):
+    """
+    The statistics rollups kept up to date by myapp.signals must equal a
+    rebuild from the documents after every kind of change.
+    """
+
+    def get_rows(self, model):
+        # Rows a decrement left at zero are equal to missing ones
+        fields = STAT_KEY_FIELDS[model] + ['file_count', 'total_size']
+        return set(model.objects.exclude(file_count=0, total_size=0).values_list(*fields))
+
+    def assert_rollup(self, model, rebuild):
+        rows = self.get_rows(model)
+        rebuild()
+        self.assertEqual(rows, self.get_rows(model))
+        self.assertTrue(rows)
+
+    def change_documents(self, assert_rollup):
+        other_sub_category = SubCategory.objects.create(sub_cat_name='Other', cat=self.category)
+        notes = self.create_document(b'notes')
+        image = self.create_document(PNG_CONTENT + b'image', 'scan.png', 'image')
+        self.create_document(b'more notes', 'more.txt')
+        assert_rollup()
+
+        notes.doc = ContentFile(b'longer notes', name='notes.txt')
+        notes.size = 12
+        notes.save()
+        assert_rollup()
+
+        image.sub_cat = other_sub_category
+        image.save()
+        assert_rollup()
+
+        # Moving a category moves its statistics to the other department
+        self.category.dep = Department.objects.create(dep_name='Other department', user=self.user)
+        self.category.save()
+        assert_rollup()
+
+        notes.delete()
+        assert_rollup()
+
+        other_sub_category.delete()
+        assert_rollup()
+
+    def test_storage_stats(self):
+        self.change_documents(lambda: self.assert_rollup(DocumentStorageStat, rebuild_storage_stats))
+
+    def test_daily_stats(self):
+        self.change_documents(lambda: self.assert_rollup(DocumentDailyStat, rebuild_daily_stats))
+
+    def test_storage_growth(self):
+        for day, content, name in [('2023-12-31', b'old', 'old.txt'), ('2024-01-03', b'%PDF-a', 'a.pdf'),
+                                   ('2024-01-20', PNG_CONTENT, 'scan.png'), ('2024-02-05', b'%PDF-bb', 'b.pdf')]:
+            document = self.create_document(content, name)
+            Document.objects.filter(pk=document.pk).update(upload_time=f'{day}T12:00:00Z')
+        rebuild_daily_stats()
+        admin = User.objects.create_user('growth@example.com', 'growth', 'Test', 'Admin', '9200000008',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        url = reverse('get_storage_growth')
+
+        response = self.client.get(url, {'start': '2024-01-01', 'end': '2024-02-29', 'granularity': 'month'})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([(point['period'], point['file_count'], point['total_size'], point['cumulative_count'],
+                           point['cumulative_size']) for point in response.data['data']],
+                         [(date(2024, 1, 1), 2, 14, 3, 17), (date(2024, 2, 1), 1, 7, 4, 24)])
+
+        response = self.client.get(url, {'start': '2024-01-01', 'end': '2024-02-29', 'group_by': 'file_kind'})
+        self.assertEqual([(point['period'], point['file_kind'], point['cumulative_count'])
+                          for point in response.data['data']],
+                         [(date(2024, 1, 3), 'pdf', 1), (date(2024, 1, 20), 'image', 1), (date(2024, 2, 5), 'pdf', 2)])
+
+        for params in [{'granularity': 'year'}, {'group_by': 'user'}, {'start': '2024-02-01', 'end': '2024-01-01'},
+                       {'start': '01/02/2024'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class DashboardCacheTests(MediaTestCase):
+    """
+    Dashboard counts are cached per scope until a committed change
+    invalidates them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        get_dashboard_cache().clear()
+        self.admin = User.objects.create_user('dashboard@example.com', 'dashboard', 'Test', 'Admin', '9200000009',
+                                              'profile.png', password='password', is_admin=True)
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+    def get_file_counts(self):
+        user_counts = self.client.get(reverse('get_counts_document')).data['data']['no_of_file']
+        admin_counts = self.admin_client.get(reverse('admin_dashboard_counts')).data['data']['no_of_file']
+        return user_counts, admin_counts
+
+    def test_invalidation(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.create_document(b'notes')
+        self.assertEqual(self.get_file_counts(), ('1', '1'))
+        # Served from the cache, only the last activity of the users is written
+        with CaptureQueriesContext(connection) as queries:
+            self.get_file_counts()
+        self.assertEqual([query['sql'] for query in queries if not query['sql'].startswith('UPDATE "myapp_user"')], [])
+
+        # Until the change commits the cached counts are served
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.create_document(b'more notes', 'more.txt')
+        self.assertEqual(self.get_file_counts(), ('1', '1'))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.get_file_counts(), ('2', '2'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertEqual(self.get_file_counts(), ('1', '1'))
+
+    def test_user_scope(self):
+        self.create_document(b'notes')
+        self.assertEqual(self.get_file_counts(), ('1', '1'))
+        # Every user has their own cached counts
+        other_user = User.objects.create_user('counts@example.com', 'counts', 'Test', 'User', '9200000010',
+                                              'profile.png', password='password')
+        self.client.force_authenticate(other_user)
+        self.assertEqual(self.client.get(reverse('get_counts_document')).data['data']['no_of_file'], '0')
+
+
+class FileKindTests(MediaTestCase):
+    """
+    The extension and file kind columns follow the stored file, and the
+    admin file type filter uses them.
+    """
+
+    def test_file_kind(self):
+        pdf = self.create_document(b'%PDF-1.4', 'Report.PDF', 'pdf')
+        sheet = self.create_document(b'PK\x03\x04', 'budget.xlsx', 'excel')
+        notes = self.create_document(b'notes')
+        self.assertEqual(
+            [(document.extension, document.file_kind) for document in [pdf, sheet, notes]],
+            [('pdf', 'pdf'), ('xlsx', 'excel'), ('txt', 'other')])
+
+        sheet.doc = ContentFile(PNG_CONTENT, name='budget.png')
+        sheet.save()
+        sheet.refresh_from_db()
+        self.assertEqual((sheet.extension, sheet.file_kind), ('png', 'image'))
+
+        admin = User.objects.create_user('kindadmin@example.com', 'kindadmin', 'Test', 'Admin', '9200000003',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        for file_type, expected in [('PDF', [pdf.pk]), ('IMAGES', [sheet.pk]), ('EXCEL', []), ('AUDIO', [])]:
+            with self.subTest(file_type=file_type):
+                response = self.client.post(reverse('get_all_documents'), {
+                    'sub_cat_id': self.sub_category.pk, 'file_type': file_type, 'no_of_entries': 10,
+                    'fields': 'id'}, format='json')
+                self.assertEqual([row['id'] for row in response.data['data']], expected)
+
+
+class UploadedFilesTreeTests(MediaTestCase):
+    """
+    The lazy department > category > file type > file tree, its totals from
+    the storage rollup and paging through the children of one node.
+    """
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user('treeadmin@example.com', 'treeadmin', 'Test', 'Admin', '9200000004',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        self.pdfs = [self.create_document(b'%PDF-' + name.encode(), name, 'pdf')
+                     for name in ['c.pdf', 'a.pdf', 'b.pdf']]
+        self.image = self.create_document(PNG_CONTENT, 'scan.png', 'png')
+
+    def get_tree(self, **params):
+        response = self.client.get(reverse('get_uploaded_files_tree'), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['data']
+
+    def test_root(self):
+        total_size = sum(document.size for document in self.pdfs) + self.image.size
+        department = self.get_tree(depth=1)['children'][0]
+        self.assertEqual((department['id'], department['total_files'], department['total_size']),
+                         (f'dep-{self.department.pk}', 4, total_size))
+        self.assertNotIn('children', department)
+
+        category = self.get_tree()['children'][0]['children'][0]
+        self.assertEqual((category['id'], category['total_files']), (f'cat-{self.category.pk}', 4))
+        self.assertTrue(all('children' not in kind for kind in category['children']))
+        category = self.get_tree(depth=4)['children'][0]['children'][0]
+        kinds = {kind['id']: kind for kind in category['children']}
+        pdfs = kinds[f'cat-{self.category.pk}-pdf']
+        self.assertEqual([file['file_name'] for file in pdfs['children']], ['a.pdf', 'b.pdf', 'c.pdf'])
+        self.assertEqual(kinds[f'cat-{self.category.pk}-image']['total_files'], 1)
+        # Files are listed with links, never with their content
+        self.assertNotIn('file', pdfs['children'][0])
+        self.assertIn('content_url', pdfs['children'][0])
+
+    def test_node_pages(self):
+        node = f'cat-{self.category.pk}-pdf'
+        first_page = self.get_tree(node=node, page_size=2)
+        self.assertEqual([file['file_name'] for file in first_page['children']], ['a.pdf', 'b.pdf'])
+        self.assertEqual((first_page['children_total'], first_page['has_more']), (3, True))
+        last_page = self.get_tree(node=node, page_size=2, page_no=2)
+        self.assertEqual([file['file_name'] for file in last_page['children']], ['c.pdf'])
+        self.assertFalse(last_page['has_more'])
+
+        department = self.get_tree(node=f'dep-{self.department.pk}', depth=1)
+        self.assertEqual([category['id'] for category in department['children']], [f'cat-{self.category.pk}'])
+        self.assertNotIn('children', department['children'][0])
+        department = self.get_tree(node=f'dep-{self.department.pk}', depth=1, expand=f'cat-{self.category.pk}')
+        self.assertEqual(len(department['children'][0]['children']), 5)
+
+    def test_invalid_nodes(self):
+        url = reverse('get_uploaded_files_tree')
+        for params, status in [({'node': 'sub-1'}, 400), ({'node': f'cat-{self.category.pk}-audio'}, 400),
+                               ({'depth': 'all'}, 400), ({'node': 'dep-0'}, 404), ({'node': 'cat-x'}, 404)]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, status)
+
+
+class StorageReportTests(MediaTestCase):
+    """
+    Storage reports grouped by department, category and file type, sorted
+    on the raw totals and paginated in the database.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_category = Category.objects.create(cat_name='Other', dep=cls.department)
+        other_user = User.objects.create_user('reports@example.com', 'reports', 'Test', 'User', '9200000005',
+                                              'profile.png', password='password')
+        other_department = Department.objects.create(dep_name='Elsewhere', user=other_user)
+        cls.foreign_category = Category.objects.create(cat_name='Foreign', dep=other_department)
+        cls.admin = User.objects.create_user('reportadmin@example.com', 'reportadmin', 'Test', 'Admin', '9200000006',
+                                             'profile.png', password='password', is_admin=True)
+
+    def setUp(self):
+        super().setUp()
+        self.create_document(b'a' * 3000, 'first.pdf')
+        self.create_document(b'b' * 3000, 'second.pdf')
+        self.create_document(b'notes')
+        image = self.create_document(PNG_CONTENT * 200, 'scan.png')
+        image.cat = self.other_category
+        image.save()
+        foreign = self.create_document(b'c' * 5000, 'foreign.pdf')
+        foreign.cat = self.foreign_category
+        foreign.save()
+
+    def get_report(self, url, **data):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response
+
+    def test_report(self):
+        url = '/myapp/api/user/getDepartmentFileStorageReport/'
+        response = self.get_report(url, sort_by='total_size', sort_order='desc')
+        self.assertEqual(response.data['documents'], [
+            {'dep_name': 'Department', 'cat_name': 'Category', 'file_type': 'pdf', 'total_size': '6 KB',
+             'total_count': 2},
+            {'dep_name': 'Department', 'cat_name': 'Other', 'file_type': 'png', 'total_size': '2 KB',
+             'total_count': 1},
+            {'dep_name': 'Department', 'cat_name': 'Category', 'file_type': 'txt', 'total_size': '5 KB',
+             'total_count': 1},
+        ])
+        self.assertEqual(response.data['total_entries'], 3)
+
+        rows = self.get_report(url, sort_by='total_count', sort_order='desc', no_of_entries=2,
+                               page_no=2).data['documents']
+        self.assertEqual([(row['cat_name'], row['file_type']) for row in rows], [('Other', 'png')])
+        rows = self.get_report(url, search_query='other').data['documents']
+        self.assertEqual([(row['cat_name'], row['file_type']) for row in rows], [('Other', 'png')])
+
+        self.client.force_authenticate(self.admin)
+        url = '/myapp/api/admin/getDepartmentFileStorageReport/'
+        rows = self.get_report(url, sort_by='total_size', sort_order='desc').data['documents']
+        self.assertEqual([(row['dep_name'], row['file_type']) for row in rows], [
+            ('Department', 'pdf'), ('Elsewhere', 'pdf'), ('Department', 'png'), ('Department', 'txt')])
+        rows = self.get_report(url, cat_id=self.category.pk, sort_by='total_size').data['documents']
+        self.assertEqual([row['file_type'] for row in rows], ['txt', 'pdf'])
+
+    def test_exports(self):
+        url = '/myapp/api/user/downloadExcelReport/'
+        data = {'sort_by': 'total_size', 'sort_order': 'desc'}
+        expected = [['Department', 'Category', 'pdf', '6 KB', 2], ['Department', 'Other', 'png', '2 KB', 1],
+                    ['Department', 'Category', 'txt', '5 KB', 1]]
+        headers = ['Department Name', 'Category Name', 'File Type', 'Total Size', 'Total Count']
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        book = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual([list(row) for row in book.active.iter_rows(values_only=True)], [headers, *expected])
+
+        response = self.client.post(url, {**data, 'export_format': 'csv'}, format='json')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="department_file_storage_report.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rows, [headers, *[[str(value) for value in row] for row in expected]])
+
+        response = self.client.post(url, {**data, 'export_format': 'ndjson'}, format='json')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual([list(json.loads(line).values()) for line in lines], expected)
+
+        response = self.client.post(url, {'export_format': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReportJobTests(MediaTestCase):
+    """
+    Report exports queued as jobs, polled and downloaded once done. Jobs are
+    run in the test process instead of the worker pool.
+    """
+
+    def create_job(self, **data):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post('/myapp/api/user/reportJobs/', {'export_format': 'csv', **data},
+                                        format='json')
+        self.assertEqual(response.status_code, 202, response.data)
+        return response.data['data'], callbacks
+
+    def test_report_job(self):
+        self.create_document(b'a' * 3000, 'report.pdf')
+        job, callbacks = self.create_job(sort_order='DESC')
+        self.assertEqual((job['status'], job['filters']), ('pending', {'sort_by': 'total_size', 'sort_order': 'desc'}))
+        self.assertEqual(len(callbacks), 1)
+        job_url = reverse('get_report_job', args=[job['job_id']])
+        download_url = reverse('download_report_job', args=[job['job_id']])
+        self.assertEqual(self.client.get(download_url).status_code, 409)
+
+        run_report_job(job['job_id'], convert_size)
+        self.assertEqual(self.client.get(job_url).data['data']['status'], 'done')
+        response = self.client.get(download_url)
+        self.assertIn('filename="department_file_storage_report.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        response.close()
+        self.assertEqual(rows[1:], [['Department', 'Category', 'pdf', '3 KB', '1']])
+
+        # The same report of unchanged data is served from the earlier artifact
+        repeated, callbacks = self.create_job(sort_order='desc')
+        self.assertEqual((repeated['status'], callbacks), ('done', []))
+        self.create_document(b'notes')
+        changed, callbacks = self.create_job(sort_order='desc')
+        self.assertEqual(changed['status'], 'pending')
+
+        other_user = User.objects.create_user('jobs@example.com', 'jobs', 'Test', 'User', '9200000007',
+                                              'profile.png', password='password')
+        self.client.force_authenticate(other_user)
+        self.assertEqual(self.client.get(job_url).status_code, 404)
+        self.assertEqual(self.client.get(download_url).status_code, 404)
+
+    def test_lost_job_times_out(self):
+        job, _ = self.create_job(export_format='ndjson')
+        ReportJob.objects.filter(pk=job['job_id']).update(created_on=timezone.now() - REPORT_JOB_TIMEOUT)
+        response = self.client.get(reverse('get_report_job', args=[job['job_id']]))
+        self.assertEqual((response.data['data']['status'], response.data['data']['error']),
+                         ('failed', 'Report job timed out'))
+        response = self.client.post('/myapp/api/user/reportJobs/', {'export_format': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DocumentFacetTests(MediaTestCase):
+    """
+    Facet counts and bytes per file kind and per value of the grouping
+    facets, for the filtered documents.
+    """
+
+    def setUp(self):
+        super().setUp()
+        other_category = Category.objects.create(cat_name='Other', dep=self.department)
+        self.create_document(b'%PDF-a', 'a.pdf')
+        old = self.create_document(b'%PDF-bb', 'b.pdf')
+        Document.objects.filter(pk=old.pk).update(upload_time='2024-01-15T12:00:00Z')
+        self.create_document(b'notes')
+        self.image = self.create_document(PNG_CONTENT, 'scan.png')
+        self.image.cat = other_category
+        self.image.save()
+        other_user = User.objects.create_user('facets@example.com', 'facets', 'Test', 'User', '9200000011',
+                                              'profile.png', password='password')
+        Document.objects.create(user=other_user, cat=self.category, sub_cat=self.sub_category, name='foreign.pdf',
+                                doc=ContentFile(b'%PDF-foreign', name='foreign.pdf'), doc_type='pdf', size=12)
+
+    def get_facets(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['data']
+
+    def test_facets(self):
+        url = reverse('get_document_facets')
+        facets = self.get_facets(url)
+        self.assertEqual(facets['total'], {'count': 4, 'size': 26})
+        self.assertEqual(facets['file_kind']['pdf'], {'count': 2, 'size': 13})
+        self.assertEqual((facets['file_kind']['image']['count'], facets['file_kind']['other']['count']), (1, 1))
+        self.assertEqual([(bucket['name'], bucket['count'], bucket['file_kind']['pdf'])
+                          for bucket in facets['category']], [('Category', 3, 2), ('Other', 1, 0)])
+        self.assertEqual([(bucket['name'], bucket['count']) for bucket in facets['uploader']], [('blobs', 4)])
+        self.assertEqual([bucket['count'] for bucket in facets['month']], [1, 3])
+        self.assertEqual(facets['month'][0]['id'], date(2024, 1, 1))
+
+        facets = self.get_facets(url, facets='category', file_kind='pdf', start='2024-02-01')
+        self.assertEqual(list(facets), ['total', 'category'])
+        self.assertEqual(facets['total'], {'count': 1, 'size': 6})
+
+        for params in [{'facets': 'file_kind,colour'}, {'start': '15-01-2024'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_admin_facets(self):
+        admin = User.objects.create_user('facetadmin@example.com', 'facetadmin', 'Test', 'Admin', '9200000012',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        url = reverse('get_all_document_facets')
+        facets = self.get_facets(url, facets='uploader,department')
+        self.assertEqual(facets['total']['count'], 5)
+        self.assertEqual([(bucket['name'], bucket['count']) for bucket in facets['uploader']],
+                         [('blobs', 4), ('facets', 1)])
+        self.assertEqual([(bucket['id'], bucket['count']) for bucket in facets['department']],
+                         [(self.department.pk, 5)])
+        facets = self.get_facets(url, facets='file_kind', cat_id=self.image.cat_id)
+        self.assertEqual((facets['total']['count'], facets['file_kind']['image']['count']), (1, 1))
+
+
+class DocumentAnalyticsTests(MediaTestCase):
+    """
+    The in-memory document snapshot follows additions and deletions
+    incrementally and reloads after changes to existing documents.
+    """
+
+    def get_snapshot(self, snapshot):
+        frame = snapshot.get_frame()
+        return sorted(zip(frame['id'].tolist(), frame['size'].tolist()))
+
+    def test_snapshot(self):
+        snapshot = DocumentSnapshot()
+        first = self.create_document(b'a' * 10)
+        second = self.create_document(b'b' * 20)
+        self.assertEqual(self.get_snapshot(snapshot), [(first.pk, 10), (second.pk, 20)])
+
+        with mock.patch.object(DocumentSnapshot, 'apply_changes', side_effect=DocumentSnapshot.apply_changes) as apply:
+            third = self.create_document(b'c' * 30)
+            first_id = first.pk
+            first.delete()
+            self.assertEqual(self.get_snapshot(snapshot), [(second.pk, 20), (third.pk, 30)])
+            # An upload committed after a document with a higher id was already loaded
+            late = Document.objects.create(id=first_id, user=self.user, cat=self.category, sub_cat=self.sub_category,
+                                           name='late.txt', doc=ContentFile(b'd' * 40, name='late.txt'), size=40)
+            self.assertEqual(self.get_snapshot(snapshot), [(late.pk, 40), (second.pk, 20), (third.pk, 30)])
+            self.assertEqual(apply.call_count, 2)
+            # Unchanged data is neither read nor applied again
+            with self.assertNumQueries(1):
+                self.get_snapshot(snapshot)
+
+            second.doc = ContentFile(b'e' * 50, name='notes.txt')
+            second.size = 50
+            second.save()
+            self.assertEqual(self.get_snapshot(snapshot), [(late.pk, 40), (second.pk, 50), (third.pk, 30)])
+            self.assertEqual(apply.call_count, 2)
+
+    def test_analytics(self):
+        admin = User.objects.create_user('analytics@example.com', 'analytics', 'Test', 'Admin', '9200000013',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        url = reverse('get_document_analytics')
+        for content, name in [(b'a' * 10, 'a.pdf'), (b'b' * 30, 'b.pdf'), (PNG_CONTENT, 'scan.png')]:
+            self.create_document(content, name)
+
+        with mock.patch('myapp.view.admin.view.snapshot', DocumentSnapshot()):
+            response = self.client.get(url, {'report': 'top_uploaders'})
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(response.data['data'], [{'group': self.user.pk, 'count': 3, 'total_size': 48,
+                                                      'name': 'blobs'}])
+
+            rows = self.client.get(url, {'report': 'size_distribution', 'group_by': 'file_kind'}).data['data']
+            self.assertEqual([(row['group'], row['count'], row['max_size']) for row in rows],
+                             [('pdf', 2, 30), ('image', 1, 8)])
+            rows = self.client.get(url, {'report': 'size_percentiles', 'group_by': 'category'}).data['data']
+            self.assertEqual([(row['name'], row['count'], row['p50']) for row in rows], [('Category', 3, 10.0)])
+
+            response = self.client.get(url, {'report': 'size_percentiles', 'end': '2000-01-01'})
+            self.assertEqual((response.data['document_count'], response.data['data'][0]['p50']), (0, 0.0))
+
+            for params in [{'report': 'median'}, {'report': 'top_uploaders', 'group_by': 'month'},
+                           {'report': 'top_uploaders', 'limit': 0}, {'report': 'top_uploaders', 'start': 'today'}]:
+                with self.subTest(params=params):
+                    self.assertEqual(self.client.get(url, params).status_code, 400)
+
+
+class DocumentSearchTests(MediaTestCase):
+    """
+    Full-text search over names, categories, uploaders and extracted
+    content, with prefix matching, relevance order and highlights.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.budget = self.create_document(b'figures', 'Quarterly budget.txt')
+        self.minutes = self.create_document(make_pdf(b'BT (Hello quarterly ) Tj ET'), 'minutes.pdf')
+        self.create_document(b'agenda', 'agenda <draft>.txt')
+        extract_document_text(self.minutes.pk)
+
+    def search(self, search_query, **data):
+        response = self.client.post(reverse('list_documents'), {'search_query': search_query, 'no_of_entries': 10,
+                                                                'fields': 'id,highlight,snippet', **data},
+                                    format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['documents']
+
+    def test_search(self):
+        rows = self.search('quart')
+        # Name matches rank above content matches
+        self.assertEqual([row['id'] for row in rows], [self.budget.pk, self.minutes.pk])
+        self.assertEqual(rows[0]['highlight'], '<mark>Quart</mark>erly budget.txt')
+        self.assertIsNone(rows[0]['snippet'])
+        self.assertEqual(rows[1]['snippet'], 'Hello <mark>quarterly</mark>')
+
+        self.assertEqual([row['id'] for row in self.search('QUART budg')], [self.budget.pk])
+        self.assertEqual(len(self.search('categ')), 3)
+        self.assertEqual(len(self.search('blobs')), 3)
+        self.assertEqual(self.search('quarterly OR agenda"*'), [])
+        self.assertEqual(self.search('draft')[0]['highlight'], 'agenda &lt;<mark>draft</mark>&gt;.txt')
+
+        # Renaming the category updates the index of its documents
+        self.category.cat_name = 'Finance'
+        self.category.save()
+        self.assertEqual(self.search('categ'), [])
+        self.assertEqual(len(self.search('fin')), 3)
+
+    def test_admin_search(self):
+        admin = User.objects.create_user('searchadmin@example.com', 'searchadmin', 'Test', 'Admin', '9200000014',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+        for search_query, expected in [('hello', [self.minutes.pk]), (str(self.budget.pk), [self.budget.pk])]:
+            with self.subTest(search_query=search_query):
+                response = self.client.post(reverse('get_all_documents'), {
+                    'sub_cat_id': self.sub_category.pk, 'search_query': search_query, 'no_of_entries': 10,
+                    'fields': 'id'}, format='json')
+                self.assertEqual([row['id'] for row in response.data['data']], expected)
+
+
+class UploadSessionTests(MediaTestCase):
+    """
+    Resumable uploads: a session, chunks sent in order with their checksums
+    and a finalize step checking the whole file.
+    """
+
+    content = PNG_CONTENT + b'resumable upload'
+
+    def start_session(self, checksum=None):
+        response = self.client.post(reverse('init_upload_session'), {
+            'category': self.category.pk, 'sub_category': self.sub_category.pk, 'fileType': 'image',
+            'name': 'scan', 'mimeType': 'image/png', 'total_size': len(self.content), 'chunk_size': 10,
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['data']['total_chunks'], 3)
+        return response.data['data']['session_id']
+
+    def send_chunk(self, session_id, chunk_no, checksum=None):
+        chunk = self.content[chunk_no * 10:(chunk_no + 1) * 10]
+        return self.client.put(reverse('upload_chunk', args=[session_id, chunk_no]), chunk,
+                               content_type='application/octet-stream',
+                               HTTP_X_CHUNK_CHECKSUM=checksum or hashlib.sha256(chunk).hexdigest())
+
+    def test_upload(self):
+        session_id = self.start_session()
+        self.assertEqual(self.send_chunk(session_id, 1).status_code, 409)
+        response = self.send_chunk(session_id, 0, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Chunk checksum mismatch')
+        state = self.client.get(reverse('get_upload_session', args=[session_id])).data['data']
+        self.assertEqual(state['next_chunk'], 0)
+
+        for chunk_no in [0, 0, 1, 2]:
+            # The repeated chunk is a retry of one already stored
+            response = self.send_chunk(session_id, chunk_no)
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['data']['received_size'], len(self.content))
+
+        finalize_url = reverse('finalize_upload_session', args=[session_id])
+        response = self.client.post(finalize_url, {}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        document = Document.objects.get(user=self.user)
+        self.assertEqual((document.name, document.size), ('scan.png', len(self.content)))
+        with document.doc.open() as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertEqual(self.client.post(finalize_url, {}, format='json').status_code, 409)
+
+    def test_file_checksum_mismatch(self):
+        session_id = self.start_session(checksum='0' * 64)
+        finalize_url = reverse('finalize_upload_session', args=[session_id])
+        self.assertEqual(self.client.post(finalize_url, {}, format='json').status_code, 400)
+        for chunk_no in range(3):
+            self.send_chunk(session_id, chunk_no)
+        response = self.client.post(finalize_url, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'File checksum mismatch, please upload again')
+        self.assertFalse(Document.objects.exists())
+        self.assertEqual(self.client.get(reverse('get_upload_session', args=[session_id])).status_code, 404)
+
+
+class UpdateDocumentTests(MediaTestCase):
+    """
+    Replacing a document's file with a multipart upload, validated by
+    ValidatingUploadHandler while it arrives.
+    """
+
+    def update(self, document, file_name, content):
+        return self.client.post(reverse('update_document'), {
+            'doc_id': document.pk, 'name': 'renamed', 'doc': SimpleUploadedFile(file_name, content)},
+            format='multipart')
+
+    def test_multipart_update(self):
+        document = self.create_document(PNG_CONTENT + b'old', 'scan.png', 'image')
+        response = self.update(document, 'new.png', PNG_CONTENT + b'new content')
+        self.assertEqual(response.status_code, 200, response.data)
+        document.refresh_from_db()
+        self.assertEqual((document.name, document.doc_type, document.size),
+                         ('renamed.png', 'image', len(PNG_CONTENT + b'new content')))
+        with document.doc.open() as file:
+            self.assertEqual(file.read(), PNG_CONTENT + b'new content')
+
+    def test_wrong_content_is_rejected(self):
+        document = self.create_document(PNG_CONTENT + b'old', 'scan.png', 'image')
+        response = self.update(document, 'new.png', b'%PDF-1.4 not an image')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'File content does not match its png extension')
+        document.refresh_from_db()
+        self.assertEqual(document.size, len(PNG_CONTENT + b'old'))
+
+    def test_oversize_file_is_rejected(self):
+        document = self.create_document(PNG_CONTENT + b'old', 'scan.png', 'image')
+        with mock.patch('myapp.utils.uploads.ValidatingUploadHandler.get_max_file_size', lambda handler: 100):
+            response = self.update(document, 'new.png', PNG_CONTENT + b'x' * 200)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['error'].startswith('file size must be less than'), response.data)
+        document.refresh_from_db()
+        self.assertEqual(document.name, 'scan.png')
+
+
+class DocumentContentTests(MediaTestCase):
+    """
+    Document listings send metadata and content URLs, the file content only
+    on request.
+    """
+
+    def test_listing_content_is_opt_in(self):
+        document = self.create_document(PNG_CONTENT + b'image', 'scan.png')
+        response = self.client.post(reverse('list_documents'), {'no_of_entries': 10}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        [row] = response.data['documents']
+        self.assertNotIn('doc', row)
+        self.assertIn(f'/department/download_document/{document.pk}/', row['content_url'])
+
+        response = self.client.post(reverse('list_documents'), {'no_of_entries': 10, 'include_content': True},
+                                    format='json')
+        [row] = json.loads(b''.join(response.streaming_content))['documents']
+        self.assertEqual(row['doc'], 'data:image/png;base64,' + base64.b64encode(PNG_CONTENT + b'image').decode())
+
+        response = self.client.post(reverse('list_documents'), {'no_of_entries': 10, 'fields': 'id,doc'}, format='json')
+        self.assertEqual(set(json.loads(b''.join(response.streaming_content))['documents'][0]), {'id', 'doc'})
+
+
+class PreviewTests(MediaTestCase):
+    """
+    Thumbnails and previews of image documents, rendered after the upload
+    commits and kept once per content like the blobs.
+    """
+
+    def create_image(self, name='photo.png', size=(2000, 1000)):
+        file = io.BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(file, format='PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_document(file.getvalue(), name, 'image')
+
+    def test_renditions(self):
+        document = self.create_image()
+        for size, max_edge in PREVIEW_SIZES.items():
+            with default_storage.open(preview_name(document.sha256, size)) as file, Image.open(file) as image:
+                self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (max_edge, max_edge // 2)))
+
+        url = reverse('document_preview', args=[document.pk, 'thumbnail'])
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(reverse('document_preview', args=[document.pk, 'poster'])).status_code, 400)
+
+        # Missing renditions are rendered on demand
+        default_storage.delete(preview_name(document.sha256, 'preview'))
+        response = self.client.get(reverse('document_preview', args=[document.pk, 'preview']))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(default_storage.exists(preview_name(document.sha256, 'preview')))
+
+        # Removed with the last document of their content
+        with self.captureOnCommitCallbacks(execute=True):
+            document.delete()
+        self.assertFalse(default_storage.exists(preview_name(document.sha256, 'thumbnail')))
+
+    def test_broken_image(self):
+        with self.assertLogs('myapp.utils.previews', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                document = self.create_document(PNG_CONTENT + b'truncated', 'broken.png', 'image')
+        self.assertTrue(Document.objects.filter(pk=document.pk).exists())
+        self.assertFalse(default_storage.exists(preview_name(document.sha256, 'thumbnail')))
+
+
+class ArchiveDownloadTests(MediaTestCase):
+    """
+    Zip archives of a sub category or a whole category, streamed with
+    safe and unique entry names.
+    """
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_user('zipadmin@example.com', 'zipadmin', 'Test', 'Admin', '9200000002',
+                                         'profile.png', password='password', is_admin=True)
+        self.client.force_authenticate(admin)
+
+    def download(self, params):
+        response = self.client.get(reverse('download_all_documents'), params)
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        return {name: archive.read(name) for name in archive.namelist()}
+
+    def add_document(self, name, content, sub_category=None):
+        # Document names are free text, the stored file is named apart
+        Document.objects.create(user=self.user, cat=self.category, sub_cat=sub_category or self.sub_category,
+                                name=name, doc=ContentFile(content, name='file.txt'), doc_type='txt',
+                                size=len(content))
+
+    def test_archives(self):
+        self.add_document('notes.txt', b'first')
+        self.add_document('Notes.txt', b'second')
+        self.add_document('../../etc/passwd.txt', b'escape')
+        self.add_document('notes.txt', b'other', SubCategory.objects.create(sub_cat_name='2024/Q1', cat=self.category))
+
+        self.assertEqual(self.download({'sub_cat_id': self.sub_category.pk}), {
+            'notes.txt': b'first', 'Notes (2).txt': b'second', '.._.._etc_passwd.txt': b'escape'})
+        self.assertEqual(self.download({'cat_id': self.category.pk}), {
+            'Sub/notes.txt': b'first', 'Sub/Notes (2).txt': b'second', 'Sub/.._.._etc_passwd.txt': b'escape',
+            '2024_Q1/notes.txt': b'other'})
+
+        self.assertEqual(self.client.get(reverse('download_all_documents')).status_code, 400)
+        empty = SubCategory.objects.create(sub_cat_name='Empty', cat=self.category)
+        response = self.client.get(reverse('download_all_documents'), {'sub_cat_id': empty.pk})
+        self.assertEqual(response.status_code, 404)
+
+
+class StreamingJSONTests(MediaTestCase):
+    """
+    JSON responses written piece by piece, with file content encoded as
+    base64 data URLs while they stream.
+    """
+
+    def test_stream_json(self):
+        content = os.urandom(BASE64_READ_SIZE * 2 + 7)
+        path = os.path.join(self.media_root, 'large.png')
+        with open(path, 'wb') as file:
+            file.write(content)
+        data = {'statusCode': '1', 'count': 2, 'name': 'Déjà vu "quoted"', 'empty': None,
+                'documents': (item for item in [{'doc': Base64File(path)}, {'doc': Base64File('/missing.png')}])}
+        blocks = list(stream_json(data, buffer_size=1024))
+        self.assertTrue(all(len(block) >= 1024 for block in blocks[:-1]))
+        self.assertEqual(json.loads(b''.join(blocks)), {
+            'statusCode': '1', 'count': 2, 'name': 'Déjà vu "quoted"', 'empty': None,
+            'documents': [{'doc': 'data:image/png;base64,' + base64.b64encode(content).decode()}, {'doc': None}]})
+
+    def test_legacy_listing(self):
+        self.create_document(PNG_CONTENT + b'first', 'first.png')
+        self.create_document(PNG_CONTENT + b'second', 'second.png')
+        response = self.client.get(reverse('get_document_by_id'), {'include_content': 'true'})
+        documents = json.loads(b''.join(response.streaming_content))['documents']
+        self.assertEqual(sorted(document['doc'] for document in documents), sorted(
+            'data:image/png;base64,' + base64.b64encode(PNG_CONTENT + name).decode() for name in [b'first', b'second']))
+
+
+class DocumentDownloadTests(MediaTestCase):
+    """
+    download_document: whole files, byte ranges, conditional requests, the
+    signed token of content_url and the transfer offload modes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.document = self.create_document(b'0123456789' * 10)
+        self.url = reverse('download_document', args=[self.document.pk])
+
+    def test_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 10)
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], f'"{self.document.sha256}"')
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'01234')
+        self.assertEqual(response['Content-Range'], 'bytes 10-14/100')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=95-')
+        self.assertEqual(b''.join(response.streaming_content), b'56789')
+
+        for range_header in ['bytes=200-', 'bytes=100-120']:
+            response = self.client.get(self.url, HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */100')
+
+        # A range of another version of the file gets the whole current file
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-14', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)), 100)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_serve_modes(self):
+        with override_settings(DOCUMENT_SERVE_MODE='x-accel-redirect'):
+            response = self.client.get(self.url)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.doc.name)
+            self.assertEqual(response.content, b'')
+        with override_settings(DOCUMENT_SERVE_MODE='x-sendfile'):
+            self.assertEqual(self.client.get(self.url)['X-Sendfile'], self.document.doc.path)
+            # Conditional requests are still answered by the application
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.document.sha256}"')
+            self.assertEqual(response.status_code, 304)
+        with override_settings(DOCUMENT_SERVE_MODE='sendfile'):
+            for range_header, content in [('bytes=90-', b'0123456789'), ('bytes=10-14', b'01234')]:
+                response = self.client.get(self.url, HTTP_RANGE=range_header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), content)
+                self.assertEqual(response['Content-Length'], str(len(content)))
+
+    def test_signed_token(self):
+        other = User.objects.create_user('other@example.com', 'other', 'Test', 'User', '9200000001',
+                                         'profile.png', password='password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        # The content_url of a listing works without a session
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('list_documents'), {'no_of_entries': 10}, format='json')
+        content_url = response.data['documents'][0]['content_url']
+        client = APIClient()
+        response = client.get(content_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 10)
+        self.assertEqual(client.get(content_url[:-1] + 'x').status_code, 401)
+
+
+class CursorPaginationTests(TestCase):
+    """
+    Walks the document listings with cursors for every sort, forwards and
+    back, on documents with many equal sort values. Every document must come
+    exactly once.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cursor@example.com', 'cursor', 'Test', 'User', '9300000000',
+                                            'profile.png', password='password')
+        cls.admin = User.objects.create_user('cursoradmin@example.com', 'cursoradmin', 'Test', 'Admin',
+                                             '9300000001', 'profile.png', password='password', is_admin=True)
+        department = Department.objects.create(dep_name='Records', user=cls.user)
+        documents = []
+        for cat_name in ['Finance', 'Legal']:
+            category = Category.objects.create(cat_name=cat_name, dep=department)
+            cls.sub_category = SubCategory.objects.create(sub_cat_name='Archive', cat=category)
+            for number in range(15):
+                # Letters only in the names, so a number searches document ids alone
+                name = ['alpha report', 'beta report', 'alpha notes'][number % 3]
+                extension = ['pdf', 'docx'][number % 2]
+                documents.append(Document(user=cls.user, cat=category, sub_cat=cls.sub_category,
+                                          name=f'{name}.{extension}', doc=f'blobs/{cat_name}{number}.{extension}',
+                                          doc_type=extension, extension=extension,
+                                          size=[100, 200, 100, 300][number % 4]))
+        Document.objects.bulk_create(documents)
+        rebuild_search_index()
+
+    def walk(self, client, url, params, page_size=4):
+        """
+        Ids of all pages following next_cursor, after checking that going
+        back with prev_cursor from the last page returns the same pages.
+        """
+        pages = []
+        cursor = None
+        while True:
+            data = self.get_page(client, url, params, page_size, cursor)
+            pages.append(data['ids'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        backwards = [pages[-1]]
+        cursor = data['prev_cursor']
+        while cursor:
+            data = self.get_page(client, url, params, page_size, cursor)
+            backwards.insert(0, data['ids'])
+            cursor = data['prev_cursor']
+        self.assertEqual(backwards, pages)
+        return [document_id for page in pages for document_id in page]
+
+    def get_page(self, client, url, params, page_size, cursor):
+        data = {**params, 'no_of_entries': page_size, 'pagination': 'cursor', 'fields': 'id'}
+        if cursor:
+            data['cursor'] = cursor
+        response = client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        rows = response.data['documents'] if 'documents' in response.data else response.data['data']
+        return {**response.data, 'ids': [row['id'] for row in rows]}
+
+    def get_all_ids(self, client, url, params):
+        response = client.post(url, {**params, 'no_of_entries': 1000, 'fields': 'id'}, format='json')
+        rows = response.data['documents'] if 'documents' in response.data else response.data['data']
+        return {row['id'] for row in rows}
+
+    def assert_walks(self, client, url, cases):
+        for params in cases:
+            for page_size in [1, 4]:
+                with self.subTest(page_size=page_size, **params):
+                    ids = self.walk(client, url, params, page_size)
+                    self.assertEqual(len(ids), len(set(ids)), 'Repeated documents')
+                    self.assertEqual(set(ids), self.get_all_ids(client, url, params))
+
+    def test_user_document_listing(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        cases = [{'sort_by': sort_by, 'sort_order': sort_order}
+                 for sort_by in ['name', 'category', 'size', 'doc_type'] for sort_order in ['asc', 'desc']]
+        cases.append({'search_query': 'report'})
+        cases.append({'search_query': 'alpha', 'sort_by': 'relevance'})
+        self.assert_walks(client, reverse('list_documents'), cases)
+
+    def test_admin_document_listing(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        scope = {'sub_cat_id': self.sub_category.pk}
+        cases = [{**scope, 'sort_by': sort_by, 'sort_order': sort_order}
+                 for sort_by in ['username', 'name', 'id', 'last_modified'] for sort_order in ['asc', 'desc']]
+        cases.append({**scope, 'search_query': 'report'})
+        # One document found by its id only, without a search rank of its own, the others by their names
+        documents = list(Document.objects.filter(sub_cat=self.sub_category).order_by('id'))
+        document_id = documents[1].pk
+        Document.objects.filter(pk__in=[document.pk for document in documents[5:8]]) \
+            .update(name=f'reference {document_id}0.pdf')
+        rebuild_search_index()
+        cases.append({**scope, 'search_query': str(document_id)})
+        self.assert_walks(client, reverse('get_all_documents'), cases)
+        self.assertIn(document_id, self.walk(client, reverse('get_all_documents'), cases[-1], 1))
+
+
+class CountEstimateTests(TestCase):
+    """
+    count=estimate and the switch to it for large tables. Estimates come from
+    the PostgreSQL planner, on SQLite counts stay exact.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('estimate@example.com', 'estimate', 'Test', 'User', '9400000000',
+                                            'profile.png', password='password')
+        department = Department.objects.create(dep_name='Stores', user=cls.user)
+        cls.category = Category.objects.create(cat_name='Invoices', dep=department)
+        sub_category = SubCategory.objects.create(sub_cat_name='2024', cat=cls.category)
+        Document.objects.bulk_create([
+            Document(user=cls.user, cat=cls.category, sub_cat=sub_category, name=f'invoice {number}.pdf',
+                     doc=f'blobs/invoice{number}.pdf', doc_type='pdf', extension='pdf', size=100)
+            for number in range(30)
+        ])
+        if connection.vendor == 'postgresql':
+            # Table statistics as autovacuum would leave them
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Document._meta.db_table}')
+
+    @skipIf(connection.vendor == 'postgresql', 'PostgreSQL estimates counts')
+    def test_estimate_falls_back_to_exact_count(self):
+        page, page_info = paginate(Document.objects.order_by('id'), {'count': 'estimate'}, 4)
+        self.assertEqual(len(page), 4)
+        self.assertEqual(page_info, {'current_page': 1, 'total_pages': 8, 'total_entries': 30})
+
+    @skipUnless(connection.vendor == 'postgresql', 'Needs the PostgreSQL planner')
+    def test_estimated_count(self):
+        documents = Document.objects.filter(cat=self.category).order_by('id')
+        self.assertEqual(estimate_count(Document.objects.all()), 30)
+        self.assertGreater(get_plan_estimate(documents), 0)
+
+        page, page_info = paginate(documents, {'count': 'estimate', 'page_no': 2}, 4)
+        self.assertEqual([document.name for document in page], [f'invoice {number}.pdf' for number in range(4, 8)])
+        self.assertEqual(page_info['count'], 'estimate')
+        self.assertTrue(page_info['has_next'])
+        self.assertGreater(page_info['total_entries'], 0)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(reverse('list_documents'), {'count': 'estimate', 'no_of_entries': 4, 'fields': 'id'},
+                               format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['count'], 'estimate')
+        self.assertTrue(response.data['has_next'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Needs the PostgreSQL planner')
+    def test_large_tables_switch_to_estimate(self):
+        with mock.patch('myapp.utils.pagination.COUNT_ESTIMATE_THRESHOLD', 10):
+            page, page_info = paginate(Document.objects.order_by('id'), {}, 4)
+            self.assertEqual(page_info['count'], 'estimate')
+            self.assertEqual(page_info['total_entries'], 30)
+            self.assertTrue(page_info['has_next'])
+            # A filtered listing is counted exactly, the table size says nothing about it
+            page, page_info = paginate(Document.objects.filter(cat=self.category).order_by('id'), {}, 4)
+            self.assertNotIn('count', page_info)
+            self.assertEqual(page_info['total_entries'], 30)
+        page, page_info = paginate(Document.objects.order_by('id'), {}, 4)
+        self.assertNotIn('count', page_info)
+
+    def test_empty_queryset(self):
+        # .none() compiles to no SQL, an unknown file type filter in the admin listing ends up there
+        for params in [{}, {'count': 'estimate'}]:
+            with self.subTest(params=params):
+                page, page_info = paginate(Document.objects.none(), params, 4, count_versions=DOCUMENT_LIST_VERSIONS)
+                self.assertEqual(list(page), [])
+                self.assertEqual(page_info['total_entries'], 0)
+
+
+def make_pdf(content, compressed=True):
+    # One page whose content stream shows the given text operators
+    if compressed:
+        content = zlib.compress(content)
+    stream_filter = b' /Filter /FlateDecode' if compressed else b''
+    return (b'%%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n'
+            b'2 0 obj\n<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n'
+            b'3 0 obj\n<< /Type /Page /Parent 2 0 R /Contents 4 0 R >>\nendobj\n'
+            b'4 0 obj\n<< /Length %d%s >>\nstream\n%s\nendstream\nendobj\n%%%%EOF\n'
+            % (len(content), stream_filter, content))
+
+
+def make_office_file(parts):
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in parts.items():
+            archive.writestr(name, xml)
+    file.seek(0)
+    return file
+
+
+class ExtractTextTests(SimpleTestCase):
+    """
+    Text extraction of every extractable format from files built in memory,
+    and the limit on how far a file may unpack.
+    """
+
+    def test_pdf(self):
+        content = b'BT /F1 12 Tf 72 712 Td (Hello quarterly ) Tj [(bud) -20 (get)] TJ ET'
+        for compressed in [True, False]:
+            with self.subTest(compressed=compressed):
+                file = io.BytesIO(make_pdf(content, compressed))
+                self.assertEqual(extract_text(file, 'pdf'), 'Hello quarterly budget')
+
+    def test_pdf_unpacking_past_the_limit(self):
+        file = io.BytesIO(make_pdf(b'BT (' + b'a' * 100000 + b') Tj ET'))
+        with mock.patch('myapp.utils.extraction.EXTRACTION_MAX_UNPACKED_SIZE', 10000):
+            with self.assertRaisesMessage(ValueError, 'more than the extraction limit'):
+                extract_text(file, 'pdf')
+
+    def test_docx(self):
+        file = make_office_file({'word/document.xml': (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            '<w:p><w:r><w:t>Annual</w:t></w:r><w:r><w:t> report</w:t></w:r></w:p>'
+            '<w:p><w:r><w:t>Second paragraph</w:t></w:r></w:p></w:body></w:document>')})
+        self.assertEqual(extract_text(file, 'docx'), 'Annual report\nSecond paragraph')
+
+    def test_pptx(self):
+        slide = ('<p:sld xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main" '
+                 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"><p:cSld><p:spTree><p:sp>'
+                 '<p:txBody><a:p><a:r><a:t>{}</a:t></a:r></a:p></p:txBody></p:sp></p:spTree></p:cSld></p:sld>')
+        # Slides come in slide number order, not archive order
+        file = make_office_file({'ppt/slides/slide10.xml': slide.format('Last slide'),
+                                 'ppt/slides/slide2.xml': slide.format('First slide')})
+        self.assertEqual(extract_text(file, 'pptx'), 'First slide\nLast slide')
+
+    def test_xlsx(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.title = 'Budget'
+        sheet.append(['Item', 'Amount'])
+        sheet.append(['Paper', 120])
+        file = io.BytesIO()
+        workbook.save(file)
+        file.seek(0)
+        self.assertEqual(extract_text(file, 'xlsx'), 'Budget\nItem Amount\nPaper 120')
@@ -3,14 +3,20 @@ from django.urls import path
 from .view.admin.view import admin_login, create_role, create_resource, create_role_resource_mapping, \
     list_documents_admin, admin_dashboard_counts, get_active_users, get_uploaded_files, \
     get_all_department_file_storage_report, download_all_excel_report, get_departments, get_categories, \
-    get_sub_categories, get_all_documents
+    get_sub_categories, get_all_documents, download_all_documents, create_all_report_job, get_storage_growth, \
+    get_all_document_facets, get_document_analytics
+from .view.admin.tree import get_uploaded_files_tree
 from .view.department.category import add_category, get_category, get_category_dropdown, update_category, \
     delete_category, add_sub_category, update_sub_category, get_sub_category, delete_sub_category, \
     get_sub_category_dropdown
 from .view.department.department import get_departments_by_userid, get_department_file_storage_report, \
     download_excel_report
+from .view.department.report_job import create_report_job, get_report_job, download_report_job
 from .view.department.document import upload_document, list_documents, delete_document, get_document_by_id, \
-    get_counts_document, get_documentby_doc_id, update_document
+    get_counts_document, get_documentby_doc_id, update_document, download_document, get_document_preview, \
+    get_document_facets
+from .view.department.upload import init_upload_session, get_upload_session, upload_chunk, \
+    finalize_upload_session, bulk_upload_documents
 from .view.login_view import signup, signin, logout, captcha_image, send_otp, update_profile, change_password, \
     get_profile_details, create_password, otp_verification
 from .views import create_grievance, update_grievance, delete_grievance, view_grievance, view_grievance_by_userid, \
@@ -37,15 +43,21 @@ urlpatterns = [
     path('admin/role_resource_mapping/', create_role_resource_mapping, name='create_role_resource_mapping'),
     path('admin/list_document/', list_documents_admin, name='list_documents'),
     path('admin/adminDashboardCounts/', admin_dashboard_counts, name='admin_dashboard_counts'),
+    path('admin/getStorageGrowth/', get_storage_growth, name='get_storage_growth'),
     path('admin/getActiveUsers/', get_active_users, name='get_active_users'),
     path('admin/getUploadedFiles/', get_uploaded_files, name='get_uploaded_files'),
+    path('admin/getUploadedFilesTree/', get_uploaded_files_tree, name='get_uploaded_files_tree'),
     path('admin/getDepartmentFileStorageReport/', get_all_department_file_storage_report,
          name='get_department_file_storage_report'),
     path('admin/downloadExcelReport/', download_all_excel_report, name='download_excel_report'),
+    path('admin/reportJobs/', create_all_report_job, name='create_all_report_job'),
     path('admin/getAllDepartments/', get_departments, name='get_departments'),
     path('admin/getAllCategory/<str:dep_id>', get_categories, name='get_categories'),
     path('admin/getAllSubCategory/<str:cat_id>', get_sub_categories, name='get_sub_categories'),
     path('admin/getAllDocument/', get_all_documents, name='get_all_documents'),
+    path('admin/getDocumentFacets/', get_all_document_facets, name='get_all_document_facets'),
+    path('admin/getDocumentAnalytics/', get_document_analytics, name='get_document_analytics'),
+    path('admin/downloadAllDocuments/', download_all_documents, name='download_all_documents'),
 
     # ==================== document upload ============================
     path('department/upload_document/', upload_document, name='upload_document'),
@@ -54,7 +66,16 @@ urlpatterns = [
     path('department/get_document_by_id/', get_document_by_id, name='get_document_by_id'),
     path('department/get_documentby_doc_id/', get_documentby_doc_id, name='get_documentby_doc_id'),
     path('department/update_document/', update_document, name='update_document'),
+    path('department/download_document/<int:doc_id>/', download_document, name='download_document'),
+    path('department/document_preview/<int:doc_id>/<str:size>/', get_document_preview, name='document_preview'),
     path('department/getCounts/', get_counts_document, name='get_counts_document'),
+    path('department/getDocumentFacets/', get_document_facets, name='get_document_facets'),
+    path('department/upload_session/', init_upload_session, name='init_upload_session'),
+    path('department/upload_session/<uuid:session_id>/', get_upload_session, name='get_upload_session'),
+    path('department/upload_session/<uuid:session_id>/chunk/<int:chunk_no>/', upload_chunk, name='upload_chunk'),
+    path('department/upload_session/<uuid:session_id>/finalize/', finalize_upload_session,
+         name='finalize_upload_session'),
+    path('department/bulk_upload_documents/', bulk_upload_documents, name='bulk_upload_documents'),
     path('user/getAllDepartments/', get_departments_by_userid, name='get_departments_by_userid'),
     path('user/addCategory/', add_category, name='add_category'),
     path('user/userProfileDetails/', get_profile_details, name='get_profile_details'),
@@ -67,6 +88,9 @@ urlpatterns = [
     path('createPassword/', create_password, name='create_password'),
     path('user/getDepartmentFileStorageReport/', get_department_file_storage_report, name="get_department_file_storage_report"),
     path('user/downloadExcelReport/', download_excel_report, name="download_excel_report"),
+    path('user/reportJobs/', create_report_job, name='create_report_job'),
+    path('reportJobs/<uuid:job_id>/', get_report_job, name='get_report_job'),
+    path('reportJobs/<uuid:job_id>/download/', download_report_job, name='download_report_job'),
     path('departments/addSubCategory/', add_sub_category, name="add_sub_category"),
     path('departments/updateSubCategory/', update_sub_category, name="update_sub_category"),
     path('departments/deleteSubCategory/', delete_sub_category, name="delete_sub_category"),
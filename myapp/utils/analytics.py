@@ -0,0 +1,206 @@
+import threading
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from .facets import FACET_KINDS
+from .versions import DOCUMENTS_VERSION, DOCUMENT_UPDATES_VERSION, get_data_versions
+from ..model.department import Category, Department, Document
+from ..models import User
+
+SNAPSHOT_CHUNK_SIZE = 50000
+SNAPSHOT_ID_BATCH_SIZE = 500  # Ids per IN (...) query, below the SQLite parameter limit
+SNAPSHOT_FIELDS = ['id', 'size', 'upload_time', 'file_kind', 'cat__dep_id', 'cat_id', 'user_id']
+# Snapshot columns the analytics can be grouped by
+ANALYTICS_GROUPS = {
+    'file_kind': 'file_kind',
+    'department': 'dep_id',
+    'category': 'cat_id',
+    'uploader': 'user_id',
+}
+# Ids repeat across millions of rows, categorical codes keep them small and fast to group
+CATEGORICAL_COLUMNS = {'dep_id': np.int64, 'cat_id': np.int64, 'user_id': object}
+SIZE_PERCENTILES = [50, 75, 90, 95, 99]
+
+
+def build_frame(rows):
+    ids, sizes, upload_times, file_kinds, dep_ids, cat_ids, user_ids = zip(*rows) if rows else [()] * 7
+    return pd.DataFrame({
+        'id': np.array(ids, dtype=np.int64),
+        'size': np.array(sizes, dtype=np.int64),
+        'upload_time': pd.to_datetime(list(upload_times), utc=True),
+        'file_kind': pd.Categorical([kind if kind in FACET_KINDS else 'other' for kind in file_kinds],
+                                    categories=FACET_KINDS),
+        'dep_id': np.array(dep_ids, dtype=np.int64),
+        'cat_id': np.array(cat_ids, dtype=np.int64),
+        'user_id': np.array(user_ids, dtype=object),  # User keys are strings
+    })
+
+
+def categorize(frame):
+    return frame.astype({column: 'category' for column in CATEGORICAL_COLUMNS})
+
+
+def decategorize(frame):
+    return frame.astype(CATEGORICAL_COLUMNS)
+
+
+def load_frame(documents):
+    """
+    Columnar frame of the Document metadata, read with one values_list
+    iterator and converted chunk by chunk so no full list of rows is built.
+    """
+    rows = documents.values_list(*SNAPSHOT_FIELDS).order_by('id').iterator(chunk_size=SNAPSHOT_CHUNK_SIZE)
+    chunks = []
+    while True:
+        batch = list(islice(rows, SNAPSHOT_CHUNK_SIZE))
+        if not batch:
+            break
+        chunks.append(build_frame(batch))
+    frame = pd.concat(chunks, ignore_index=True) if chunks else build_frame([])
+    return categorize(frame)
+
+
+class DocumentSnapshot:
+    """
+    Per process in-memory copy of the Document metadata for analytics.
+    Additions and deletions are applied incrementally; changes to existing
+    documents (see DOCUMENT_UPDATES_VERSION) reload it. The data versions
+    tell without reading any document whether it is still current.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.versions = None
+        self.lock = threading.Lock()
+
+    def get_frame(self):
+        # Read before loading: changes made meanwhile are applied again on the next call, which is harmless
+        versions = get_data_versions(DOCUMENTS_VERSION, DOCUMENT_UPDATES_VERSION)
+        with self.lock:
+            if self.frame is None or versions[1] != self.versions[1]:
+                self.frame = load_frame(Document.objects.all())
+            elif versions[0] != self.versions[0]:
+                self.frame = self.apply_changes(self.frame)
+            self.versions = versions
+            return self.frame
+
+    @staticmethod
+    def apply_changes(frame):
+        last_id = int(frame['id'].max()) if len(frame) else 0
+        current = np.fromiter(Document.objects.values_list('id', flat=True).iterator(chunk_size=SNAPSHOT_CHUNK_SIZE),
+                              dtype=np.int64)
+        frame = frame[frame['id'].isin(current)]
+        # Concurrent uploads commit out of id order, a document below the highest loaded id can show up later
+        late_ids = np.setdiff1d(current[current <= last_id], frame['id'].to_numpy())
+        added = [load_frame(Document.objects.filter(id__gt=last_id))]
+        added += [load_frame(Document.objects.filter(id__in=late_ids[start:start + SNAPSHOT_ID_BATCH_SIZE].tolist()))
+                  for start in range(0, len(late_ids), SNAPSHOT_ID_BATCH_SIZE)]
+        added = [part for part in added if len(part)]
+        if not added:
+            return frame.reset_index(drop=True)
+        # Categories of the parts differ, merged as plain ids and categorized again
+        return categorize(pd.concat([decategorize(part) for part in [frame] + added], ignore_index=True))
+
+
+snapshot = DocumentSnapshot()
+
+
+def filter_frame(frame, start=None, end=None):
+    # Dates are inclusive and compared in UTC like the upload_time column
+    mask = np.ones(len(frame), dtype=bool)
+    if start:
+        mask &= (frame['upload_time'] >= pd.Timestamp(start, tz='UTC')).to_numpy()
+    if end:
+        mask &= (frame['upload_time'] < pd.Timestamp(end, tz='UTC') + pd.Timedelta(days=1)).to_numpy()
+    return frame[mask]
+
+
+def size_percentiles(frame, group_by=None, percentiles=SIZE_PERCENTILES):
+    """
+    File size percentiles in bytes, overall or per ANALYTICS_GROUPS value.
+    """
+    quantiles = [percentile / 100 for percentile in percentiles]
+    if group_by is None:
+        values = np.percentile(frame['size'].to_numpy(), percentiles) if len(frame) else [0] * len(percentiles)
+        return [{'group': None, 'count': len(frame),
+                 **{f'p{percentile}': float(value) for percentile, value in zip(percentiles, values)}}]
+    grouped = frame.groupby(ANALYTICS_GROUPS[group_by], observed=True)['size']
+    counts = grouped.size()
+    table = grouped.quantile(quantiles).unstack()
+    return [{'group': group, 'count': int(counts[group]),
+             **{f'p{percentile}': float(table.at[group, quantile])
+                for percentile, quantile in zip(percentiles, quantiles)}}
+            for group in table.index]
+
+
+def top_uploaders(frame, limit=10):
+    # Ranked by bytes uploaded
+    totals = frame.groupby('user_id', observed=True)['size'].agg(['count', 'sum']).nlargest(limit, 'sum')
+    return [{'group': user_id, 'count': int(row['count']), 'total_size': int(row['sum'])}
+            for user_id, row in totals.iterrows()]
+
+
+def size_distribution(frame, group_by='department'):
+    """
+    Count, total, mean, median and largest file size per ANALYTICS_GROUPS
+    value and file kind.
+    """
+    columns = [ANALYTICS_GROUPS[group_by]] + (['file_kind'] if group_by != 'file_kind' else [])
+    table = frame.groupby(columns, observed=True)['size'].agg(['count', 'sum', 'mean', 'median', 'max'])
+    distribution = []
+    for key, row in table.iterrows():
+        group, file_kind = key if isinstance(key, tuple) else (key, key)
+        distribution.append({
+            'group': group,
+            'file_kind': file_kind,
+            'count': int(row['count']),
+            'total_size': int(row['sum']),
+            'mean_size': float(row['mean']),
+            'median_size': float(row['median']),
+            'max_size': int(row['max']),
+        })
+    return distribution
+
+
+# (model, label field) of the ids in each group
+GROUP_LABELS = {
+    'department': (Department, 'dep_name'),
+    'category': (Category, 'cat_name'),
+    'uploader': (User, 'username'),
+}
+
+
+def label_groups(rows, group_by):
+    """
+    Converts the group ids of report rows to Python ints and adds their
+    names, looked up with one query.
+    """
+    if group_by not in GROUP_LABELS:
+        for row in rows:
+            row['name'] = row['group']
+        return rows
+    model, field = GROUP_LABELS[group_by]
+    for row in rows:
+        row['group'] = row['group'].item() if isinstance(row['group'], np.generic) else row['group']
+    names = dict(model.objects.filter(pk__in=[row['group'] for row in rows]).values_list('pk', field))
+    for row in rows:
+        row['name'] = names.get(row['group'])
+    return rows
+
+
+ANALYTICS_REPORTS = ['size_percentiles', 'top_uploaders', 'size_distribution']
+
+
+def document_analytics(frame, report, group_by=None, limit=10):
+    """
+    Runs one of ANALYTICS_REPORTS over a snapshot frame and returns rows
+    with plain Python values.
+    """
+    if report == 'size_percentiles':
+        return label_groups(size_percentiles(frame, group_by), group_by) if group_by else size_percentiles(frame)
+    if report == 'top_uploaders':
+        return label_groups(top_uploaders(frame, limit), 'uploader')
+    group_by = group_by or 'department'
+    return label_groups(size_distribution(frame, group_by), group_by)
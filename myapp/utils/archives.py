@@ -0,0 +1,81 @@
+import os
+import re
+import zipfile
+
+from django.utils import timezone
+
+ZIP_BLOCK_SIZE = 64 * 1024
+# Already compressed formats gain nothing from deflate, store them as they are
+ZIP_STORED_EXTENSIONS = ['jpg', 'jpeg', 'png', 'docx', 'xlsx', 'pptx', 'zip']
+
+
+class ZipStreamBuffer:
+    """
+    Write-only file object for ZipFile. What the archive writes is collected
+    until stream_zip hands it to the response, so ZipFile writes its headers
+    and data descriptors for an unseekable stream.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self.chunks:
+            data = b''.join(self.chunks)
+            self.chunks = []
+            yield data
+
+
+def safe_archive_name(name, default='file'):
+    """
+    One folder or file name of an archive entry from a user supplied name.
+    Path separators, drive letters and dot-only names are removed so no
+    entry extracts outside the folder the archive is extracted into.
+    """
+    name = re.sub(r'[\\/:]', '_', str(name)).strip()
+    if not name.strip('.'):
+        return default
+    return name
+
+
+def unique_archive_name(name, used_names):
+    base, extension = os.path.splitext(name)
+    counter = 2
+    while name.lower() in used_names:
+        name = f'{base} ({counter}){extension}'
+        counter += 1
+    used_names.add(name.lower())
+    return name
+
+
+def stream_zip(entries):
+    """
+    Yields a zip archive of (archive name, file path, modified datetime)
+    entries piece by piece. Only one block of one file is held in memory at
+    a time; missing files are skipped.
+    """
+    buffer = ZipStreamBuffer()
+    used_names = set()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, path, modified in entries:
+            if not os.path.exists(path):
+                continue
+            info = zipfile.ZipInfo(unique_archive_name(name, used_names),
+                                   date_time=timezone.localtime(modified).timetuple()[:6])
+            extension = os.path.splitext(path)[1][1:].lower()
+            info.compress_type = zipfile.ZIP_STORED if extension in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(path, 'rb') as source, archive.open(info, 'w') as target:
+                for block in iter(lambda: source.read(ZIP_BLOCK_SIZE), b''):
+                    target.write(block)
+                    yield from buffer.drain()
+            yield from buffer.drain()
+    # Central directory
+    yield from buffer.drain()
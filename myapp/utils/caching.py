@@ -0,0 +1,78 @@
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+GLOBAL_SCOPE = 'global'
+USER_SCOPE = 'user'
+
+
+def get_dashboard_cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+
+def generation_key(scope_key):
+    return f'dashboard:generation:{scope_key}'
+
+
+def new_generation():
+    # Never reuses an old number when the counter was evicted, entries cached under it stay unreachable
+    return time.time_ns()
+
+
+def get_generation(scope_key):
+    cache = get_dashboard_cache()
+    generation = cache.get(generation_key(scope_key))
+    if generation is None:
+        cache.add(generation_key(scope_key), new_generation(), timeout=None)
+        generation = cache.get(generation_key(scope_key))
+    return generation
+
+
+def bump_generation(scope_key):
+    cache = get_dashboard_cache()
+    try:
+        cache.incr(generation_key(scope_key))
+    except ValueError:
+        cache.set(generation_key(scope_key), new_generation(), timeout=None)
+
+
+def invalidate_dashboards(*user_ids):
+    """
+    Drops the cached admin dashboards and those of the given users once the
+    current transaction commits, so a concurrent request cannot cache the
+    data from before the change again.
+    """
+    def bump():
+        bump_generation(GLOBAL_SCOPE)
+        for user_id in set(user_ids):
+            bump_generation(f'{USER_SCOPE}:{user_id}')
+    transaction.on_commit(bump)
+
+
+def cache_dashboard(scope):
+    """
+    Caches the data of successful responses of a view per URL arguments and
+    scope, GLOBAL_SCOPE for everyone or USER_SCOPE per requesting user, until
+    invalidate_dashboards is called for that scope.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            scope_key = GLOBAL_SCOPE if scope == GLOBAL_SCOPE else f'{USER_SCOPE}:{request.user.pk}'
+            arguments = hashlib.md5(repr((args, sorted(kwargs.items()))).encode('utf-8')).hexdigest()
+            key = f'dashboard:{view.__name__}:{scope_key}:{get_generation(scope_key)}:{arguments}'
+            cache = get_dashboard_cache()
+            data = cache.get(key)
+            if data is not None:
+                return Response(data, status=200)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, response.data, settings.DASHBOARD_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -1,5 +1,6 @@
 import os
 
+from django.conf import settings
 from django.utils import timezone
 
 
@@ -30,6 +31,33 @@ def get_file_extension(mimetype):
     return extension
 
 
+MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'ppt': 'application/vnd.ms-powerpoint',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+
+def get_mime_type(extension):
+    return MIME_TYPES.get(extension.lower(), 'application/octet-stream')
+
+
+def get_data_url_prefix(extension):
+    extension = extension.lower()
+    if extension in ['jpg', 'jpeg', 'png']:
+        return f"data:image/{extension}"
+    if extension in MIME_TYPES:
+        return f"data:{MIME_TYPES[extension]}"
+    return None
+
+
 def get_allowed_extension(doctype):
     allowed_extensions = []
     if doctype == 'pdf':
@@ -45,6 +73,25 @@ def get_allowed_extension(doctype):
     return allowed_extensions
 
 
+FILE_KINDS = ['pdf', 'ppt', 'image', 'word', 'excel']
+
+
+def get_extension(file_name):
+    return os.path.splitext(file_name or '')[1][1:].lower()[:10]
+
+
+def get_file_kind(file_name):
+    # Classifies by the stored file's extension like the dashboards always did, not by doc_type
+    return get_doc_type(get_extension(file_name)) or 'other'
+
+
+def get_doc_type(extension):
+    for doctype in ['pdf', 'ppt', 'word', 'excel', 'image']:
+        if extension in get_allowed_extension(doctype):
+            return doctype
+    return None
+
+
 def convert_size(size_bytes):
     if size_bytes < 1024:
         return f"{size_bytes} KB"
@@ -85,3 +132,27 @@ def document_upload_path(instance, filename):
     else:
         return f'documents/others/{filename}'
 
+
+def get_requested_fields(request):
+    fields = request.data.get('fields', request.GET.get('fields'))
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return [field.strip() for field in fields if field.strip()]
+
+
+def include_content_requested(request, content_field='doc'):
+    value = request.data.get('include_content', request.GET.get('include_content'))
+    if value is None:
+        fields = get_requested_fields(request)
+        if fields:
+            return content_field in fields
+        return settings.DOCUMENT_INCLUDE_CONTENT_DEFAULT
+    return str(value).lower() in ['1', 'true', 'yes']
+
+
+def select_fields(data, fields):
+    if not fields:
+        return data
+    return {key: value for key, value in data.items() if key in fields}
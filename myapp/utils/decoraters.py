@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from .downloads import verify_document_token
+
 
 class AdminOnly(BasePermission):
     def has_permission(self, request, view):
@@ -14,3 +16,8 @@ class IsAuthenticated(BasePermission):
 class AllowAll(BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated
+
+
+class HasDocumentToken(BasePermission):
+    def has_permission(self, request, view):
+        return verify_document_token(request.GET.get('token'), view.kwargs.get('doc_id'))
@@ -0,0 +1,221 @@
+import os
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.http.response import FileResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
+from django.utils import baseconv
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from ranged_response import RangedFileReader
+
+from .common import get_mime_type
+from .previews import has_previews, preview_name
+
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+CONTENT_TOKEN_SALT = 'myapp.document-content'
+# Previews are immutable, browsers may keep them as long as a token is valid
+PREVIEW_MAX_AGE = 60 * 60
+
+
+class StreamingRangedFileReader(RangedFileReader):
+    """
+    RangedFileReader that is told the file size up front. The upstream reader
+    measures the size with f.read(), which loads the whole file into memory.
+    """
+
+    def __init__(self, file_like, size, start=0, stop=None, block_size=None):
+        self.f = file_like
+        self.size = size
+        self.block_size = block_size or DOWNLOAD_BLOCK_SIZE
+        self.start = start
+        self.stop = size if stop is None else stop
+
+    def __iter__(self):
+        self.f.seek(self.start)
+        position = self.start
+        while position < self.stop:
+            data = self.f.read(min(self.block_size, self.stop - position))
+            if not data:
+                break
+            yield data
+            position += len(data)
+
+    def close(self):
+        self.f.close()
+
+
+class WindowedTimestampSigner(signing.TimestampSigner):
+    """
+    Rounds the timestamp down to a quarter of the token lifetime, so listings
+    hand out the same URL for a while and the browser cache can reuse it.
+    Tokens stay valid for between 3/4 and all of the configured max age.
+    """
+
+    def timestamp(self):
+        window = max(settings.DOCUMENT_CONTENT_TOKEN_MAX_AGE // 4, 1)
+        return baseconv.base62.encode(int(time.time()) // window * window)
+
+
+def sign_document_token(document):
+    return WindowedTimestampSigner(salt=CONTENT_TOKEN_SALT).sign(str(document.pk))
+
+
+def verify_document_token(token, doc_id):
+    if not token:
+        return False
+    try:
+        value = signing.TimestampSigner(salt=CONTENT_TOKEN_SALT).unsign(
+            token, max_age=settings.DOCUMENT_CONTENT_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return value == str(doc_id)
+
+
+def document_content_url(request, document):
+    url = reverse('download_document', args=[document.pk])
+    return request.build_absolute_uri(f'{url}?token={sign_document_token(document)}')
+
+
+def document_preview_url(request, document, size='thumbnail'):
+    if not has_previews(document):
+        return None
+    url = reverse('document_preview', args=[document.pk, size])
+    return request.build_absolute_uri(f'{url}?token={sign_document_token(document)}')
+
+
+def document_etag(document, stat):
+    if document.sha256:
+        return quote_etag(document.sha256)
+    return quote_etag(f'{document.pk}-{stat.st_size}-{int(stat.st_mtime)}')
+
+
+def document_last_modified(document, stat):
+    # update_document rewrites the file without touching upload_time
+    return int(max(document.upload_time.timestamp(), stat.st_mtime))
+
+
+def content_disposition(filename, as_attachment=False):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        file_expr = 'filename="{}"'.format(filename.replace('"', ''))
+    except UnicodeEncodeError:
+        file_expr = "filename*=utf-8''{}".format(quote(filename))
+    return '{}; {}'.format(disposition, file_expr)
+
+
+def get_requested_range(request, reader, etag, last_modified):
+    """
+    Returns (start, stop) for a single satisfiable byte range, 'invalid' for an
+    unsatisfiable one and None when the full file should be sent.
+    """
+    range_header = request.META.get('HTTP_RANGE')
+    if not range_header:
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        if if_range.startswith(('"', 'W/')):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    # The parser treats a range starting past the end like a malformed one
+    first_byte = re.fullmatch(r'\s*bytes\s*=\s*(\d+)-\d*\s*', range_header)
+    if first_byte and int(first_byte.group(1)) >= reader.size:
+        return 'invalid'
+    try:
+        ranges = reader.parse_range_header(range_header, reader.size)
+    except ValueError:
+        ranges = None
+    # multipart/byteranges is not supported, fall back to the full body
+    if ranges is None or len(ranges) != 1:
+        return None
+
+    start, stop = ranges[0]
+    return start, min(stop, reader.size)
+
+
+def offload_response(path, content_type):
+    """
+    Hands the transfer to the front proxy: nginx (X-Accel-Redirect) or
+    Apache/lighttpd (X-Sendfile). The proxy also takes care of Range requests.
+    """
+    mode = settings.DOCUMENT_SERVE_MODE
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_document(request, document, as_attachment=False):
+    path = document.doc.path
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = document_etag(document, stat)
+    last_modified = document_last_modified(document, stat)
+    content_type = get_mime_type(os.path.splitext(path)[1][1:])
+    mode = settings.DOCUMENT_SERVE_MODE
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and mode in ['x-accel-redirect', 'x-sendfile']:
+        response = offload_response(path, content_type)
+        response['Content-Disposition'] = content_disposition(document.name, as_attachment)
+    elif response is None:
+        reader = StreamingRangedFileReader(open(path, 'rb'), size)
+        requested_range = get_requested_range(request, reader, etag, last_modified)
+        if requested_range == 'invalid':
+            reader.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        else:
+            if requested_range:
+                reader.start, reader.stop = requested_range
+            if mode == 'sendfile' and reader.stop == size:
+                # A real file lets the WSGI server's file_wrapper use os.sendfile(). Servers without
+                # sendfile read it to EOF, so only ranges that end with the file can be sent this way.
+                reader.f.seek(reader.start)
+                response = FileResponse(reader.f, content_type=content_type)
+            else:
+                response = FileResponse(reader, content_type=content_type)
+            response['Content-Length'] = reader.stop - reader.start
+            response['Content-Disposition'] = content_disposition(document.name, as_attachment)
+            if requested_range:
+                response.status_code = 206
+                response['Content-Range'] = f'bytes {reader.start}-{reader.stop - 1}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def serve_preview(request, document, size):
+    """
+    Serves a generated rendition. Returns None when it does not exist (yet),
+    e.g. for documents uploaded before previews were introduced.
+    """
+    name = preview_name(document.sha256, size)
+    if not document.sha256 or not default_storage.exists(name):
+        return None
+    etag = quote_etag(f'{document.sha256}-{size}')
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None and settings.DOCUMENT_SERVE_MODE in ['x-accel-redirect', 'x-sendfile']:
+        response = offload_response(default_storage.path(name), 'image/jpeg')
+    elif response is None:
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=PREVIEW_MAX_AGE, immutable=True)
+    return response
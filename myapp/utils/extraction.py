@@ -0,0 +1,289 @@
+import logging
+import multiprocessing
+import re
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from xml.etree import ElementTree
+
+import django
+from django.db import transaction
+from openpyxl import load_workbook
+
+from .search import get_search_content
+from .versions import SEARCH_VERSION, bump_data_version
+from ..model.department import Document, DocumentSearchIndex, ExtractedText
+
+logger = logging.getLogger(__name__)
+
+EXTRACTABLE_EXTENSIONS = ['pdf', 'docx', 'xlsx', 'pptx']
+EXTRACTION_WORKERS = 2
+EXTRACTION_MAX_FILE_SIZE = 50 * 1024 * 1024
+EXTRACTION_MAX_UNPACKED_SIZE = 200 * 1024 * 1024  # Declared size of the parts read from an Office file
+EXTRACTION_MAX_TEXT_LENGTH = 1000000  # Characters kept per file, enough to search
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+DRAWING_NAMESPACE = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        # Spawned rather than forked so workers never share the server's database connections
+        executor = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+    return executor
+
+
+def has_extractable_text(document):
+    # Keyed by content, documents stored before the blob store have no digest yet
+    return bool(document.sha256) and document.extension in EXTRACTABLE_EXTENSIONS
+
+
+def iter_xml_text(file, text_tag, paragraph_tag):
+    for _, element in ElementTree.iterparse(file):
+        if element.tag == text_tag:
+            if element.text:
+                yield element.text
+        elif element.tag == paragraph_tag:
+            yield '\n'
+            # Only the text is needed, keep memory flat on large parts
+            element.clear()
+
+
+def iter_office_parts(file, select_parts):
+    """
+    Opens the parts of an Office Open XML file chosen by select_parts from
+    the names in the archive, in the order returned.
+    """
+    archive = zipfile.ZipFile(file)
+    infos = {info.filename: info for info in archive.infolist()}
+    names = select_parts(list(infos))
+    if sum(infos[name].file_size for name in names) > EXTRACTION_MAX_UNPACKED_SIZE:
+        raise ValueError('File unpacks to more than the extraction limit')
+    for name in names:
+        with archive.open(infos[name]) as part:
+            yield part
+
+
+def select_slides(names):
+    slides = [name for name in names if re.fullmatch(r'ppt/slides/slide\d+\.xml', name)]
+    return sorted(slides, key=lambda name: int(re.search(r'\d+', name).group()))
+
+
+def iter_docx_text(file):
+    for part in iter_office_parts(file, lambda names: [name for name in names if name == 'word/document.xml']):
+        yield from iter_xml_text(part, f'{WORD_NAMESPACE}t', f'{WORD_NAMESPACE}p')
+
+
+def iter_pptx_text(file):
+    for part in iter_office_parts(file, select_slides):
+        yield from iter_xml_text(part, f'{DRAWING_NAMESPACE}t', f'{DRAWING_NAMESPACE}p')
+        yield '\n'
+
+
+def iter_xlsx_text(file):
+    # openpyxl reads the parts itself, only their declared size is checked here
+    if sum(info.file_size for info in zipfile.ZipFile(file).infolist()) > EXTRACTION_MAX_UNPACKED_SIZE:
+        raise ValueError('File unpacks to more than the extraction limit')
+    file.seek(0)
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            yield f'{sheet.title}\n'
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(value) for value in row if value is not None]
+                if cells:
+                    yield ' '.join(cells) + '\n'
+    finally:
+        workbook.close()
+
+
+PDF_TOKEN = re.compile(rb'''
+    \((?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*\)   # literal string, one level of nested parentheses
+    | <[0-9A-Fa-f\s]*>                          # hex string
+    | [+-]?(?:\d+\.?\d*|\.\d+)                  # number
+    | [A-Za-z'"*]+                              # operator
+    | [\[\]]
+''', re.VERBOSE | re.DOTALL)
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+PDF_ESCAPE = re.compile(rb'\\([0-7]{1,3}|\r\n|.)', re.DOTALL)
+# Kerning wider than this (thousandths of a text unit) inside a TJ array separates words
+PDF_WORD_GAP = 200
+
+
+def decode_pdf_string(token):
+    if token.startswith(b'<'):
+        data = bytes.fromhex(re.sub(rb'\s', b'', token[1:-1]).decode('ascii').ljust(2, '0'))
+        if b'\x00' in data:
+            # Two byte glyph ids of a CID font, meaningless without the font's ToUnicode map
+            return ''
+    else:
+        def unescape(match):
+            value = match.group(1)
+            if value[:1].isdigit():
+                return bytes([int(value, 8) & 0xFF])
+            if value in (b'\n', b'\r', b'\r\n'):
+                return b''
+            return PDF_ESCAPES.get(value, value)
+        data = PDF_ESCAPE.sub(unescape, token[1:-1])
+    # Close enough to the standard encodings of simple fonts for searching
+    return data.decode('latin-1')
+
+
+def iter_pdf_content_text(content):
+    strings = []
+    in_array = False
+    for token in PDF_TOKEN.findall(content):
+        if token[:1] in b'(<':
+            strings.append(decode_pdf_string(token))
+        elif token == b'[':
+            in_array = True
+        elif token == b']':
+            in_array = False
+        elif token[:1].isalpha() or token[:1] in b'\'"':
+            if token in (b'Tj', b'TJ', b"'", b'"'):
+                yield ''.join(strings)
+            if token in (b'T*', b'TD', b"'", b'"', b'ET'):
+                yield '\n'
+            elif token in (b'Td', b'Tm'):
+                yield ' '
+            strings = []
+        elif in_array and float(token) < -PDF_WORD_GAP:
+            strings.append(' ')
+
+
+def iter_pdf_text(file):
+    """
+    Text shown by the content streams of a PDF. No PDF library is a
+    dependency, so this reads the Flate compressed or plain streams itself;
+    scanned pages and text in CID fonts are not found.
+    """
+    data = file.read()
+    if b'/Encrypt' in data[-4096:] or re.search(rb'/Encrypt\s', data[:4096]):
+        raise ValueError('Encrypted PDF')
+    unpacked = 0
+    for match in re.finditer(rb'stream\r?\n', data):
+        start = match.end()
+        end = data.find(b'endstream', start)
+        if end == -1:
+            break
+        dictionary = data[max(0, data.rfind(b'obj', 0, match.start())):match.start()]
+        if b'/Subtype/Image' in dictionary.replace(b' ', b''):
+            continue
+        content = data[start:end]
+        if b'/FlateDecode' in dictionary:
+            try:
+                # Bounded, a small stream can inflate to gigabytes
+                content = zlib.decompressobj().decompress(content, EXTRACTION_MAX_UNPACKED_SIZE - unpacked + 1)
+            except zlib.error:
+                continue
+        elif b'/Filter' in dictionary:
+            continue
+        unpacked += len(content)
+        if unpacked > EXTRACTION_MAX_UNPACKED_SIZE:
+            raise ValueError('File unpacks to more than the extraction limit')
+        if b'BT' in content and (b'Tj' in content or b'TJ' in content):
+            yield from iter_pdf_content_text(content)
+            yield '\n'
+
+
+TEXT_EXTRACTORS = {
+    'pdf': iter_pdf_text,
+    'docx': iter_docx_text,
+    'xlsx': iter_xlsx_text,
+    'pptx': iter_pptx_text,
+}
+
+
+def extract_text(file, extension):
+    """
+    Plain text of an open file of one of the EXTRACTABLE_EXTENSIONS, with
+    whitespace collapsed and cut off at EXTRACTION_MAX_TEXT_LENGTH.
+    """
+    pieces = []
+    length = 0
+    for piece in TEXT_EXTRACTORS[extension](file):
+        pieces.append(piece)
+        length += len(piece)
+        if length > EXTRACTION_MAX_TEXT_LENGTH:
+            break
+    text = ''.join(pieces)
+    text = ''.join(character if character.isprintable() or character == '\n' else ' ' for character in text)
+    text = re.sub(r'[ \t]+', ' ', text)
+    text = re.sub(r'\s*\n\s*', '\n', text)
+    return text.strip()[:EXTRACTION_MAX_TEXT_LENGTH]
+
+
+def extract_document_text(document_id):
+    """
+    Extracts the text of a document unless its content was extracted before
+    and copies it into the search index of every document with that
+    content. Runs in a worker process.
+    """
+    document = Document.objects.filter(pk=document_id).first()
+    if document is None or not has_extractable_text(document):
+        return
+    extracted = ExtractedText.objects.filter(sha256=document.sha256).first()
+    if extracted is None:
+        text, error = '', ''
+        try:
+            if document.size > EXTRACTION_MAX_FILE_SIZE:
+                raise ValueError('File is larger than the extraction limit')
+            with document.doc.storage.open(document.doc.name, 'rb') as file:
+                text = extract_text(file, document.extension)
+        except Exception as e:
+            logger.warning('Could not extract the text of document %s: %s', document_id, e)
+            error = str(e) or e.__class__.__name__
+        extracted, _ = ExtractedText.objects.get_or_create(sha256=document.sha256,
+                                                           defaults={'text': text, 'error': error})
+    content = get_search_content(extracted.text)
+    updated = DocumentSearchIndex.objects.filter(document__sha256=document.sha256).exclude(content=content) \
+        .update(content=content)
+    if updated:
+        bump_data_version(SEARCH_VERSION)
+
+
+def log_extraction_failure(document_id, future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Text extraction of document %s failed', document_id, exc_info=future.exception())
+
+
+def submit_text_extraction(document_id):
+    global executor
+    try:
+        future = get_executor().submit(extract_document_text, document_id)
+    except BrokenProcessPool:
+        # A worker died, start a fresh pool
+        executor = None
+        future = get_executor().submit(extract_document_text, document_id)
+    future.add_done_callback(partial(log_extraction_failure, document_id))
+
+
+def record_extraction_error(document_id, error):
+    """
+    Records the content of a document as unreadable, for files that stop the
+    worker reading them so they are not tried again.
+    """
+    document = Document.objects.filter(pk=document_id).first()
+    if document is not None and has_extractable_text(document):
+        ExtractedText.objects.get_or_create(sha256=document.sha256, defaults={'error': error})
+
+
+def schedule_text_extraction(document):
+    if not has_extractable_text(document):
+        return
+
+    def submit():
+        # Search content is an optimisation, a failing pool must never fail the upload
+        try:
+            submit_text_extraction(document.pk)
+        except Exception:
+            logger.exception('Could not queue text extraction for document %s', document.pk)
+    # Queued once the upload is committed so workers can read the document
+    transaction.on_commit(submit)
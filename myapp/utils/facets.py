@@ -0,0 +1,121 @@
+from django.db.models import Count, DateField, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
+
+from .common import FILE_KINDS
+from .search import search_documents
+
+FACET_KINDS = FILE_KINDS + ['other']
+# (value field, label field) of the facets that group documents
+FACET_FIELDS = {
+    'department': ('cat__dep_id', 'cat__dep__dep_name'),
+    'category': ('cat_id', 'cat__cat_name'),
+    'sub_category': ('sub_cat_id', 'sub_cat__sub_cat_name'),
+    'uploader': ('user_id', 'user__username'),
+    'month': ('month', None),
+}
+FACETS = ['file_kind'] + list(FACET_FIELDS)
+DEFAULT_FACETS = ['file_kind', 'category', 'uploader', 'month']
+
+
+def get_requested_facets(params):
+    requested = [facet.strip() for facet in params.get('facets', '').split(',') if facet.strip()]
+    unknown = [facet for facet in requested if facet not in FACETS]
+    if unknown:
+        raise ValueError(f'Unknown facets: {", ".join(unknown)}. Available facets: {", ".join(FACETS)}')
+    return requested or DEFAULT_FACETS
+
+
+def filter_facet_documents(documents, params, match_id=False):
+    """
+    Narrows documents down by dep_id, cat_id, sub_cat_id, user_id,
+    file_kind, search_query and an upload date range (start and end,
+    YYYY-MM-DD). The search is the full-text search of the document
+    listings (see search_documents, also for match_id), so facets count
+    the documents listed next to them. Raises ValueError for malformed
+    dates.
+    """
+    if params.get('dep_id'):
+        documents = documents.filter(cat__dep_id=params['dep_id'])
+    if params.get('cat_id'):
+        documents = documents.filter(cat_id=params['cat_id'])
+    if params.get('sub_cat_id'):
+        documents = documents.filter(sub_cat_id=params['sub_cat_id'])
+    if params.get('user_id'):
+        documents = documents.filter(user_id=params['user_id'])
+    if params.get('file_kind'):
+        documents = documents.filter(file_kind=params['file_kind'])
+    if params.get('search_query'):
+        documents = search_documents(documents, params['search_query'], match_id=match_id)
+    for param, lookup in [('start', 'upload_time__date__gte'), ('end', 'upload_time__date__lte')]:
+        if params.get(param):
+            try:
+                day = parse_date(params[param])
+            except ValueError:
+                day = None
+            if day is None:
+                raise ValueError(f'{param} must be a date in YYYY-MM-DD format')
+            documents = documents.filter(**{lookup: day})
+    return documents
+
+
+def kind_aggregates():
+    aggregates = {}
+    for kind in FACET_KINDS:
+        match = ~Q(file_kind__in=FILE_KINDS) if kind == 'other' else Q(file_kind=kind)
+        aggregates[f'{kind}_count'] = Count('id', filter=match)
+        aggregates[f'{kind}_size'] = Sum('size', filter=match)
+    return aggregates
+
+
+def get_row_counts(row):
+    return {kind: (row[f'{kind}_count'] or 0, row[f'{kind}_size'] or 0) for kind in FACET_KINDS}
+
+
+def get_facet_rows(documents, facet):
+    value_field, label_field = FACET_FIELDS[facet]
+    if facet == 'month':
+        documents = documents.annotate(month=TruncMonth('upload_time', output_field=DateField()))
+    fields = [value_field] + ([label_field] if label_field else [])
+    return list(documents.values(*fields).annotate(**kind_aggregates()).order_by())
+
+
+def get_facets(documents, facets):
+    """
+    Document count and bytes of a Document queryset in total, per file kind
+    and per value of every other requested facet. Each facet is one grouped
+    query returning a row per value, never the cross product of several
+    facets; file kinds are conditional aggregates of those queries and the
+    totals are folded from the first of them.
+    """
+    group_facets = [facet for facet in facets if facet != 'file_kind']
+    facet_rows = {facet: get_facet_rows(documents, facet) for facet in group_facets}
+    total_rows = facet_rows[group_facets[0]] if group_facets else [documents.aggregate(**kind_aggregates())]
+
+    kinds = {kind: {'count': 0, 'size': 0} for kind in FACET_KINDS}
+    for row in total_rows:
+        for kind, (kind_count, kind_size) in get_row_counts(row).items():
+            kinds[kind]['count'] += kind_count
+            kinds[kind]['size'] += kind_size
+    result = {'total': {'count': sum(kind['count'] for kind in kinds.values()),
+                        'size': sum(kind['size'] for kind in kinds.values())}}
+    if 'file_kind' in facets:
+        result['file_kind'] = kinds
+
+    for facet in group_facets:
+        value_field, label_field = FACET_FIELDS[facet]
+        buckets = []
+        for row in facet_rows[facet]:
+            row_counts = get_row_counts(row)
+            buckets.append({
+                'id': row[value_field],
+                'name': row[label_field] if label_field else row[value_field],
+                'count': sum(kind_count for kind_count, _ in row_counts.values()),
+                'size': sum(kind_size for _, kind_size in row_counts.values()),
+                'file_kind': {kind: kind_count for kind, (kind_count, _) in row_counts.items()},
+            })
+        if facet == 'month':
+            result[facet] = sorted(buckets, key=lambda bucket: bucket['id'])
+        else:
+            result[facet] = sorted(buckets, key=lambda bucket: (-bucket['count'], str(bucket['name'])))
+    return result
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .reports import storage_report, write_report
+from .versions import get_data_version
+from ..model.department import Document, ReportJob
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_WORKERS = 2
+# Jobs still pending or running after this long were lost with a restarted server
+REPORT_JOB_TIMEOUT = timedelta(minutes=30)
+REPORT_ARTIFACT_MAX_AGE = timedelta(days=1)
+REPORT_FILTER_FIELDS = ['dep_id', 'cat_id', 'file_type', 'search_query', 'sort_by', 'sort_order']
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        # Spawned rather than forked so workers never share the server's database connections
+        executor = ProcessPoolExecutor(max_workers=REPORT_JOB_WORKERS,
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+    return executor
+
+
+def normalize_report_filters(data):
+    filters = {'sort_by': 'total_size', 'sort_order': 'asc'}
+    for field in REPORT_FILTER_FIELDS:
+        value = data.get(field)
+        if value is not None and str(value).strip() != '':
+            filters[field] = str(value).strip()
+    filters['sort_order'] = filters['sort_order'].lower()
+    return filters
+
+
+def get_report_cache_key(user, scope, filters, export_format):
+    payload = {
+        'scope': scope,
+        'user': user.pk if scope == ReportJob.SCOPE_USER else None,
+        'filters': filters,
+        'format': export_format,
+        'version': get_data_version(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def queue_report_job(user, scope, data, export_format, convert_size):
+    """
+    Queues a storage report export. When an identical report of the current
+    data was already generated the job is done right away.
+    """
+    filters = normalize_report_filters(data)
+    cache_key = get_report_cache_key(user, scope, filters, export_format)
+    job = ReportJob(user=user, scope=scope, filters=filters, export_format=export_format, cache_key=cache_key)
+    if os.path.exists(job.artifact_path):
+        job.status = ReportJob.STATUS_DONE
+        job.finished_on = timezone.now()
+        job.save()
+        return job
+
+    job.save()
+    transaction.on_commit(lambda: submit_report_job(job.pk, convert_size))
+    return job
+
+
+def submit_report_job(job_id, convert_size):
+    global executor
+    try:
+        get_executor().submit(run_report_job, job_id, convert_size)
+    except BrokenProcessPool:
+        # A worker died, start a fresh pool
+        executor = None
+        get_executor().submit(run_report_job, job_id, convert_size)
+
+
+def expire_report_job(job):
+    if job.status in [ReportJob.STATUS_PENDING, ReportJob.STATUS_RUNNING] and \
+            job.created_on < timezone.now() - REPORT_JOB_TIMEOUT:
+        job.status = ReportJob.STATUS_FAILED
+        job.error = 'Report job timed out'
+        job.finished_on = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_on'])
+    return job
+
+
+def run_report_job(job_id, convert_size):
+    """
+    Generates the artifact of a report job. Runs in a worker process.
+    """
+    started = ReportJob.objects.filter(pk=job_id, status=ReportJob.STATUS_PENDING) \
+        .update(status=ReportJob.STATUS_RUNNING)
+    if not started:
+        return
+    job = ReportJob.objects.select_related('user').get(pk=job_id)
+    try:
+        if not os.path.exists(job.artifact_path):
+            write_report_artifact(job, convert_size)
+        job.status = ReportJob.STATUS_DONE
+    except Exception as e:
+        logger.exception('Report job %s failed', job_id)
+        job.status = ReportJob.STATUS_FAILED
+        job.error = str(e)
+    job.finished_on = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_on'])
+    prune_report_artifacts()
+
+
+def write_report_artifact(job, convert_size):
+    documents = Document.objects.all()
+    if job.scope == ReportJob.SCOPE_USER:
+        documents = documents.filter(cat__dep__user=job.user)
+    report = storage_report(documents, job.filters)
+
+    path = job.artifact_path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name so a half written file is never served
+    temp_path = f'{path}.{os.getpid()}.part'
+    try:
+        with open(temp_path, 'wb') as file:
+            write_report(report, convert_size, job.export_format, file)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def prune_report_artifacts():
+    directory = os.path.join(settings.MEDIA_ROOT, 'reports')
+    if not os.path.isdir(directory):
+        return
+    threshold = time.time() - REPORT_ARTIFACT_MAX_AGE.total_seconds()
+    for entry in os.scandir(directory):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < threshold:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Pruned by another worker at the same time
+            pass
@@ -0,0 +1,289 @@
+import hashlib
+import json
+import math
+import operator
+from datetime import date, datetime
+from functools import reduce
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.functional import cached_property
+
+from .caching import get_dashboard_cache
+from .versions import get_data_versions
+
+CURSOR_PAGINATION = 'cursor'
+CURSOR_SALT = 'myapp.pagination.cursor'
+NEXT = 'next'
+PREVIOUS = 'prev'
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+COUNT_MODES = [COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE]
+# Unfiltered tables larger than this are counted from the PostgreSQL statistics even when exact counts are asked for
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+
+class InvalidPagination(ValueError):
+    pass
+
+
+class InvalidCursor(InvalidPagination):
+    pass
+
+
+def cursor_requested(params):
+    return params.get('pagination') == CURSOR_PAGINATION or bool(params.get('cursor'))
+
+
+def get_ordering(queryset):
+    """
+    Order of a queryset as field names, made total by the primary key unless
+    the rows are groups of an aggregation, which the caller orders by all
+    grouped fields.
+    """
+    ordering = list(queryset.query.order_by)
+    if not all(isinstance(field, str) and field != '?' for field in ordering):
+        raise ValueError('Cursor pagination needs a queryset ordered by field names')
+    pk_name = queryset.model._meta.pk.name
+    if queryset.query.group_by is None and not {pk_name, f'-{pk_name}', 'pk', '-pk'} & set(ordering):
+        ordering.append(pk_name)
+    return ordering
+
+
+def get_row_value(row, field):
+    # Rows are dicts for values() querysets and model instances otherwise
+    if isinstance(row, dict):
+        return row[field]
+    return reduce(getattr, field.split('__'), row)
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'date': value.isoformat()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and 'datetime' in value:
+        return parse_datetime(value['datetime'])
+    if isinstance(value, dict) and 'date' in value:
+        return parse_date(value['date'])
+    return value
+
+
+def encode_cursor(row, ordering, direction):
+    values = [encode_value(get_row_value(row, field.lstrip('-'))) for field in ordering]
+    return signing.dumps({'o': ordering, 'v': values, 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor('Invalid cursor')
+    if data.get('o') != ordering:
+        # Issued for another sort_by or sort_order
+        raise InvalidCursor('Cursor does not match the requested sorting')
+    return [decode_value(value) for value in data['v']], data['d']
+
+
+def after_cursor(ordering, values, backwards):
+    """
+    Rows strictly after the cursor values in the given ordering, or before
+    them when going backwards: the first differing field decides.
+    """
+    if any(value is None for value in values):
+        # NULLs sort first or last depending on the database, no comparison finds the rows after them
+        raise InvalidCursor('Cursor pagination needs sort values that are not null')
+    conditions = []
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != backwards
+        conditions.append(equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value}))
+        equal &= Q(**{name: value})
+    return reduce(operator.or_, conditions)
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    A page of rows after (or before) a cursor, found by the sort key rather
+    than by OFFSET, so every page costs the same and rows inserted meanwhile
+    never shift pages. Returns the rows and their next_cursor and
+    prev_cursor, None at either end.
+    """
+    ordering = get_ordering(queryset)
+    direction = NEXT
+    if cursor:
+        values, direction = decode_cursor(cursor, ordering)
+        queryset = queryset.filter(after_cursor(ordering, values, direction == PREVIOUS))
+    if direction == PREVIOUS:
+        queryset = queryset.order_by(*[field[1:] if field.startswith('-') else f'-{field}' for field in ordering])
+    else:
+        queryset = queryset.order_by(*ordering)
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == PREVIOUS:
+        rows.reverse()
+        prev_cursor = encode_cursor(rows[0], ordering, PREVIOUS) if has_more else None
+        next_cursor = encode_cursor(rows[-1], ordering, NEXT) if rows else None
+    else:
+        next_cursor = encode_cursor(rows[-1], ordering, NEXT) if has_more else None
+        prev_cursor = encode_cursor(rows[0], ordering, PREVIOUS) if cursor and rows else None
+    return rows, {'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not query.where and query.group_by is None and not query.distinct and not query.combinator
+
+
+def get_table_estimate(queryset):
+    # Row count of the last VACUUM or ANALYZE, -1 for a table never analyzed
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] >= 0 else None
+
+
+def get_plan_estimate(queryset):
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        # A filter that can never match (e.g. .none()) compiles to no SQL at all
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset):
+    """
+    Row count of a queryset as estimated by the PostgreSQL planner.
+    """
+    if is_unfiltered(queryset):
+        estimate = get_table_estimate(queryset)
+        if estimate is not None:
+            return estimate
+    return get_plan_estimate(queryset)
+
+
+def cached_count(queryset, count_versions):
+    """
+    Exact row count of a queryset, cached per query and the given data
+    versions (see myapp.utils.versions). The query includes the filters
+    and the requesting user, so every scope and filter is cached apart.
+    """
+    if not count_versions:
+        return queryset.count()
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    versions = get_data_versions(*count_versions)
+    key = hashlib.sha256(repr((sql, params, count_versions, versions)).encode('utf-8')).hexdigest()
+    cache = get_dashboard_cache()
+    count = cache.get(f'count:{key}')
+    if count is None:
+        count = queryset.count()
+        cache.set(f'count:{key}', count, settings.DASHBOARD_CACHE_TIMEOUT)
+    return count
+
+
+class CountingPaginator(Paginator):
+    """
+    Paginator counting with a count strategy. Without an exact count, any
+    page number is accepted and an extra row is read to tell whether a next
+    page exists.
+    """
+
+    def __init__(self, object_list, per_page, count_mode=COUNT_EXACT, count_versions=()):
+        super().__init__(object_list, per_page)
+        self.count_mode = count_mode
+        self.count_versions = count_versions
+
+    @cached_property
+    def count(self):
+        if self.count_mode == COUNT_ESTIMATE:
+            return estimate_count(self.object_list)
+        if self.count_mode == COUNT_EXACT:
+            return cached_count(self.object_list, self.count_versions)
+        return None
+
+    def validate_number(self, number):
+        if self.count_mode == COUNT_EXACT:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        return max(number, 1)
+
+    def get_page(self, number):
+        if self.count_mode == COUNT_EXACT:
+            return super().get_page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        page = self._get_page(rows[:self.per_page], number, self)
+        page.has_more = len(rows) > self.per_page
+        return page
+
+
+def get_count_mode(params, queryset, default):
+    count_mode = params.get('count') or default
+    if count_mode not in COUNT_MODES:
+        raise InvalidPagination(f'count must be one of {", ".join(COUNT_MODES)}')
+    if connections[queryset.db].vendor != 'postgresql':
+        # No planner to ask, an exact count is the closest estimate
+        return COUNT_EXACT if count_mode == COUNT_ESTIMATE else count_mode
+    if count_mode == COUNT_EXACT and is_unfiltered(queryset):
+        estimate = get_table_estimate(queryset)
+        if estimate is not None and estimate > COUNT_ESTIMATE_THRESHOLD:
+            return COUNT_ESTIMATE
+    return count_mode
+
+
+def paginate(queryset, params, page_size, count_versions=()):
+    """
+    A page of an ordered queryset and the pagination fields of the
+    response. Numbered pages (page_no) by default; with pagination=cursor or
+    a cursor, pages follow next_cursor and prev_cursor instead.
+
+    count=exact (default for numbered pages) counts exactly, cached until
+    one of the count_versions data versions changes; count=estimate asks the
+    PostgreSQL planner and count=none (default for cursors) skips counting,
+    leaving total_entries and total_pages None. Raises InvalidPagination for
+    unusable parameters.
+    """
+    if cursor_requested(params):
+        count_mode = get_count_mode(params, queryset, COUNT_NONE)
+        rows, page_info = keyset_page(queryset, params.get('cursor'), page_size)
+        if count_mode != COUNT_NONE:
+            total = CountingPaginator(queryset, page_size, count_mode, count_versions).count
+            page_info.update({'total_entries': total, 'count': count_mode})
+        return rows, page_info
+
+    paginator = CountingPaginator(queryset, page_size, get_count_mode(params, queryset, COUNT_EXACT), count_versions)
+    page = paginator.get_page(params.get('page_no', 1))
+    if paginator.count_mode == COUNT_EXACT:
+        return page.object_list, {'current_page': page.number, 'total_pages': paginator.num_pages,
+                                  'total_entries': paginator.count}
+    total = paginator.count
+    return page.object_list, {'current_page': page.number,
+                              'total_pages': math.ceil(total / page_size) if total is not None else None,
+                              'total_entries': total, 'has_next': page.has_more, 'count': paginator.count_mode}
@@ -0,0 +1,83 @@
+import io
+import logging
+import os
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png']
+PREVIEW_PREFIX = 'documents/previews'
+# Longest edge in pixels for each generated rendition
+PREVIEW_SIZES = {
+    'thumbnail': 200,
+    'preview': 1024,
+}
+
+
+def is_image_document(document):
+    return os.path.splitext(document.doc.name)[1][1:].lower() in IMAGE_EXTENSIONS
+
+
+def preview_name(sha256, size):
+    # Keyed by content like the blobs themselves, duplicates share their previews
+    return f'{PREVIEW_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}-{size}.jpg'
+
+
+def has_previews(document):
+    return bool(document.sha256) and is_image_document(document)
+
+
+def render_preview(image, max_edge):
+    image = image.copy()
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel, flatten transparent PNGs onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def generate_previews(document, overwrite=False):
+    """
+    Writes the missing thumbnail and preview renditions of an image document.
+    Returns the number of renditions created.
+    """
+    if not has_previews(document):
+        return 0
+    sizes = [size for size in PREVIEW_SIZES
+             if overwrite or not default_storage.exists(preview_name(document.sha256, size))]
+    if not sizes:
+        return 0
+
+    with document.doc.storage.open(document.doc.name, 'rb') as file, Image.open(file) as image:
+        # Apply the camera orientation before it is lost with the EXIF data
+        image = ImageOps.exif_transpose(image)
+        for size in sizes:
+            name = preview_name(document.sha256, size)
+            if overwrite:
+                default_storage.delete(name)
+            saved_name = default_storage.save(name, ContentFile(render_preview(image, PREVIEW_SIZES[size])))
+            if saved_name != name:
+                # Generated concurrently for a duplicate upload, keep the first one
+                default_storage.delete(saved_name)
+    return len(sizes)
+
+
+def generate_previews_safely(document):
+    # Previews are an optimisation, a broken image must never fail the upload
+    try:
+        generate_previews(document)
+    except Exception:
+        logger.exception('Could not generate previews for document %s', document.pk)
+
+
+def delete_previews(sha256):
+    for size in PREVIEW_SIZES:
+        default_storage.delete(preview_name(sha256, size))
@@ -0,0 +1,164 @@
+import csv
+import json
+import tempfile
+
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import Length
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+from .downloads import content_disposition
+from .streaming import encode_buffered
+
+# Sortable report columns and the aggregate they are ordered by, sizes are ordered as bytes
+REPORT_SORT_FIELDS = {
+    'total_size': 'total_bytes',
+    'total_count': 'total_count',
+}
+REPORT_GROUP_FIELDS = ['cat__dep__dep_name', 'cat__dep_id', 'cat__cat_name', 'cat_id', 'doc_type']
+REPORT_COLUMNS = [
+    ('dep_name', 'Department Name'),
+    ('cat_name', 'Category Name'),
+    ('file_type', 'File Type'),
+    ('total_size', 'Total Size'),
+    ('total_count', 'Total Count'),
+]
+REPORT_EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+REPORT_CHUNK_SIZE = 2000
+
+
+def storage_report(documents, data):
+    """
+    File count and bytes per department, category and file type of a
+    Document queryset, as a single grouped query ordered in the database.
+    Slicing the result applies LIMIT/OFFSET to the grouped rows.
+    """
+    dep_id = data.get('dep_id')
+    cat_id = data.get('cat_id')
+    file_type = data.get('file_type')
+    search_query = data.get('search_query')
+    sort_by = data.get('sort_by', 'total_size')
+    sort_order = data.get('sort_order', 'asc')
+
+    if dep_id:
+        documents = documents.filter(cat__dep_id=dep_id)
+    if cat_id:
+        documents = documents.filter(cat_id=cat_id)
+    if file_type:
+        documents = documents.filter(doc_type=file_type)
+    if search_query:
+        documents = documents.filter(
+            Q(cat__dep__dep_name__icontains=search_query) |
+            Q(cat__cat_name__icontains=search_query) |
+            Q(doc_type__icontains=search_query)
+        )
+
+    ordering = []
+    if sort_by in REPORT_SORT_FIELDS:
+        field = REPORT_SORT_FIELDS[sort_by]
+        ordering.append(f'-{field}' if str(sort_order).lower() == 'desc' else field)
+    # Rows with equal totals keep a stable order across pages
+    ordering += REPORT_GROUP_FIELDS
+    return documents.values(*REPORT_GROUP_FIELDS).annotate(
+        total_bytes=Sum('size'),
+        total_count=Count('id'),
+    ).order_by(*ordering)
+
+
+def report_row(row, convert_size):
+    return {
+        'dep_name': row['cat__dep__dep_name'],
+        'cat_name': row['cat__cat_name'],
+        'file_type': row['doc_type'],
+        'total_size': convert_size(row['total_bytes'] or 0),
+        'total_count': row['total_count'] or 0,
+    }
+
+
+def iter_report_rows(report, convert_size):
+    # Rows are fetched from the database in chunks, never as a whole list
+    for row in report.iterator(chunk_size=REPORT_CHUNK_SIZE):
+        yield report_row(row, convert_size)
+
+
+def report_column_widths(report):
+    # Formatted sizes and counts are never wider than their headers, only the names vary
+    longest = report.aggregate(
+        dep_name=Max(Length('cat__dep__dep_name')),
+        cat_name=Max(Length('cat__cat_name')),
+        file_type=Max(Length('doc_type')),
+    )
+    return [max(len(header), longest.get(key) or 0) + 2 for key, header in REPORT_COLUMNS]
+
+
+def write_report_xlsx(report, convert_size, file):
+    """
+    Writes the report to `file` as a write-only workbook, which keeps only
+    the current row in memory.
+    """
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    # A write-only sheet needs its column widths before the first row, the longest values come from the database
+    for index, width in enumerate(report_column_widths(report), 1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    sheet.append([header for _, header in REPORT_COLUMNS])
+    for row in iter_report_rows(report, convert_size):
+        sheet.append([row[key] for key, _ in REPORT_COLUMNS])
+    book.save(file)
+
+
+class EchoBuffer:
+    # csv.writer target that hands every written line back to the caller
+    def write(self, value):
+        return value
+
+
+def iter_report_csv(report, convert_size):
+    writer = csv.writer(EchoBuffer())
+    yield writer.writerow([header for _, header in REPORT_COLUMNS])
+    for row in iter_report_rows(report, convert_size):
+        yield writer.writerow([row[key] for key, _ in REPORT_COLUMNS])
+
+
+def iter_report_ndjson(report, convert_size):
+    for row in iter_report_rows(report, convert_size):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_report_lines(report, convert_size, export_format):
+    if export_format == 'csv':
+        return iter_report_csv(report, convert_size)
+    return iter_report_ndjson(report, convert_size)
+
+
+def write_report(report, convert_size, export_format, file):
+    if export_format == 'xlsx':
+        write_report_xlsx(report, convert_size, file)
+        return
+    for chunk in encode_buffered(iter_report_lines(report, convert_size, export_format)):
+        file.write(chunk)
+
+
+def report_export_response(report, convert_size, export_format, filename):
+    """
+    Download response of a storage report as xlsx, csv or ndjson. Text
+    formats are streamed while the rows are read, workbooks are assembled
+    in a temporary file and streamed from there.
+    """
+    content_type = REPORT_EXPORT_FORMATS[export_format]
+    if export_format == 'xlsx':
+        file = tempfile.TemporaryFile()
+        write_report_xlsx(report, convert_size, file)
+        file.seek(0)
+        # The temporary file is removed when the response closes it
+        return FileResponse(file, as_attachment=True, filename=f'{filename}.xlsx', content_type=content_type)
+
+    response = StreamingHttpResponse(encode_buffered(iter_report_lines(report, convert_size, export_format)),
+                                     content_type=content_type)
+    response['Content-Disposition'] = content_disposition(f'{filename}.{export_format}', as_attachment=True)
+    return response
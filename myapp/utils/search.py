@@ -0,0 +1,179 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL, Value
+from django.db.models.functions import Coalesce
+from django.utils.html import escape
+
+from .versions import SEARCH_VERSION, bump_data_version
+from ..model.department import Document, DocumentSearchIndex, ExtractedText
+
+SEARCH_TABLE = DocumentSearchIndex._meta.db_table
+SEARCH_FTS_TABLE = f'{SEARCH_TABLE}_fts'  # SQLite FTS5 table, created by migration 0021
+SEARCH_INDEX_BATCH_SIZE = 1000
+SEARCH_MAX_TERMS = 8
+# Relative weight of the indexed columns, in FTS5 column order
+SEARCH_COLUMN_WEIGHTS = {'name': 10.0, 'category': 4.0, 'sub_category': 4.0, 'uploader': 2.0, 'doc_type': 2.0,
+                         'content': 1.0}
+SNIPPET_WORDS = 16
+# A PostgreSQL tsvector is limited to 1 MB and unique words take over twice their length in it
+SEARCH_MAX_CONTENT_BYTES = 256 * 1024
+# Marks matches in snippets from the database until the text is escaped
+MATCH_START, MATCH_END = '\ue000', '\ue001'
+
+
+def get_search_terms(query):
+    # Letters and digits only, so terms never carry query syntax of either backend
+    return re.findall(r'[^\W_]+', query.lower())[:SEARCH_MAX_TERMS]
+
+
+def get_search_content(text):
+    # Cut by bytes, a character split at the end is dropped
+    return text.encode('utf-8')[:SEARCH_MAX_CONTENT_BYTES].decode('utf-8', 'ignore')
+
+
+def index_documents(document_ids):
+    """
+    Writes the search index rows of the given documents in batches, with the
+    text extracted from their content if it is known yet. Callers bump
+    SEARCH_VERSION unless they already bump DOCUMENTS_VERSION, which document
+    listings depend on as well.
+    """
+    document_ids = list(document_ids)
+    for start in range(0, len(document_ids), SEARCH_INDEX_BATCH_SIZE):
+        batch = document_ids[start:start + SEARCH_INDEX_BATCH_SIZE]
+        rows = list(Document.objects.filter(pk__in=batch).values_list(
+            'id', 'name', 'cat__cat_name', 'sub_cat__sub_cat_name', 'user__username', 'doc_type', 'sha256'))
+        texts = dict(ExtractedText.objects.filter(sha256__in={row[-1] for row in rows if row[-1]})
+                     .exclude(text='').values_list('sha256', 'text'))
+        with transaction.atomic():
+            DocumentSearchIndex.objects.filter(document_id__in=batch).delete()
+            DocumentSearchIndex.objects.bulk_create([
+                DocumentSearchIndex(document_id=document_id, name=name, category=category or '',
+                                    sub_category=sub_category or '', uploader=uploader or '', doc_type=doc_type,
+                                    content=get_search_content(texts.get(sha256, '')))
+                for document_id, name, category, sub_category, uploader, doc_type, sha256 in rows
+            ])
+    return len(document_ids)
+
+
+def rebuild_search_index():
+    count = index_documents(Document.objects.values_list('id', flat=True).order_by('id'))
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_FTS_TABLE}({SEARCH_FTS_TABLE}) VALUES ('rebuild')")
+    bump_data_version(SEARCH_VERSION)
+    return count
+
+
+class PostgresSearch:
+    # Prefix matching on the weighted tsvector, see migration 0021
+    match_sql = f"SELECT document_id FROM {SEARCH_TABLE} WHERE vector @@ to_tsquery('simple', %s)"
+    # float8 so the rank a cursor carries compares equal to the rank in the database
+    rank_sql = f"SELECT ts_rank(vector, to_tsquery('simple', %s))::float8 FROM {SEARCH_TABLE} " \
+               f"WHERE document_id = {Document._meta.db_table}.id"
+    snippet_sql = f"SELECT document_id, ts_headline('simple', content, to_tsquery('simple', %s), %s) " \
+                  f"FROM {SEARCH_TABLE} WHERE document_id = ANY(%s) AND content <> ''"
+    snippet_options = f'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_WORDS}, ' \
+                      f'MinWords={SNIPPET_WORDS // 2}, MaxFragments=1'
+
+    @staticmethod
+    def build_query(terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def get_snippet_query(self, query, ids):
+        return self.snippet_sql, [query, self.snippet_options, list(ids)]
+
+
+class SQLiteSearch:
+    match_sql = f'SELECT rowid FROM {SEARCH_FTS_TABLE} WHERE {SEARCH_FTS_TABLE} MATCH %s'
+    # bm25 is lower for better matches
+    rank_sql = f'SELECT -bm25({SEARCH_FTS_TABLE}, {", ".join(map(str, SEARCH_COLUMN_WEIGHTS.values()))}) ' \
+               f'FROM {SEARCH_FTS_TABLE} WHERE {SEARCH_FTS_TABLE} MATCH %s AND rowid = {Document._meta.db_table}.id'
+
+    @staticmethod
+    def build_query(terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def get_snippet_query(self, query, ids):
+        column = list(SEARCH_COLUMN_WEIGHTS).index('content')
+        sql = f"SELECT rowid, snippet({SEARCH_FTS_TABLE}, {column}, %s, %s, '…', {SNIPPET_WORDS}) " \
+              f"FROM {SEARCH_FTS_TABLE} WHERE {SEARCH_FTS_TABLE} MATCH %s " \
+              f"AND rowid IN ({', '.join(['%s'] * len(ids))})"
+        return sql, [MATCH_START, MATCH_END, query, *ids]
+
+
+SEARCH_BACKENDS = {'postgresql': PostgresSearch(), 'sqlite': SQLiteSearch()}
+
+
+def get_search_backend():
+    # Other databases search the index columns with LIKE
+    return SEARCH_BACKENDS.get(connection.vendor)
+
+
+def search_documents(documents, search_query, match_id=False):
+    """
+    Narrows a Document queryset down to the documents whose name, category,
+    sub category, uploader, type or content contain words starting with
+    every word of search_query, annotated with search_rank (higher is
+    better). With match_id a numeric query also finds the document with
+    that id.
+    """
+    terms = get_search_terms(search_query)
+    id_match = Q(id=int(search_query.strip())) if match_id and search_query.strip().isdigit() else Q(pk__in=[])
+    if not terms:
+        return documents.filter(id_match).annotate(search_rank=Value(0.0, output_field=FloatField()))
+    backend = get_search_backend()
+    if backend is None:
+        matches = Q()
+        for term in terms:
+            matches &= Q(search__name__icontains=term) | Q(search__category__icontains=term) | \
+                Q(search__sub_category__icontains=term) | Q(search__uploader__icontains=term) | \
+                Q(search__doc_type__icontains=term) | Q(search__content__icontains=term)
+        return documents.filter(matches | id_match).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    query = backend.build_query(terms)
+    # A document found by its id only has no rank, 0 keeps it in sorted and cursor pages
+    rank = Coalesce(RawSQL(backend.rank_sql, [query], output_field=FloatField()), Value(0.0))
+    return documents.filter(Q(id__in=RawSQL(backend.match_sql, [query])) | id_match).annotate(search_rank=rank)
+
+
+def highlight(text, terms, marked=False):
+    """
+    HTML escaped text with the words starting with a search term wrapped in
+    <mark>. Text marked by the database already has MATCH_START and
+    MATCH_END around them.
+    """
+    if not marked:
+        pattern = re.compile(r'(?<![^\W_])(' + '|'.join(map(re.escape, terms)) + ')', re.IGNORECASE)
+        text = pattern.sub(lambda match: f'{MATCH_START}{match.group(1)}{MATCH_END}', text) if terms else text
+    return escape(text).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def get_search_snippets(search_query, ids):
+    """
+    {document id: highlighted fragment of the extracted content} for the
+    given documents whose content matches search_query, with one query.
+    """
+    terms = get_search_terms(search_query)
+    backend = get_search_backend()
+    if not terms or not ids or backend is None:
+        return {}
+    sql, params = backend.get_snippet_query(backend.build_query(terms), ids)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return {document_id: highlight(snippet, terms, marked=True) for document_id, snippet in rows
+            if snippet and MATCH_START in snippet}
+
+
+def search_highlights(search_query, documents):
+    """
+    Highlighted name and content snippet of a page of search results,
+    keyed by document id.
+    """
+    terms = get_search_terms(search_query)
+    snippets = get_search_snippets(search_query, [document.id for document in documents])
+    return {document.id: {'highlight': highlight(document.name, terms), 'snippet': snippets.get(document.id)}
+            for document in documents}
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncMonth, TruncWeek
+
+from .common import FILE_KINDS
+from ..model.department import Document, DocumentStorageStat, DocumentDailyStat
+
+TIME_SERIES_GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,  # Periods start on Monday
+    'month': TruncMonth,
+}
+# Fields each series is split by
+TIME_SERIES_GROUPS = {
+    'none': [],
+    'department': ['dep_id', 'dep__dep_name'],
+    'file_kind': ['file_kind'],
+}
+TIME_SERIES_DEFAULT_RANGE = timedelta(days=90)
+
+
+def rebuild_storage_stats():
+    """
+    Recomputes the DocumentStorageStat rollup from scratch with one grouped
+    query. Returns the number of rows written.
+    """
+    totals = Document.objects.values('user_id', 'cat__dep_id', 'cat_id', 'sub_cat_id', 'file_kind').annotate(
+        file_count=Count('id'), total_size=Sum('size')).order_by()
+    DocumentStorageStat.objects.all().delete()
+    rows = DocumentStorageStat.objects.bulk_create([
+        DocumentStorageStat(user_id=total['user_id'], dep_id=total['cat__dep_id'], cat_id=total['cat_id'],
+                            sub_cat_id=total['sub_cat_id'], file_kind=total['file_kind'],
+                            file_count=total['file_count'], total_size=total['total_size'] or 0)
+        for total in totals.iterator()
+    ], batch_size=1000)
+    return len(rows)
+
+
+def rebuild_daily_stats():
+    """
+    Recomputes the DocumentDailyStat rollup from scratch with one grouped
+    query. Returns the number of rows written.
+    """
+    totals = Document.objects.annotate(day=TruncDate('upload_time')) \
+        .values('day', 'cat__dep_id', 'cat_id', 'file_kind') \
+        .annotate(file_count=Count('id'), total_size=Sum('size')).order_by()
+    DocumentDailyStat.objects.all().delete()
+    rows = DocumentDailyStat.objects.bulk_create([
+        DocumentDailyStat(day=total['day'], dep_id=total['cat__dep_id'], cat_id=total['cat_id'],
+                          file_kind=total['file_kind'], file_count=total['file_count'],
+                          total_size=total['total_size'] or 0)
+        for total in totals.iterator()
+    ], batch_size=1000)
+    return len(rows)
+
+
+def summarize_storage_stats(stats):
+    """
+    File count and bytes of a DocumentStorageStat queryset in total and per
+    file kind, with one grouped query.
+    """
+    summary = {'total': 0, 'size': 0, 'kinds': {kind: {'total': 0, 'size': 0} for kind in FILE_KINDS}}
+    for row in stats.values('file_kind').annotate(total=Sum('file_count'), size=Sum('total_size')):
+        summary['total'] += row['total']
+        summary['size'] += row['size']
+        if row['file_kind'] in summary['kinds']:
+            summary['kinds'][row['file_kind']] = {'total': row['total'], 'size': row['size']}
+    return summary
+
+
+def storage_time_series(stats, start, end, granularity, group_by):
+    """
+    Uploaded file count and bytes per period between start and end of a
+    DocumentDailyStat queryset, split by TIME_SERIES_GROUPS[group_by], with
+    running totals that include everything uploaded before start. Two
+    grouped queries over the daily rollup, however many documents exist.
+    """
+    fields = TIME_SERIES_GROUPS[group_by]
+    before = stats.filter(day__lt=start).values(*fields).annotate(
+        file_count=Sum('file_count'), total_size=Sum('total_size')).order_by()
+    running = {tuple(row[field] for field in fields): (row['file_count'], row['total_size']) for row in before}
+
+    periods = stats.filter(day__gte=start, day__lte=end) \
+        .annotate(period=TIME_SERIES_GRANULARITIES[granularity]('day')).values('period', *fields) \
+        .annotate(file_count=Sum('file_count'), total_size=Sum('total_size')).order_by('period', *fields)
+    series = []
+    for row in periods:
+        group = tuple(row[field] for field in fields)
+        count, size = running.get(group, (0, 0))
+        running[group] = (count + row['file_count'], size + row['total_size'])
+        series.append({**row, 'cumulative_count': running[group][0], 'cumulative_size': running[group][1]})
+    return series
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+
+BLOB_PREFIX = 'documents/blobs'
+BLOB_NAME_PATTERN = re.compile(r'^documents/blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.\w+)?$')
+
+
+def hash_content(content):
+    if getattr(content, 'sha256', None):
+        # Computed while streaming the upload, see ValidatingUploadHandler
+        return content.sha256
+    sha256 = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, extension):
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+
+def blob_digest(name):
+    match = BLOB_NAME_PATTERN.match(name or '')
+    return match.group(1) if match else ''
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its content, so uploading the same
+    bytes twice reuses the existing blob instead of writing a second copy.
+    The name produced by upload_to only contributes its extension.
+
+    Blobs are shared between documents; reference counting and deletion are
+    handled by the Blob model (see myapp.signals), never by deleting the file
+    directly.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the final content-based name, identical content must map to the same blob
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1][1:].lower() or 'bin'
+        name = blob_name(hash_content(content), extension)
+        if self.exists(name):
+            return name
+
+        # Write under a unique name first so concurrent uploads of the same content never see a partial blob
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
+
+
+blob_storage = ContentAddressedStorage()
@@ -0,0 +1,85 @@
+import base64
+import json
+import os
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .common import get_data_url_prefix
+
+# A multiple of 3 so consecutive base64 chunks concatenate without padding in between
+BASE64_READ_SIZE = 3 * 16 * 1024
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class Base64File:
+    """
+    Stands in for a base64 data URL inside a response payload. The file is
+    read and encoded in fixed-size chunks while the response is written, so
+    the encoded content never exists in memory as a whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_document(cls, document):
+        return cls(document.doc.path)
+
+    def iter_json(self):
+        prefix = get_data_url_prefix(os.path.splitext(self.path)[1][1:])
+        if prefix is None or not os.path.exists(self.path):
+            yield 'null'
+            return
+        yield f'"{prefix};base64,'
+        with open(self.path, 'rb') as file:
+            for block in iter(lambda: file.read(BASE64_READ_SIZE), b''):
+                yield base64.b64encode(block).decode('ascii')
+        yield '"'
+
+
+def iter_json(value):
+    if isinstance(value, Base64File):
+        yield from value.iter_json()
+    elif isinstance(value, dict):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (',' if index else '') + json.dumps(str(key), ensure_ascii=False) + ':'
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)) or hasattr(value, '__next__'):
+        # Generators are consumed lazily, one item at a time
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ','
+            yield from iter_json(item)
+        yield ']'
+    else:
+        # Compact and unescaped like DRF's JSONRenderer
+        yield json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_buffered(pieces, buffer_size=STREAM_BUFFER_SIZE):
+    # Joins small text pieces so the server writes blocks of about buffer_size
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= buffer_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def stream_json(value, buffer_size=STREAM_BUFFER_SIZE):
+    return encode_buffered(iter_json(value), buffer_size)
+
+
+class StreamingJSONResponse(StreamingHttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(stream_json(data), **kwargs)
@@ -0,0 +1,205 @@
+import hashlib
+import os
+from itertools import chain
+
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+from .common import get_allowed_extension, get_mime_type
+
+MAX_UPLOAD_SIZE = 25 * 1024 * 1024  # 25 MB
+BULK_MAX_UPLOAD_SIZE = 500 * 1024 * 1024  # 500 MB
+HASH_BLOCK_SIZE = 64 * 1024
+
+
+def hash_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class SessionFile(File):
+    """
+    File assembled on disk by an upload session. Exposing temporary_file_path
+    lets FileSystemStorage move it into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+OLE2_SIGNATURE = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'  # Legacy Office formats (doc, xls, ppt)
+ZIP_SIGNATURE = b'PK\x03\x04'  # Office Open XML formats (docx, xlsx, pptx)
+FILE_SIGNATURES = {
+    'pdf': b'%PDF-',
+    'png': b'\x89PNG\r\n\x1a\n',
+    'jpg': b'\xff\xd8\xff',
+    'jpeg': b'\xff\xd8\xff',
+    'doc': OLE2_SIGNATURE,
+    'xls': OLE2_SIGNATURE,
+    'ppt': OLE2_SIGNATURE,
+    'docx': ZIP_SIGNATURE,
+    'xlsx': ZIP_SIGNATURE,
+    'pptx': ZIP_SIGNATURE,
+    'zip': ZIP_SIGNATURE,  # Bulk upload archives only
+}
+DOCUMENT_EXTENSIONS = [extension for extension in FILE_SIGNATURES if extension != 'zip']
+SIGNATURE_LENGTH = max(len(signature) for signature in FILE_SIGNATURES.values())
+
+
+def matches_signature(extension, head):
+    signature = FILE_SIGNATURES.get(extension)
+    return signature is not None and head.startswith(signature)
+
+
+class ValidatingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams an uploaded file to disk while counting bytes, hashing it and
+    checking its magic bytes, so a bad upload is rejected after its first
+    chunk instead of after the whole body has been read.
+
+    The uploaded file gets `extension` and `sha256` attributes. When the
+    upload is aborted, `error` holds the message for the client.
+    """
+
+    def __init__(self, request=None, allowed_extensions=None, max_size=MAX_UPLOAD_SIZE):
+        super().__init__(request)
+        self.allowed_extensions = allowed_extensions or list(DOCUMENT_EXTENSIONS)
+        self.max_size = max_size
+        self.max_request_size = max_size
+        self.error = None
+
+    def abort(self, error):
+        self.error = error
+        raise StopUpload(connection_reset=True)
+
+    def reject(self, error):
+        self.abort(error)
+
+    def get_max_file_size(self):
+        return self.max_size
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The multipart envelope adds a little to the file, so only reject bodies that are clearly too large.
+        # StopUpload is not caught at this stage, returning empty data skips parsing instead.
+        if content_length > self.max_request_size + 64 * 1024:
+            self.error = get_size_error(self.max_request_size)
+            return QueryDict(encoding=encoding), MultiValueDict()
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        self.extension = os.path.splitext(file_name)[1][1:].lower()
+        self.file_error = None
+        if self.extension not in self.allowed_extensions:
+            self.reject('Please upload a valid file, allowed types are ' + ', '.join(self.allowed_extensions))
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file_error:
+            # Rejected file in a bulk upload, skip the rest of it
+            return None
+        self.received += len(raw_data)
+        if self.received > self.get_max_file_size():
+            self.reject(get_size_error(self.get_max_file_size()))
+            return None
+        if len(self.head) < SIGNATURE_LENGTH:
+            self.head += raw_data[:SIGNATURE_LENGTH - len(self.head)]
+            if len(self.head) >= SIGNATURE_LENGTH and not matches_signature(self.extension, self.head):
+                self.reject('File content does not match its ' + self.extension + ' extension')
+                return None
+        self.sha256.update(raw_data)
+        super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.file_error and not matches_signature(self.extension, self.head):
+            self.reject('File content does not match its ' + self.extension + ' extension')
+        file = super().file_complete(file_size)
+        file.extension = self.extension
+        file.sha256 = self.sha256.hexdigest()
+        file.upload_error = self.file_error
+        return file
+
+
+class BulkUploadHandler(ValidatingUploadHandler):
+    """
+    ValidatingUploadHandler for requests carrying many files or a zip
+    archive. A bad file does not abort the request: it is skipped and its
+    reason is left in the file's `upload_error` for the per-file report.
+    """
+
+    def __init__(self, request=None, allowed_extensions=None):
+        super().__init__(request, allowed_extensions)
+        self.allowed_extensions = self.allowed_extensions + ['zip']
+        self.max_request_size = BULK_MAX_UPLOAD_SIZE
+
+    def reject(self, error):
+        self.file_error = error
+
+    def get_max_file_size(self):
+        return BULK_MAX_UPLOAD_SIZE if self.extension == 'zip' else self.max_size
+
+
+def get_size_error(max_size):
+    return f'file size must be less than {max_size // (1024 * 1024)} MB'
+
+
+def install_upload_handler(request, doc_type=None):
+    """
+    Streams multipart uploads through ValidatingUploadHandler. Must run before
+    request.data is first accessed; returns None for non-multipart requests.
+    """
+    if not request.content_type.startswith('multipart/form-data'):
+        return None
+    allowed_extensions = get_allowed_extension(doc_type.lower()) if doc_type else None
+    handler = ValidatingUploadHandler(request, allowed_extensions)
+    request.upload_handlers = [handler]
+    return handler
+
+
+def install_bulk_upload_handler(request, doc_type=None):
+    if not request.content_type.startswith('multipart/form-data'):
+        return None
+    allowed_extensions = get_allowed_extension(doc_type.lower()) if doc_type else None
+    handler = BulkUploadHandler(request, allowed_extensions)
+    request.upload_handlers = [handler]
+    return handler
+
+
+def extract_archive_member(archive, info, extension):
+    """
+    Extracts one zip member to a temporary file with the same checks as
+    ValidatingUploadHandler. The declared size is not trusted, the data read
+    is counted too.
+    """
+    if info.file_size > MAX_UPLOAD_SIZE:
+        raise ValueError(get_size_error(MAX_UPLOAD_SIZE))
+    upload = TemporaryUploadedFile(os.path.basename(info.filename), get_mime_type(extension), info.file_size, None)
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with archive.open(info) as source:
+            head = source.read(SIGNATURE_LENGTH)
+            if not matches_signature(extension, head):
+                raise ValueError('File content does not match its ' + extension + ' extension')
+            for block in chain([head], iter(lambda: source.read(HASH_BLOCK_SIZE), b'')):
+                size += len(block)
+                if size > MAX_UPLOAD_SIZE:
+                    raise ValueError(get_size_error(MAX_UPLOAD_SIZE))
+                sha256.update(block)
+                upload.write(block)
+        upload.flush()
+    except Exception:
+        upload.close()
+        raise
+    upload.seek(0)
+    upload.size = size
+    upload.extension = extension
+    upload.sha256 = sha256.hexdigest()
+    return upload
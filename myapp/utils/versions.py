@@ -0,0 +1,32 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..model.department import DataVersion
+
+# Changes whenever a document is added, changed or removed, or a department or category is edited
+DOCUMENTS_VERSION = 'documents'
+# Changes only when an existing document is changed or a category moves, not on additions and deletions
+DOCUMENT_UPDATES_VERSION = 'document_updates'
+# Changes when the search index is written without a document change, for extracted content and renames
+SEARCH_VERSION = 'search'
+# Everything a filtered or searched document listing depends on
+DOCUMENT_LIST_VERSIONS = (DOCUMENTS_VERSION, SEARCH_VERSION)
+
+
+def get_data_version(name=DOCUMENTS_VERSION):
+    return DataVersion.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+
+def get_data_versions(*names):
+    versions = dict(DataVersion.objects.filter(name__in=names).values_list('name', 'version'))
+    return tuple(versions.get(name, 0) for name in names)
+
+
+def bump_data_version(name=DOCUMENTS_VERSION):
+    updated = DataVersion.objects.filter(name=name).update(version=F('version') + 1)
+    if not updated:
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(name=name, version=1)
+        except IntegrityError:
+            DataVersion.objects.filter(name=name).update(version=F('version') + 1)
@@ -0,0 +1,216 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from ...model.department import Document, Department, Category, DocumentStorageStat
+from ...utils.common import FILE_KINDS, convert_size
+from ...utils.decoraters import AdminOnly
+from ...utils.downloads import document_content_url, document_preview_url
+
+TREE_DEFAULT_DEPTH = 3
+TREE_MAX_DEPTH = 4
+TREE_DEFAULT_PAGE_SIZE = 50
+TREE_MAX_PAGE_SIZE = 500
+FILE_KIND_LABELS = {'pdf': 'PDF', 'ppt': 'PPT', 'image': 'IMAGES', 'word': 'WORD', 'excel': 'EXCEL'}
+
+
+def tree_node(node_id, node_type, name, totals=(0, 0)):
+    return {
+        'id': node_id,
+        'type': node_type,
+        'name': name,
+        'total_files': totals[0],
+        'total_size': totals[1],
+        'size': convert_size(totals[1]),
+    }
+
+
+def set_children(node, children, total, offset):
+    node['children'] = children
+    node['children_total'] = total
+    node['has_more'] = offset + len(children) < total
+
+
+def get_category_totals(category_ids):
+    # (count, bytes) per category and per (category, file kind) from the storage rollup, one query
+    kind_totals = defaultdict(lambda: (0, 0))
+    rows = DocumentStorageStat.objects.filter(cat__in=category_ids).values_list('cat_id', 'file_kind') \
+        .annotate(count=Sum('file_count'), size=Sum('total_size')).order_by()
+    for cat_id, file_kind, count, size in rows:
+        kind_totals[(cat_id, file_kind)] = (count, size)
+    return kind_totals
+
+
+def get_file_pages(request, kind_nodes, offset, limit):
+    """
+    Metadata of the first `limit` files after `offset` for every
+    (category, file kind) pair, with two queries however many pairs are
+    expanded. Returns {(cat_id, file_kind): [file, ...]}.
+    """
+    pages = defaultdict(list)
+    if not kind_nodes:
+        return pages
+    ranked = Document.objects.filter(cat__in={cat_id for cat_id, _ in kind_nodes},
+                                     file_kind__in={kind for _, kind in kind_nodes}) \
+        .values('id', 'cat_id', 'file_kind') \
+        .annotate(row_number=Window(RowNumber(), partition_by=[F('cat_id'), F('file_kind')],
+                                    order_by=[F('name').asc(), F('id').asc()]))
+    # Django 3.2 cannot filter on a window function, so the row limit is applied around the compiled query
+    sql, params = ranked.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT id, cat_id, file_kind FROM ({sql}) ranked '
+                       f'WHERE row_number > %s AND row_number <= %s', [*params, offset, offset + limit])
+        ids = [document_id for document_id, cat_id, file_kind in cursor.fetchall()
+               if (cat_id, file_kind) in kind_nodes]
+
+    files = Document.objects.filter(id__in=ids).select_related('user').order_by('name', 'id')
+    for document in files:
+        last_modified = document.upload_time.astimezone(timezone.get_current_timezone())
+        adjusted_time = last_modified + timedelta(hours=5, minutes=30)
+        pages[(document.cat_id, document.file_kind)].append({
+            'id': document.id,
+            'type': 'file',
+            'file_name': document.name,
+            'size': convert_size(document.size),
+            'content_url': document_content_url(request, document),
+            'thumbnail_url': document_preview_url(request, document, 'thumbnail'),
+            'uploaded_by': document.user.username,
+            'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
+        })
+    return pages
+
+
+def build_category_nodes(request, categories, level, depth, expand, page_size, kind_totals):
+    """
+    Category nodes with their file kind and file children down to `depth`.
+    The files of all expanded kinds are loaded with a single query.
+    """
+    category_nodes = []
+    expanded_kinds = {}
+    for category in categories:
+        totals = [kind_totals[(category.id, kind)] for kind in FILE_KINDS + ['other']]
+        node = tree_node(f'cat-{category.id}', 'category', category.cat_name,
+                         (sum(total[0] for total in totals), sum(total[1] for total in totals)))
+        if level + 1 <= depth or node['id'] in expand:
+            kind_nodes = []
+            for kind in FILE_KINDS:
+                kind_node = tree_node(f'cat-{category.id}-{kind}', 'file_kind', FILE_KIND_LABELS[kind],
+                                      kind_totals[(category.id, kind)])
+                if level + 2 <= depth or kind_node['id'] in expand:
+                    expanded_kinds[(category.id, kind)] = kind_node
+                kind_nodes.append(kind_node)
+            set_children(node, kind_nodes, len(kind_nodes), 0)
+        category_nodes.append(node)
+
+    files = get_file_pages(request, set(expanded_kinds), 0, page_size)
+    for key, kind_node in expanded_kinds.items():
+        set_children(kind_node, files[key], kind_node['total_files'], 0)
+    return category_nodes
+
+
+def get_tree_params(request):
+    try:
+        depth = min(max(int(request.GET.get('depth', TREE_DEFAULT_DEPTH)), 1), TREE_MAX_DEPTH)
+        page_size = min(max(int(request.GET.get('page_size', TREE_DEFAULT_PAGE_SIZE)), 1), TREE_MAX_PAGE_SIZE)
+        page_no = max(int(request.GET.get('page_no', 1)), 1)
+    except ValueError:
+        raise ValueError('depth, page_size and page_no must be integers')
+    expand = {node_id.strip() for node_id in request.GET.get('expand', '').split(',') if node_id.strip()}
+    return depth, page_size, page_no, expand
+
+
+@api_view(['GET'])
+@permission_classes([AdminOnly])
+def get_uploaded_files_tree(request):
+    """
+    Department > category > file type > file hierarchy with counts and sizes,
+    built from a fixed number of queries and without file content.
+
+    depth (1-4) sets how many levels are returned, expand lists extra node
+    ids to open (e.g. dep-1,cat-4,cat-4-pdf) and node + page_no page through
+    the children of one node. Files are fetched through content_url.
+    """
+    try:
+        depth, page_size, page_no, expand = get_tree_params(request)
+    except ValueError as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
+    offset = (page_no - 1) * page_size
+    node_id = request.GET.get('node', 'root')
+
+    try:
+        parts = node_id.split('-')
+        if node_id == 'root':
+            departments = Department.objects.order_by('dep_name', 'id')
+            total = departments.count()
+            departments = list(departments[offset:offset + page_size])
+            department_totals = dict(
+                (dep_id, (count, size)) for dep_id, count, size in
+                DocumentStorageStat.objects.filter(dep__in=departments).values_list('dep_id')
+                .annotate(count=Sum('file_count'), size=Sum('total_size')).order_by())
+            categories = defaultdict(list)
+            if depth >= 2 or any(item.startswith('dep-') for item in expand):
+                for category in Category.objects.filter(dep__in=departments).order_by('cat_name', 'id'):
+                    categories[category.dep_id].append(category)
+            kind_totals = get_category_totals([category.id for items in categories.values() for category in items])
+
+            nodes = []
+            expanded = {}
+            for department in departments:
+                node = tree_node(f'dep-{department.id}', 'department', department.dep_name,
+                                 department_totals.get(department.id, (0, 0)))
+                if depth >= 2 or node['id'] in expand:
+                    expanded[node['id']] = categories[department.id][:page_size], len(categories[department.id])
+                nodes.append(node)
+            # Build all category subtrees together so their files still come from one query
+            expanded_categories = [category for page, _ in expanded.values() for category in page]
+            category_nodes = iter(build_category_nodes(request, expanded_categories, 2, depth, expand, page_size,
+                                                       kind_totals))
+            for node in nodes:
+                if node['id'] in expanded:
+                    page, total_categories = expanded[node['id']]
+                    set_children(node, [next(category_nodes) for _ in page], total_categories, 0)
+            root = {'id': 'root', 'type': 'root', 'name': 'Departments'}
+            set_children(root, nodes, total, offset)
+
+        elif parts[0] == 'dep' and len(parts) == 2:
+            department = Department.objects.get(pk=parts[1])
+            categories = Category.objects.filter(dep=department).order_by('cat_name', 'id')
+            total = categories.count()
+            categories = list(categories[offset:offset + page_size])
+            kind_totals = get_category_totals([category.id for category in categories])
+            department_total = DocumentStorageStat.objects.filter(dep=department).aggregate(
+                count=Sum('file_count'), size=Sum('total_size'))
+            root = tree_node(node_id, 'department', department.dep_name,
+                             (department_total['count'] or 0, department_total['size'] or 0))
+            # The requested node's children are always returned, depth applies to the levels below them
+            category_nodes = build_category_nodes(request, categories, 2, max(depth, 2), expand, page_size,
+                                                  kind_totals)
+            set_children(root, category_nodes, total, offset)
+
+        elif parts[0] == 'cat' and len(parts) == 2:
+            category = Category.objects.get(pk=parts[1])
+            kind_totals = get_category_totals([category.id])
+            root = build_category_nodes(request, [category], 2, max(depth, 3), expand, page_size, kind_totals)[0]
+
+        elif parts[0] == 'cat' and len(parts) == 3 and parts[2] in FILE_KINDS:
+            category = Category.objects.get(pk=parts[1])
+            kind_totals = get_category_totals([category.id])
+            key = (category.id, parts[2])
+            root = tree_node(node_id, 'file_kind', FILE_KIND_LABELS[parts[2]], kind_totals[key])
+            set_children(root, get_file_pages(request, {key}, offset, page_size)[key], root['total_files'], offset)
+
+        else:
+            return Response({'statusCode': '0', 'error': 'Invalid node'}, status=400)
+
+        return Response({'statusCode': '1', 'data': root, 'current_page': page_no, 'page_size': page_size},
+                        status=200)
+    except (Department.DoesNotExist, Category.DoesNotExist, ValueError):
+        return Response({'statusCode': '0', 'error': 'Node not found'}, status=404)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
@@ -1,24 +1,37 @@
 import base64
+from collections import defaultdict
 from datetime import timedelta
 
-import pandas as pd
 from django.contrib.auth import get_user_model
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum
-from django.http import HttpResponse
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
+from django.utils.dateparse import parse_date
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from ...model.department import Document, Department, Category, SubCategory
+from ...model.department import Document, Department, Category, SubCategory, Blob, DocumentStorageStat, \
+    DocumentDailyStat, ReportJob
 from ...serializer.admin import ResourceSerializer, RoleSerializer, RoleResourceMappingSerializer
-from ...utils.common import size_multiplier
+from ...utils.common import get_requested_fields, include_content_requested, select_fields
+from ...utils.analytics import ANALYTICS_GROUPS, ANALYTICS_REPORTS, document_analytics, filter_frame, snapshot
+from ...utils.archives import safe_archive_name, stream_zip
+from ...utils.caching import GLOBAL_SCOPE, cache_dashboard
+from ...utils.downloads import document_content_url, document_preview_url, content_disposition
+from ...utils.facets import filter_facet_documents, get_facets, get_requested_facets
+from ...utils.pagination import InvalidPagination, paginate
+from ...utils.reports import REPORT_EXPORT_FORMATS, storage_report, report_row, report_export_response
+from ...utils.search import search_documents, search_highlights
+from ...utils.stats import TIME_SERIES_GRANULARITIES, TIME_SERIES_GROUPS, TIME_SERIES_DEFAULT_RANGE, \
+    storage_time_series, summarize_storage_stats
+from ...utils.streaming import Base64File, StreamingJSONResponse
+from ...utils.versions import DOCUMENTS_VERSION, DOCUMENT_LIST_VERSIONS
 
 from ...utils.decoraters import AdminOnly
 from ...utils.forms import LoginForm
+from ..department.report_job import create_report_job_response
 from ...models import User
 
 user_dto = {}
@@ -135,40 +148,36 @@ def list_documents_admin(request):
         page_number = request.GET.get('page', 1)
         page_obj = paginator.get_page(page_number)
 
+        include_content = include_content_requested(request)
+        fields = get_requested_fields(request)
         # List to store document information with base64 content
         documents_data = []
 
         for document in page_obj:
-            with open(document.doc.path, 'rb') as file:
-                # Encode document content in base64
-                encoded_data = base64.b64encode(file.read()).decode('utf-8')
-
-            # Determine the file type and append the appropriate prefix
-
-            file_extension = document.doc.path.split('.')[-1].lower()
-            if file_extension in ['pdf', 'ppt', 'pptx', 'doc', 'docx', 'xls', 'xlsx']:
-                encoded_file = f"data:application/{file_extension};base64,{encoded_data}"
-            elif file_extension in ['jpg', 'jpeg', 'png']:
-                encoded_file = f"data:image/{file_extension};base64,{encoded_data}"
-            else:
-                encoded_file = None
-            # Create a dictionary containing document information and base64 content
+            # Create a dictionary containing document information and a link to its content
             doc_info = {
                 'id': document.id,
                 'name': document.name,
                 'doc_type': document.doc_type,
                 'size': document.size,
-                'doc': encoded_file
+                'content_url': document_content_url(request, document),
+                'thumbnail_url': document_preview_url(request, document, 'thumbnail'),
+                'preview_url': document_preview_url(request, document, 'preview'),
             }
+            if include_content:
+                doc_info['doc'] = Base64File.for_document(document)
 
-            documents_data.append(doc_info)
+            documents_data.append(select_fields(doc_info, fields))
 
-        # Return all documents with their information and base64 content
-        return Response({
+        response_data = {
             'documents': documents_data,
             'current_page': page_obj.number,
             'total_pages': paginator.num_pages
-        }, status=200)
+        }
+        if include_content:
+            # Return all documents with their information and base64 content, encoded while streaming
+            return StreamingJSONResponse(response_data, status=200)
+        return Response(response_data, status=200)
 
     except Exception as e:
         return Response({'error': str(e)}, status=500)
@@ -176,69 +185,40 @@ def list_documents_admin(request):
 
 @api_view(['GET'])
 @permission_classes([AdminOnly])
+@cache_dashboard(GLOBAL_SCOPE)
 def admin_dashboard_counts(request):
     try:
-        documents = Document.objects.all()
         departments = Department.objects.all()
-        if documents is None:
-            response_data = {
-                "total_department": departments.count(),
-                "no_of_file": '0',
-                "total_size": '0 MB',
-                "fileType": {
-                    "ppt": {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    "pdf": {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'image': {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'word': {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'excel': {
-                        'size': '0 MB', 'total': '0'
-                    }
-                }
-            }
-            return Response({'statusCode': '1', 'data': response_data}, status=200)
-        no_of_file = documents.count()
-        total_size_bytes = sum(doc.doc.size for doc in documents)
-        total_size_mb = total_size_bytes / (1024 * 1024)  # Convert bytes to MB
-        size_pdf = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith('.pdf'))
-        size_ppt = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.ppt', '.pptx')))
-        size_image = sum(
-            doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.jpg', '.jpeg', '.png')))
-        size_excel = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.xls', '.xlsx')))
-        size_word = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.doc', '.docx')))
-        total_pdf = documents.filter(doc__endswith='.pdf').count()
-        total_ppt = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx')).count()
-        total_images = documents.filter(
-            Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png')).count()
-        total_excel = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx')).count()
-        total_word = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx')).count()
+        # Counts and sizes come from the rollup maintained on upload and delete
+        stats = summarize_storage_stats(DocumentStorageStat.objects.all())
+        kinds = stats['kinds']
+        total_size_mb = stats['size'] / (1024 * 1024)  # Convert bytes to MB
+
+        # Logical bytes count every document, physical bytes count each shared blob once
+        physical_size = (Blob.objects.filter(ref_count__gt=0).aggregate(total=Sum('size'))['total'] or 0) + \
+                        (Document.objects.filter(sha256='').aggregate(total=Sum('size'))['total'] or 0)
 
         response_data = {
             "total_department": departments.count(),
-            "no_of_file": f"{no_of_file}",
+            "no_of_file": f"{stats['total']}",
             "total_size": f"{total_size_mb:.1f} MB",
+            "logical_size": convert_size(stats['size']),
+            "physical_size": convert_size(physical_size),
             "fileType": {
                 "ppt": {
-                    'size': convert_size(size_ppt), 'total': total_ppt
+                    'size': convert_size(kinds['ppt']['size']), 'total': kinds['ppt']['total']
                 },
                 "pdf": {
-                    'size': convert_size(size_pdf), 'total': total_pdf
+                    'size': convert_size(kinds['pdf']['size']), 'total': kinds['pdf']['total']
                 },
                 'image': {
-                    'size': convert_size(size_image), 'total': total_images
+                    'size': convert_size(kinds['image']['size']), 'total': kinds['image']['total']
                 },
                 'word': {
-                    'size': convert_size(size_word), 'total': total_word
+                    'size': convert_size(kinds['word']['size']), 'total': kinds['word']['total']
                 },
                 'excel': {
-                    'size': convert_size(size_excel), 'total': total_excel
+                    'size': convert_size(kinds['excel']['size']), 'total': kinds['excel']['total']
                 }
             }
         }
@@ -249,6 +229,71 @@ def admin_dashboard_counts(request):
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
 
+def get_time_series_params(params):
+    granularity = params.get('granularity', 'day')
+    group_by = params.get('group_by', 'none')
+    if granularity not in TIME_SERIES_GRANULARITIES:
+        raise ValueError('granularity must be day, week or month')
+    if group_by not in TIME_SERIES_GROUPS:
+        raise ValueError('group_by must be none, department or file_kind')
+    try:
+        end = parse_date(params['end']) if params.get('end') else timezone.localdate()
+        start = parse_date(params['start']) if params.get('start') else end - TIME_SERIES_DEFAULT_RANGE
+    except ValueError:
+        start = end = None
+    if start is None or end is None:
+        raise ValueError('start and end must be dates in YYYY-MM-DD format')
+    if start > end:
+        raise ValueError('start must not be after end')
+    return start, end, granularity, group_by
+
+
+@api_view(['GET'])
+@permission_classes([AdminOnly])
+def get_storage_growth(request):
+    """
+    Uploads and bytes per day, week or month between start and end, for
+    everything or split by department or file kind, with running totals.
+    Read from the daily upload rollup, never from the documents.
+    """
+    try:
+        start, end, granularity, group_by = get_time_series_params(request.GET)
+    except ValueError as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
+
+    try:
+        stats = DocumentDailyStat.objects.all()
+        if request.GET.get('dep_id'):
+            stats = stats.filter(dep_id=request.GET['dep_id'])
+        if request.GET.get('cat_id'):
+            stats = stats.filter(cat_id=request.GET['cat_id'])
+        if request.GET.get('file_kind'):
+            stats = stats.filter(file_kind=request.GET['file_kind'])
+
+        series = []
+        for row in storage_time_series(stats, start, end, granularity, group_by):
+            point = {
+                'period': row['period'],
+                'file_count': row['file_count'],
+                'total_size': row['total_size'],
+                'size': convert_size(row['total_size']),
+                'cumulative_count': row['cumulative_count'],
+                'cumulative_size': row['cumulative_size'],
+            }
+            if group_by == 'department':
+                point['dep_id'] = row['dep_id']
+                point['dep_name'] = row['dep__dep_name']
+            elif group_by == 'file_kind':
+                point['file_kind'] = row['file_kind']
+            series.append(point)
+
+        return Response({'statusCode': '1', 'data': series, 'start': start, 'end': end, 'granularity': granularity,
+                         'group_by': group_by}, status=200)
+
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
 def convert_size(size_bytes):
     if size_bytes < 1024:
         return f"{size_bytes} bytes"
@@ -260,32 +305,6 @@ def convert_size(size_bytes):
         return f"{size_bytes / (1024 ** 3):.0f} GB"
 
 
-def get_file(data):
-    print(">>>>>>>%%%%%<<<<<<", data.doc.path)
-    with open(data.doc.path, 'rb') as file:
-        encoded_data = base64.b64encode(file.read()).decode('utf-8')
-    file_extension = data.doc.path.split('.')[-1].lower()
-    if file_extension == 'pdf':
-        encoded_file = f"data:application/{file_extension};base64,{encoded_data}"
-    elif file_extension == 'ppt':
-        encoded_file = f"data:application/vnd.ms-powerpoint;base64,{encoded_data}"
-    elif file_extension == 'pptx':
-        encoded_file = f"data:application/vnd.openxmlformats-officedocument.presentationml.presentation;base64,{encoded_data}"
-    elif file_extension == 'xls':
-        encoded_file = f"data:application/vnd.ms-excel;base64,{encoded_data}"
-    elif file_extension == 'xlsx':
-        encoded_file = f"data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{encoded_data}"
-    elif file_extension == 'doc':
-        encoded_file = f"data:application/msword;base64,{encoded_data}"
-    elif file_extension == 'docx':
-        encoded_file = f"data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{encoded_data}"
-    elif file_extension in ['jpg', 'jpeg', 'png']:
-        encoded_file = f"data:image/{file_extension};base64,{encoded_data}"
-    else:
-        encoded_file = None
-    return encoded_file
-
-
 @api_view(['GET'])
 @permission_classes([AdminOnly])
 def get_uploaded_files(request):
@@ -295,14 +314,15 @@ def get_uploaded_files(request):
         for department in departments:
             categories = Category.objects.filter(dep=department)
             serialized_categories = []
-            total_size_bytes = 0
+            total_size_bytes = DocumentStorageStat.objects.filter(dep=department).aggregate(
+                total=Sum('total_size'))['total'] or 0
             for category in categories:
-                documents = Document.objects.filter(cat=category)
-                total_size_bytes += sum(doc.doc.size for doc in documents)
+                documents = Document.objects.filter(cat=category).select_related('user')
                 # cat_wise_mb = total_size_bytes / (1024 * 1024)
                 serialized_documents = []
-                total_pdf = documents.filter(doc__endswith='.pdf').count()
-                pdfs = documents.filter(doc__endswith='.pdf')
+                kind_counts = get_file_kind_counts(documents)
+                total_pdf = kind_counts['pdf']
+                pdfs = documents.filter(file_kind='pdf')
                 pdf_docs = []
                 for pdf in pdfs:
                     last_modified = pdf.upload_time
@@ -310,7 +330,7 @@ def get_uploaded_files(request):
                     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
 
                     size_formatted = convert_size(pdf.size)
-                    encoded_file = get_file(pdf)
+                    encoded_file = Base64File.for_document(pdf)
                     pdf_docs.append({
                         'file_name': pdf.name,
                         'size': size_formatted,
@@ -319,15 +339,15 @@ def get_uploaded_files(request):
                         'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
                     })
 
-                total_ppt = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx')).count()
-                ppts = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx'))
+                total_ppt = kind_counts['ppt']
+                ppts = documents.filter(file_kind='ppt')
                 ppt_docs = []
                 for ppt in ppts:
                     last_modified = ppt.upload_time
                     last_modified_tz = last_modified.astimezone(timezone.get_current_timezone())
                     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
                     size_formatted = convert_size(ppt.size)
-                    encoded_file = get_file(ppt)
+                    encoded_file = Base64File.for_document(ppt)
                     ppt_docs.append({
                         'file_name': ppt.name,
                         'size': size_formatted,
@@ -335,16 +355,15 @@ def get_uploaded_files(request):
                         'uploaded_by': ppt.user.username,
                         'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
                     })
-                total_images = documents.filter(
-                    Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png')).count()
-                images = documents.filter(Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png'))
+                total_images = kind_counts['image']
+                images = documents.filter(file_kind='image')
                 image_docs = []
                 for image in images:
                     last_modified = image.upload_time
                     last_modified_tz = last_modified.astimezone(timezone.get_current_timezone())
                     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
                     size_formatted = convert_size(image.size)
-                    encoded_file = get_file(image)
+                    encoded_file = Base64File.for_document(image)
                     image_docs.append({
                         'file_name': image.name,
                         'size': size_formatted,
@@ -352,8 +371,8 @@ def get_uploaded_files(request):
                         'uploaded_by': image.user.username,
                         'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
                     })
-                total_excel = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx')).count()
-                excels = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx'))
+                total_excel = kind_counts['excel']
+                excels = documents.filter(file_kind='excel')
                 excel_docs = []
                 for excel in excels:
                     last_modified = excel.upload_time
@@ -361,7 +380,7 @@ def get_uploaded_files(request):
                     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
 
                     size_formatted = convert_size(excel.size)
-                    encoded_file = get_file(excel)
+                    encoded_file = Base64File.for_document(excel)
                     excel_docs.append({
                         'file_name': excel.name,
                         'size': size_formatted,
@@ -369,8 +388,8 @@ def get_uploaded_files(request):
                         'uploaded_by': excel.user.username,
                         'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
                     })
-                total_word = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx')).count()
-                words = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx'))
+                total_word = kind_counts['word']
+                words = documents.filter(file_kind='word')
                 word_docs = []
                 for word in words:
                     last_modified = word.upload_time
@@ -378,7 +397,7 @@ def get_uploaded_files(request):
                     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
 
                     size_formatted = convert_size(word.size)
-                    encoded_file = get_file(word)
+                    encoded_file = Base64File.for_document(word)
                     word_docs.append({
                         'file_name': word.name,
                         'size': size_formatted,
@@ -414,7 +433,7 @@ def get_uploaded_files(request):
                 serialized_categories.append({
                     'category_id': category.id,
                     'category_name': category.cat_name,
-                    'total_file': documents.count(),
+                    'total_file': sum(kind_counts.values()),
                     'document': serialized_documents
                     # Add other category details here if needed
                 })
@@ -424,7 +443,8 @@ def get_uploaded_files(request):
                 'categories': serialized_categories,
                 'total_size': f"{total_size_mb:.0f} MB",
             })
-        return Response({'statusCode': '1', 'data': serialized_departments}, status=200)
+        # File contents are read and encoded while the response is streamed
+        return StreamingJSONResponse({'statusCode': '1', 'data': serialized_departments}, status=200)
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
@@ -469,71 +489,15 @@ def get_active_users(request):
 def get_all_department_file_storage_report(request):
     try:
         no_of_entries = int(request.data.get('no_of_entries', 10))
-        page_no = int(request.data.get('page_no', 1))
-        search_query = request.data.get('search_query', None)
-        dep_id = request.data.get('dep_id')
-        cat_id = request.data.get('cat_id')
-        file_type = request.data.get('file_type')
-        sort_by = request.data.get('sort_by', 'total_size')  # Default sorting by total_size
-        sort_order = request.data.get('sort_order', 'asc')  # Default sorting order is ascending
-
-        file_types = ['pdf', 'ppt', 'image', 'word', 'excel']
-        result = []
-
-        departments = Department.objects.all()
-        if dep_id:
-            departments = departments.filter(pk=dep_id)
-
-        for department in departments:
-            categories = Category.objects.filter(dep=department)
-            if cat_id:
-                categories = categories.filter(pk=cat_id)
-
-            for category in categories:
-                documents = Document.objects.filter(cat=category)
-
-                if file_type:
-                    documents = documents.filter(doc_type=file_type)
-
-                if search_query:
-                    documents = documents.filter(
-                        Q(dep_name__icontains=search_query) |
-                        Q(cat_name__icontains=search_query) |
-                        Q(doc_type__icontains=search_query)
-                    )
-
-                file_info = documents.values(
-                    'doc_type',
-                ).annotate(
-                    total_size=Sum('size'),
-                    total_count=Count('id')
-                )
-
-                for d in file_info:
-                    total_size = convert_size(d['total_size'])
-                    result.append({
-                        'dep_name': department.dep_name,
-                        'cat_name': category.cat_name,
-                        'file_type': d['doc_type'],
-                        'total_size': total_size,
-                        'total_count': d['total_count'] or 0,
-                    })
-
-        # Sorting the result
-        if sort_by == 'total_size':
-            result = sorted(result, key=lambda x: (
-                float(x['total_size'].split()[0]) * size_multiplier(x['total_size'].split()[1]),  # Convert to bytes
-            ), reverse=sort_order.lower() == 'desc')
-        elif sort_by == 'total_count':
-            result = sorted(result, key=lambda x: x['total_count'], reverse=sort_order.lower() == 'desc')
 
-        paginator = Paginator(result, no_of_entries)
-        page_result = paginator.get_page(page_no)
+        report = storage_report(Document.objects.all(), request.data)
+        page, page_info = paginate(report, request.data, no_of_entries, count_versions=(DOCUMENTS_VERSION,))
+        result = [report_row(row, convert_size) for row in page]
 
-        return Response({'statusCode': '1', 'documents': page_result.object_list, 'total_pages': paginator.num_pages,
-                         'current_page': page_result.number, 'total_entries': paginator.count},
-                        status=200)
+        return Response({'statusCode': '1', 'documents': result, **page_info}, status=200)
 
+    except InvalidPagination as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
@@ -542,122 +506,38 @@ def get_all_department_file_storage_report(request):
 @permission_classes([AdminOnly])  # Add the necessary permission classes
 def download_all_excel_report(request):
     try:
-        no_of_entries = int(request.data.get('no_of_entries', 10))
-        page_no = int(request.data.get('page_no', 1))
-        search_query = request.data.get('search_query', None)
-        dep_id = request.data.get('dep_id')
-        cat_id = request.data.get('cat_id')
-        file_type = request.data.get('file_type')
-        sort_by = request.data.get('sort_by', 'total_size')  # Default sorting by total_size
-        sort_order = request.data.get('sort_order', 'asc')  # Default sorting order is ascending
+        export_format = request.data.get('export_format', 'xlsx')
+        if export_format not in REPORT_EXPORT_FORMATS:
+            return Response({'statusCode': '0', 'error': 'Invalid export format'}, status=400)
 
-        file_types = ['pdf', 'ppt', 'image', 'word', 'excel']
-        result = []
-
-        departments = Department.objects.all()
-        if dep_id:
-            departments = departments.filter(pk=dep_id)
-
-        for department in departments:
-            categories = Category.objects.filter(dep=department)
-            if cat_id:
-                categories = categories.filter(pk=cat_id)
-
-            for category in categories:
-                documents = Document.objects.filter(cat=category)
-
-                if file_type:
-                    documents = documents.filter(doc_type=file_type)
-
-                if search_query:
-                    documents = documents.filter(
-                        Q(dep_name__icontains=search_query) |
-                        Q(cat_name__icontains=search_query) |
-                        Q(doc_type__icontains=search_query)
-                    )
-
-                file_info = documents.values(
-                    'doc_type',
-                ).annotate(
-                    total_size=Sum('size'),
-                    total_count=Count('id')
-                )
-
-                for d in file_info:
-                    total_size = convert_size(d['total_size'])
-                    result.append({
-                        'dep_name': department.dep_name,
-                        'cat_name': category.cat_name,
-                        'file_type': d['doc_type'],
-                        'total_size': total_size,
-                        'total_count': d['total_count'] or 0,
-                    })
-
-        # Sorting the result
-        if sort_by == 'total_size':
-            result = sorted(result, key=lambda x: (
-                float(x['total_size'].split()[0]) * size_multiplier(x['total_size'].split()[1]),  # Convert to bytes
-            ), reverse=sort_order.lower() == 'desc')
-        elif sort_by == 'total_count':
-            result = sorted(result, key=lambda x: x['total_count'], reverse=sort_order.lower() == 'desc')
-
-        paginator = Paginator(result, no_of_entries)
-        page_result = paginator.get_page(page_no)
-
-        # Convert the entire result to a DataFrame
-        df = pd.DataFrame(result, columns=['dep_name', 'cat_name', 'file_type', 'total_size', 'total_count'])
-        df = df.rename(columns={
-            'dep_name': 'Department Name',
-            'cat_name': 'Category Name',
-            'file_type': 'File Type',
-            'total_size': 'Total Size',
-            'total_count': 'Total Count',
-        })
-
-        # Create a response with an Excel file
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = f'attachment; filename=department_file_storage_report.xlsx'
-
-        # Create an Excel workbook
-        book = Workbook()
-
-        # Convert the DataFrame to rows and write to the Excel sheet
-        sheet = book.active
-        for row in dataframe_to_rows(df, index=False, header=True):
-            sheet.append(row)
-
-        # Auto-size columns
-        for column in sheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            try:
-                max_length = max(len(str(cell.value)) for cell in column)
-            except ValueError:
-                pass
-            adjusted_width = (max_length + 2)
-            sheet.column_dimensions[column[0].column_letter].width = adjusted_width
-
-        # Save the workbook and finalize the response
-        book.save(response)
-        return response
+        report = storage_report(Document.objects.all(), request.data)
+        return report_export_response(report, convert_size, export_format, 'department_file_storage_report')
 
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
 
+@api_view(['POST'])
+@permission_classes([AdminOnly])
+def create_all_report_job(request):
+    """
+    Queues a storage report export of every department. Takes the filters
+    of downloadExcelReport and returns a job id to poll.
+    """
+    return create_report_job_response(request, ReportJob.SCOPE_ALL, convert_size)
+
+
 @api_view(['GET'])
 @permission_classes([AdminOnly])
+@cache_dashboard(GLOBAL_SCOPE)
 def get_departments(request):
     response_data = []
     try:
         departments = Department.objects.all()
+        department_sizes = dict(DocumentStorageStat.objects.values('dep').annotate(
+            total=Sum('total_size')).values_list('dep', 'total'))
         for department in departments:
-            categories = Category.objects.filter(dep=department)
-            total_size_bytes = 0
-            for category in categories:
-                documents = Document.objects.filter(cat=category)
-                total_size_bytes += sum(doc.doc.size for doc in documents)
-            total_size_mb = total_size_bytes / (1024 * 1024)
+            total_size_mb = department_sizes.get(department.id, 0) / (1024 * 1024)
             response_data.append({
                 'dep_id': department.id,
                 'total_size': f"{total_size_mb:.2f} MB",
@@ -671,20 +551,16 @@ def get_departments(request):
 
 @api_view(['GET'])
 @permission_classes([AdminOnly])
+@cache_dashboard(GLOBAL_SCOPE)
 def get_categories(request, dep_id):
     # dep_id = request.data.get('dep_id')
     response_data = []
     try:
-        categories = Category.objects.filter(dep__in=dep_id)
-
-        # print(sub_category)
-        print(SubCategory.objects.filter(cat__in=categories))
+        categories = Category.objects.filter(dep=dep_id).annotate(total_sub_cat=Count('subcategory'))
         for category in categories:
-            sub_category = SubCategory.objects.filter(cat
-                                                      =category).count()
             response_data.append({
                 'cat_id': category.id,
-                'total_sub_cat': sub_category,
+                'total_sub_cat': category.total_sub_cat,
                 'cat_name': category.cat_name
             })
         return Response({'statusCode': '1', 'data': response_data, }, status=200)
@@ -695,31 +571,27 @@ def get_categories(request, dep_id):
 
 @api_view(['GET'])
 @permission_classes([AdminOnly])
+@cache_dashboard(GLOBAL_SCOPE)
 def get_sub_categories(request, cat_id):
     # dep_id = request.data.get('dep_id')
     response_data = []
     try:
         sub_categories = SubCategory.objects.filter(cat=cat_id)
-        print(sub_categories)
+        # Counts of every sub category and file kind in one query
+        facets = get_facets(Document.objects.filter(sub_cat__cat=cat_id), ['sub_category'])['sub_category']
+        counts = {facet['id']: facet['file_kind'] for facet in facets}
         for category in sub_categories:
-            documents = Document.objects.filter(sub_cat=category)
-            total_pdf = documents.filter(doc__endswith='.pdf').count()
-            total_ppt = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx')).count()
-            total_images = documents.filter(
-                Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png')).count()
-            total_excel = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx')).count()
-            total_word = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx')).count()
-
+            kind_counts = counts.get(category.id, defaultdict(int))
             response_data.append({
                 'sub_cat_id': category.id,
                 'sub_cat_name': category.sub_cat_name,
-                'total_file': documents.count(),
+                'total_file': sum(kind_counts.values()),
                 'files': [
-                    {'type': 'PDF', 'total': total_pdf},
-                    {'type': 'PPT', 'total': total_ppt},
-                    {'type': 'IMAGES', 'total': total_images},
-                    {'type': 'EXCEL', 'total': total_excel},
-                    {'type': 'WORD', 'total': total_word},
+                    {'type': 'PDF', 'total': kind_counts['pdf']},
+                    {'type': 'PPT', 'total': kind_counts['ppt']},
+                    {'type': 'IMAGES', 'total': kind_counts['image']},
+                    {'type': 'EXCEL', 'total': kind_counts['excel']},
+                    {'type': 'WORD', 'total': kind_counts['word']},
                 ]
             })
         return Response({'statusCode': '1', 'data': response_data, }, status=200)
@@ -728,95 +600,192 @@ def get_sub_categories(request, cat_id):
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
 
+FILE_TYPE_KINDS = {'PDF': 'pdf', 'PPT': 'ppt', 'IMAGES': 'image', 'EXCEL': 'excel', 'WORD': 'word'}
+
+
+@api_view(['GET'])
+@permission_classes([AdminOnly])
+def get_all_document_facets(request):
+    """
+    Document counts and bytes per file kind, department, category, sub
+    category, uploader or month (facets=...) for any filter of
+    filter_facet_documents, computed with one grouped query per facet.
+    """
+    try:
+        facets = get_requested_facets(request.GET)
+        # Searched like get_all_documents, a document id finds that document
+        documents = filter_facet_documents(Document.objects.all(), request.GET, match_id=True)
+    except ValueError as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
+
+    try:
+        return Response({'statusCode': '1', 'data': get_facets(documents, facets)}, status=200)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([AdminOnly])
+def get_document_analytics(request):
+    """
+    File size percentiles, top uploaders or size distributions
+    (report=size_percentiles|top_uploaders|size_distribution), optionally
+    per group_by and between start and end. Computed in memory over the
+    columnar document snapshot instead of by the database.
+    """
+    report = request.GET.get('report')
+    group_by = request.GET.get('group_by') or None
+    if report not in ANALYTICS_REPORTS:
+        return Response({'statusCode': '0', 'error': f'report must be one of {", ".join(ANALYTICS_REPORTS)}'},
+                        status=400)
+    if group_by is not None and group_by not in ANALYTICS_GROUPS:
+        return Response({'statusCode': '0', 'error': f'group_by must be one of {", ".join(ANALYTICS_GROUPS)}'},
+                        status=400)
+    try:
+        dates = {param: parse_date(request.GET[param]) for param in ['start', 'end'] if request.GET.get(param)}
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        dates, limit = {'start': None}, 0
+    if None in dates.values() or limit < 1:
+        return Response({'statusCode': '0', 'error': 'start and end must be dates in YYYY-MM-DD format and '
+                                                     'limit a positive number'}, status=400)
+
+    try:
+        frame = filter_frame(snapshot.get_frame(), dates.get('start'), dates.get('end'))
+        data = document_analytics(frame, report, group_by, limit)
+        return Response({'statusCode': '1', 'data': data, 'document_count': len(frame)}, status=200)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+def get_file_kind_counts(documents):
+    return {kind: facet['count'] for kind, facet in get_facets(documents, ['file_kind'])['file_kind'].items()}
+
+
+def filter_all_documents(params):
+    """
+    Documents of a sub category (sub_cat_id) or a whole category (cat_id),
+    narrowed down by file_type and search_query and sorted like the admin
+    document table.
+    """
+    search_query = params.get('search_query', None)
+    sub_cat_id = params.get('sub_cat_id')
+    cat_id = params.get('cat_id')
+    filetype = params.get('file_type')
+
+    if sub_cat_id:
+        documents = Document.objects.filter(sub_cat=sub_cat_id)
+    elif cat_id:
+        documents = Document.objects.filter(cat=cat_id)
+    else:
+        documents = Document.objects.none()
+    docs = documents
+    if filetype:
+        file_kind = FILE_TYPE_KINDS.get(filetype.upper())
+        docs = documents.filter(file_kind=file_kind) if file_kind else Document.objects.none()
+
+    if search_query:
+        # A document id typed into the search box still finds that document
+        docs = search_documents(docs, search_query, match_id=True)
+
+    # Apply sorting
+    sort_by = params.get('sort_by', 'relevance' if search_query else 'user__username')  # Default sorting by 'dep_name'
+    if sort_by == 'username':
+        sort_by = 'user__username'
+    if sort_by == 'last_modified':
+        sort_by = 'upload_time'
+    if sort_by == 'relevance' and search_query:
+        sort_by = 'search_rank'
+    if sort_by not in ['user__username', 'name', 'id', 'upload_time', 'search_rank']:
+        sort_by = 'user__username'  # If invalid sort field provided, default to 'dep_name'
+
+    sort_order = params.get('sort_order', 'asc')  # Default sorting order is ascending
+    if sort_order.lower() not in ['asc', 'desc']:
+        sort_order = 'asc'  # If invalid sort order provided, default to ascending
+
+    if sort_by == 'search_rank':
+        return docs.order_by('-search_rank', 'id')
+    if sort_order.lower() == 'asc':
+        return docs.order_by(sort_by)
+    return docs.order_by(f'-{sort_by}')  # Minus sign for descending order
+
+
 @api_view(['POST'])
 @permission_classes([AdminOnly])
 def get_all_documents(request):
     response_data = []
-    docs = []
-    no_of_entries = int(request.data.get('no_of_entries', 10))
-    page_no = int(request.data.get('page_no', 1))
-    search_query = request.data.get('search_query', None)
-    sub_cat_id = request.data.get('sub_cat_id')
-    filetype = request.data.get('file_type')
-    sort_by = request.data.get('sort_by', 'total_size')  # Default sorting by total_size
-    sort_order = request.data.get('sort_order', 'asc')  # Default sorting order is ascending
 
     try:
-        documents = Document.objects.filter(sub_cat=sub_cat_id)
-        docs = Document.objects.none()
-        if filetype.upper() == 'PDF':
-            docs = documents.filter(doc__endswith='.pdf')
-        elif filetype.upper() == 'PPT':
-            docs = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx'))
-        elif filetype.upper() == 'IMAGES':
-            docs = documents.filter(Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png'))
-        elif filetype.upper() == 'EXCEL':
-            docs = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx'))
-            # for excel in docs:
-            #     last_modified = excel.upload_time
-            #     last_modified_tz = last_modified.astimezone(timezone.get_current_timezone())
-            #     adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
-            #
-            #     size_formatted = convert_size(excel.size)
-            #     encoded_file = get_file(excel)
-            #     response_data.append({
-            #         'file_name': excel.name,
-            #         'size': size_formatted,
-            #         'file': encoded_file,
-            #         'uploaded_by': excel.user.username,
-            #         'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
-            #     })
-        elif filetype.upper() == 'WORD':
-            docs = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx'))
-
-        if search_query:
-            docs = docs.filter(
-                Q(user__username__icontains=search_query) |
-                Q(name__icontains=search_query) |
-                Q(upload_time__icontains=search_query) |
-                Q(id__icontains=search_query)
-            )
-
-        # Apply sorting
-        sort_by = request.data.get('sort_by', 'user__username')  # Default sorting by 'dep_name'
-        if sort_by == 'username':
-            sort_by = 'user__username'
-        if sort_by == 'last_modified':
-            sort_by = 'upload_time'
-        if sort_by not in ['user__username', 'name', 'id', 'upload_time']:
-            sort_by = 'user__username'  # If invalid sort field provided, default to 'dep_name'
-
-        sort_order = request.data.get('sort_order', 'asc')  # Default sorting order is ascending
-        if sort_order.lower() not in ['asc', 'desc']:
-            sort_order = 'asc'  # If invalid sort order provided, default to ascending
-
-        if sort_order.lower() == 'asc':
-            docs = docs.order_by(sort_by)
-        else:
-            docs = docs.order_by(
-                f'-{sort_by}')  # Minus sign for descending order
+        docs = filter_all_documents(request.data)
         # Apply pagination
         page_size = int(request.data.get('no_of_entries', 10))  # Default page size is 10
-        paginator = Paginator(docs, page_size)
-        page_number = request.data.get('page_no', 1)
-        page_obj = paginator.get_page(page_number)
-        for data in page_obj:
+        page, page_info = paginate(docs.select_related('user'), request.data, page_size,
+                                     count_versions=DOCUMENT_LIST_VERSIONS)
+        include_content = include_content_requested(request, content_field='file')
+        fields = get_requested_fields(request)
+        search_query = request.data.get('search_query')
+        highlights = search_highlights(search_query, page) if search_query else {}
+        for data in page:
             # .object_list.values('name', 'upload_time', 'doc', 'user__username', 'id', 'size')
             size_formatted = convert_size(data.size)
-            encoded_file = get_file(data)
             last_modified = data.upload_time
             last_modified_tz = last_modified.astimezone(timezone.get_current_timezone())
             adjusted_time = last_modified_tz + timedelta(hours=5, minutes=30)
 
-            response_data.append({
+            doc_info = {
+                'id': data.id,
                 'file_name': data.name,
                 'size': size_formatted,
-                'file': encoded_file,
+                'content_url': document_content_url(request, data),
+                'thumbnail_url': document_preview_url(request, data, 'thumbnail'),
+                'preview_url': document_preview_url(request, data, 'preview'),
                 'uploaded_by': data.user.username,
                 'last_modified': adjusted_time.strftime('%d-%m-%Y %I:%M %p'),
-            })
-        return Response({'statusCode': '1', 'data': response_data, 'current_page': page_obj.number,
-                         'total_pages': paginator.num_pages, 'total_entries': docs.count()}, status=200)
+                **highlights.get(data.id, {}),
+            }
+            if include_content:
+                doc_info['file'] = Base64File.for_document(data)
+            response_data.append(select_fields(doc_info, fields))
+        response_data = {'statusCode': '1', 'data': response_data, **page_info}
+        if include_content:
+            return StreamingJSONResponse(response_data, status=200)
+        return Response(response_data, status=200)
+
+    except InvalidPagination as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
+
+@api_view(['GET', 'POST'])
+@permission_classes([AdminOnly])
+def download_all_documents(request):
+    # Same filters as get_all_documents, GET allows plain download links
+    params = request.data if request.method == 'POST' else request.GET
+    if not params.get('sub_cat_id') and not params.get('cat_id'):
+        return Response({'statusCode': '0', 'error': 'Please provide sub_cat_id or cat_id'}, status=400)
+
+    try:
+        docs = filter_all_documents(params).select_related('sub_cat')
+        if params.get('sub_cat_id'):
+            sub_category = SubCategory.objects.filter(pk=params.get('sub_cat_id')).first()
+            archive_name = sub_category.sub_cat_name if sub_category else 'documents'
+        else:
+            category = Category.objects.filter(pk=params.get('cat_id')).first()
+            archive_name = category.cat_name if category else 'documents'
+        if not docs.exists():
+            return Response({'statusCode': '0', 'error': 'No documents found'}, status=404)
+
+        def entries():
+            for document in docs.iterator():
+                name = safe_archive_name(document.name)
+                if not params.get('sub_cat_id'):
+                    # A whole category gets one folder per sub category
+                    name = f'{safe_archive_name(document.sub_cat.sub_cat_name, "sub category")}/{name}'
+                yield name, document.doc.path, document.upload_time
+
+        response = StreamingHttpResponse(stream_zip(entries()), content_type='application/zip')
+        response['Content-Disposition'] = content_disposition(f'{archive_name}.zip', as_attachment=True)
+        return response
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
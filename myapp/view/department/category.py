@@ -1,4 +1,3 @@
-from django.core.paginator import Paginator
 from django.db.models import Q
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
@@ -6,6 +5,7 @@ from rest_framework.response import Response
 from ...model.department import Department, Category, SubCategory
 from ...serializer.department import CategorySerializer, SubCategorySerializer
 from ...utils.decoraters import IsAuthenticated
+from ...utils.pagination import InvalidPagination, paginate
 
 
 @api_view(['POST'])
@@ -250,13 +250,12 @@ def get_category(request):
 
         # Apply pagination
         page_size = int(request.data.get('no_of_entries', 10))  # Default page size is 10
-        paginator = Paginator(categories_mapped_userid, page_size)
-        page_number = request.data.get('page_no', 1)
-        page_obj = paginator.get_page(page_number)
+        categories = categories_mapped_userid.values('dep__dep_name', 'dep__id', 'cat_name', 'id', 'status')
+        page, page_info = paginate(categories, request.data, page_size)
 
         # Construct response data
         response_data = []
-        for data in page_obj.object_list.values('dep__dep_name', 'dep__id', 'cat_name', 'id', 'status'):
+        for data in page:
             info = {
                 "dep_name": data['dep__dep_name'],
                 "dep_id": data['dep__id'],
@@ -268,11 +267,11 @@ def get_category(request):
 
         return Response({
             "data": response_data,
-            "current_page": page_obj.number,
-            "total_pages": paginator.num_pages,
-            "total_entries": paginator.count,
+            **page_info,
             "statusCode": "1"
         }, status=200)
+    except InvalidPagination as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -318,14 +317,13 @@ def get_sub_category(request):
 
         # Apply pagination
         page_size = int(request.data.get('no_of_entries', 10))  # Default page size is 10
-        paginator = Paginator(sub_categories, page_size)
-        page_number = request.data.get('page_no', 1)
-        page_obj = paginator.get_page(page_number)
+        sub_categories = sub_categories.values('cat__dep__dep_name', 'sub_cat_name', 'cat__id', 'cat__cat_name', 'id',
+                                               'status')
+        page, page_info = paginate(sub_categories, request.data, page_size)
 
         # Construct response data
         response_data = []
-        for data in page_obj.object_list.values('cat__dep__dep_name', 'sub_cat_name', 'cat__id', 'cat__cat_name', 'id',
-                                                'status'):
+        for data in page:
             info = {
                 "dep_name": data['cat__dep__dep_name'],
                 "cat_id": data['cat__id'],
@@ -338,11 +336,11 @@ def get_sub_category(request):
 
         return Response({
             "data": response_data,
-            "current_page": page_obj.number,
-            "total_pages": paginator.num_pages,
-            "total_entries": paginator.count,
+            **page_info,
             "statusCode": "1"
         }, status=200)
+    except InvalidPagination as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
@@ -1,28 +1,58 @@
 import base64
-import os
 
 from django.core.files.base import ContentFile
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.core.files.uploadedfile import UploadedFile
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
-from ...model.department import Department, SubCategory, Category, Document
+from ...model.department import Department, SubCategory, Category, Document, DocumentStorageStat
 from ...serializer.department import DocumentSerializer
-from ...utils.common import get_allowed_extension, get_file_extension, convert_size
-from ...utils.decoraters import IsAuthenticated
+from ...utils.caching import USER_SCOPE, cache_dashboard
+from ...utils.common import get_allowed_extension, get_file_extension, convert_size, get_requested_fields, \
+    include_content_requested, select_fields
+from ...utils.decoraters import IsAuthenticated, AllowAll, HasDocumentToken
+from ...utils.downloads import serve_document, serve_preview, document_content_url, document_preview_url, \
+    verify_document_token
+from ...utils.facets import filter_facet_documents, get_facets, get_requested_facets
+from ...utils.pagination import InvalidPagination, paginate
+from ...utils.previews import PREVIEW_SIZES, generate_previews, has_previews
+from ...utils.search import search_documents, search_highlights
+from ...utils.stats import summarize_storage_stats
+from ...utils.streaming import Base64File, StreamingJSONResponse
+from ...utils.uploads import MAX_UPLOAD_SIZE, install_upload_handler
+from ...utils.versions import DOCUMENT_LIST_VERSIONS
+
+
+def get_category_error(request, doc_category, sub_cat_id):
+    user_id = request.user.user_id
+    departments_mapped_userid = Department.objects.filter(user_id=user_id, user=request.user)
+    categories_mapped_userid = Category.objects.filter(dep__in=departments_mapped_userid)
+    category_details = categories_mapped_userid.values_list('id', flat=True)
+    is_cat_exists = int(doc_category) in category_details
+    if not is_cat_exists:
+        return Response({'statusCode': '0', 'error': 'invalid category id'}, status=400)
+
+    category = categories_mapped_userid.get(pk=doc_category)
+    sub_categories = SubCategory.objects.filter(cat=category)
+    is_sub_cat_exists = sub_categories.filter(pk=sub_cat_id).exists()
+    if not is_sub_cat_exists:
+        return Response({'statusCode': '0', 'error': 'invalid sub category id'}, status=400)
+    return None
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_document(request):
+    # Multipart uploads are streamed to disk and validated while they arrive
+    upload_handler = install_upload_handler(request, request.GET.get('fileType'))
     doc_category = request.data.get('category')
     sub_cat_id = request.data.get('sub_category')
     doc_type = request.data.get('fileType')
     document_name = request.data.get('name')
     doc_data = request.data.get('doc')
-    allowed_extensions = get_allowed_extension(doc_type.lower())
 
+    if upload_handler and upload_handler.error:
+        return Response({'statusCode': '0', 'error': upload_handler.error}, status=400)
     if not doc_category:
         return Response({'statusCode': '0', 'error': 'Please provide category'}, status=400)
     if not doc_type:
@@ -37,36 +67,35 @@ def upload_document(request):
     if not all([doc_category, doc_type, document_name, doc_data, sub_cat_id]):
         return Response({'statusCode': '0', 'error': 'Missing required data'}, status=400)
 
-    user_id = request.user.user_id
-    departments_mapped_userid = Department.objects.filter(user_id=user_id, user=request.user)
-    categories_mapped_userid = Category.objects.filter(dep__in=departments_mapped_userid)
-    category_details = categories_mapped_userid.values_list('id', flat=True)
-    is_cat_exists = int(doc_category) in category_details
-    print(is_cat_exists)
-    if not is_cat_exists:
-        return Response({'statusCode': '0', 'error': 'invalid category id'}, status=400)
-
-    category = categories_mapped_userid.get(pk=doc_category)
-    sub_categories = SubCategory.objects.filter(cat=category)
-    is_sub_cat_exists = sub_categories.filter(pk=sub_cat_id).exists()
-    print(is_sub_cat_exists)
-    if not is_sub_cat_exists:
-        return Response({'statusCode': '0', 'error': 'invalid sub category id'}, status=400)
+    allowed_extensions = get_allowed_extension(doc_type.lower())
+    category_error = get_category_error(request, doc_category, sub_cat_id)
+    if category_error:
+        return category_error
 
     try:
-
-        format, docstr = doc_data.split(';base64,')  # Extract format and data
-        extension = get_file_extension(format)
-        if extension not in allowed_extensions:
-            return Response({'statusCode': '0', 'message': 'Please upload a valid ' + doc_type + ' file'}, status=400)
-
-        image_data = base64.b64decode(docstr)
-        size = len(image_data)
-        size_mb = size / (1024 * 1024)
-        if size_mb > 25:
-            return Response({'statusCode': '0', 'messege': 'file size must be less than 25 MB'}, status=400)
-        document_name = document_name + '.' + extension
-        document = ContentFile(image_data, name=document_name)
+        if isinstance(doc_data, UploadedFile):
+            # Already size-checked, hashed and sniffed by ValidatingUploadHandler
+            extension = doc_data.extension
+            if extension not in allowed_extensions:
+                return Response({'statusCode': '0', 'message': 'Please upload a valid ' + doc_type + ' file'},
+                                status=400)
+            size = doc_data.size
+            document_name = document_name + '.' + extension
+            document = doc_data
+            document.name = document_name
+        else:
+            format, docstr = doc_data.split(';base64,')  # Extract format and data
+            extension = get_file_extension(format)
+            if extension not in allowed_extensions:
+                return Response({'statusCode': '0', 'message': 'Please upload a valid ' + doc_type + ' file'},
+                                status=400)
+
+            image_data = base64.b64decode(docstr)
+            size = len(image_data)
+            if size > MAX_UPLOAD_SIZE:
+                return Response({'statusCode': '0', 'messege': 'file size must be less than 25 MB'}, status=400)
+            document_name = document_name + '.' + extension
+            document = ContentFile(image_data, name=document_name)
 
         # Save document details in the database
         document_object = Document.objects.create(
@@ -101,27 +130,27 @@ def list_documents(request):
             return Response({'statusCode': '0', 'message': 'Please specify "no_of_entries"'}, status=400)
         page_no = request.data.get('page_no')
 
-        # Search functionality across multiple fields
+        # Full-text search over names, categories, types and content, best matches first unless sorted otherwise
         search_query = request.data.get('search_query', None)
         if search_query:
-            documents = documents.filter(
-                Q(name__icontains=search_query) |
-                Q(cat__cat_name__icontains=search_query) |
-                Q(doc_type__icontains=search_query)
-            )
+            documents = search_documents(documents, search_query)
 
         # Sorting functionality
-        sort_by = request.data.get('sort_by', 'name')  # Default sorting by 'name'
+        sort_by = request.data.get('sort_by', 'relevance' if search_query else 'name')  # Default sorting by 'name'
         if sort_by == 'category':
             sort_by = 'cat__cat_name'
-        if sort_by not in ['name', 'cat__cat_name', 'size', 'doc_type']:
+        if sort_by == 'relevance' and search_query:
+            sort_by = 'search_rank'
+        if sort_by not in ['name', 'cat__cat_name', 'size', 'doc_type', 'search_rank']:
             sort_by = 'name'  # If invalid sort field provided, default to 'name'
 
         sort_order = request.data.get('sort_order', 'asc')  # Default sorting order is ascending
         if sort_order.lower() not in ['asc', 'desc']:
             sort_order = 'asc'  # If invalid sort order provided, default to ascending
 
-        if sort_order.lower() == 'asc':
+        if sort_by == 'search_rank':
+            documents = documents.order_by('-search_rank', 'id')
+        elif sort_order.lower() == 'asc':
             documents = documents.order_by(sort_by)
         else:
             documents = documents.order_by(f'-{sort_by}')  # Minus sign for descending order
@@ -129,131 +158,77 @@ def list_documents(request):
         # Get the page size from the frontend request or set a default value
         page_size = int(request.data.get('no_of_entries', 5))  # Default page size is 10
 
-        # Pagination
-        paginator = Paginator(documents, page_size)  # Change '10' to desired items per page
-        page_number = request.data.get('page_no', 1)
-        page_obj = paginator.get_page(page_number)
+        # Pagination, numbered pages or cursors
+        page, page_info = paginate(documents.select_related('cat', 'sub_cat'), request.data, page_size,
+                                     count_versions=DOCUMENT_LIST_VERSIONS)
+        include_content = include_content_requested(request)
+        fields = get_requested_fields(request)
+        highlights = search_highlights(search_query, page) if search_query else {}
         # List to store document information with base64 content
         documents_data = []
         count = 0
-        for document in page_obj:
-            with open(document.doc.path, 'rb') as file:
-                # Encode document content in base64
-                encoded_data = base64.b64encode(file.read()).decode('utf-8')
-
-            # Determine the file type and append the appropriate prefix
-
-            file_extension = document.doc.path.split('.')[-1].lower()
-            if file_extension == 'pdf':
-                encoded_file = f"data:application/{file_extension};base64,{encoded_data}"
-            elif file_extension == 'ppt':
-                encoded_file = f"data:application/vnd.ms-powerpoint;base64,{encoded_data}"
-            elif file_extension == 'pptx':
-                encoded_file = f"data:application/vnd.openxmlformats-officedocument.presentationml.presentation;base64,{encoded_data}"
-            elif file_extension == 'xls':
-                encoded_file = f"data:application/vnd.ms-excel;base64,{encoded_data}"
-            elif file_extension == 'xlsx':
-                encoded_file = f"data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{encoded_data}"
-            elif file_extension == 'doc':
-                encoded_file = f"data:application/msword;base64,{encoded_data}"
-            elif file_extension == 'docx':
-                encoded_file = f"data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{encoded_data}"
-            elif file_extension in ['jpg', 'jpeg', 'png']:
-                encoded_file = f"data:image/{file_extension};base64,{encoded_data}"
-            else:
-                encoded_file = None
+        for document in page:
             size_formatted = convert_size(document.size)
 
-            category = Category.objects.get(pk=document.cat_id)
-            sub_category = SubCategory.objects.get(pk=document.sub_cat_id)
-
-            # Create a dictionary containing document information and base64 content
+            # Create a dictionary containing document information and a link to its content
             doc_info = {
                 'id': document.id,
                 'name': document.name,
-                'category': category.cat_name,
-                'sub_category': sub_category.sub_cat_name,
+                'category': document.cat.cat_name,
+                'sub_category': document.sub_cat.sub_cat_name,
                 'doc_type': document.doc_type,
                 'size': size_formatted,
-                'doc': encoded_file
+                'content_url': document_content_url(request, document),
+                'thumbnail_url': document_preview_url(request, document, 'thumbnail'),
+                'preview_url': document_preview_url(request, document, 'preview'),
+                **highlights.get(document.id, {}),
             }
+            if include_content:
+                doc_info['doc'] = Base64File.for_document(document)
 
-            documents_data.append(doc_info)
+            documents_data.append(select_fields(doc_info, fields))
             count = count + 1
 
-        # Return all documents with their information and base64 content
-        return Response({'statusCode': '1', 'documents': documents_data, 'current_page': page_obj.number,
-                         'total_pages': paginator.num_pages, 'total_entries': documents.count()}, status=200)
+        response_data = {'statusCode': '1', 'documents': documents_data, **page_info}
+        if include_content:
+            # Return all documents with their information and base64 content, encoded while streaming
+            return StreamingJSONResponse(response_data, status=200)
+        return Response(response_data, status=200)
 
+    except InvalidPagination as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_dashboard(USER_SCOPE)
 def get_counts_document(request):
     try:
-        user_id = request.user.user_id
-        documents = Document.objects.filter(user_id=user_id, user=request.user)
-
-        if documents is None:
-            response_data = {
-                "no_of_file": '0',
-                "total_size": '0 MB',
-                "fileType": {
-                    "ppt": {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    "pdf": {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'image': {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'word': {
-                        'size': '0 MB', 'total': '0'
-                    },
-                    'excel': {
-                        'size': '0 MB', 'total': '0'
-                    }
-                }
-            }
-            return Response({'statusCode': '1', 'data': response_data}, status=200)
-        no_of_file = documents.count()
-        total_size_bytes = sum(doc.doc.size for doc in documents)
-        total_size_mb = total_size_bytes / (1024 * 1024)  # Convert bytes to MB
-        size_pdf = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith('.pdf'))
-        size_ppt = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.ppt', '.pptx')))
-        size_image = sum(
-            doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.jpg', '.jpeg', '.png')))
-        size_excel = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.xls', '.xlsx')))
-        size_word = sum(doc.doc.size for doc in documents if doc.doc.name.lower().endswith(('.doc', '.docx')))
-
-        total_pdf = documents.filter(doc__endswith='.pdf').count()
-        total_ppt = documents.filter(Q(doc__endswith='.ppt') | Q(doc__endswith='.pptx')).count()
-        total_images = documents.filter(
-            Q(doc__endswith='.jpg') | Q(doc__endswith='.jpeg') | Q(doc__endswith='.png')).count()
-        total_excel = documents.filter(Q(doc__endswith='.xls') | Q(doc__endswith='.xlsx')).count()
-        total_word = documents.filter(Q(doc__endswith='.doc') | Q(doc__endswith='.docx')).count()
+        # Counts and sizes come from the rollup maintained on upload and delete
+        stats = summarize_storage_stats(DocumentStorageStat.objects.filter(user=request.user))
+        kinds = stats['kinds']
+        total_size_mb = stats['size'] / (1024 * 1024)  # Convert bytes to MB
 
         response_data = {
-            "no_of_file": f"{no_of_file}",
+            "no_of_file": f"{stats['total']}",
             "total_size": f"{total_size_mb:.1f} MB",
             "fileType": {
                 "ppt": {
-                    'size': convert_size(size_ppt), 'total': total_ppt
+                    'size': convert_size(kinds['ppt']['size']), 'total': kinds['ppt']['total']
                 },
                 "pdf": {
-                    'size': convert_size(size_pdf), 'total': total_pdf
+                    'size': convert_size(kinds['pdf']['size']), 'total': kinds['pdf']['total']
                 },
                 'image': {
-                    'size': convert_size(size_image), 'total': total_images
+                    'size': convert_size(kinds['image']['size']), 'total': kinds['image']['total']
                 },
                 'word': {
-                    'size': convert_size(size_word), 'total': total_word
+                    'size': convert_size(kinds['word']['size']), 'total': kinds['word']['total']
                 },
                 'excel': {
-                    'size': convert_size(size_excel), 'total': total_excel
+                    'size': convert_size(kinds['excel']['size']), 'total': kinds['excel']['total']
                 }
             }
         }
@@ -264,6 +239,25 @@ def get_counts_document(request):
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_document_facets(request):
+    """
+    Counts and bytes of the user's documents per file kind, category, month
+    and the other facets of myapp.utils.facets, for filter sidebars.
+    """
+    try:
+        facets = get_requested_facets(request.GET)
+        documents = filter_facet_documents(Document.objects.filter(user=request.user), request.GET)
+    except ValueError as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=400)
+
+    try:
+        return Response({'statusCode': '1', 'data': get_facets(documents, facets)}, status=200)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_document_by_id(request):
@@ -274,46 +268,30 @@ def get_document_by_id(request):
         if documents is None:
             return Response({'messege': 'No document found'}, status=200)
 
-        # List to store document information with base64 content
-        documents_data = []
-        for document in documents:
-            with open(document.doc.path, 'rb') as file:
-                # Encode document content in base64
-                encoded_data = base64.b64encode(file.read()).decode('utf-8')
-                # Determine the file type and append the appropriate prefix
-
-                file_extension = document.doc.path.split('.')[-1].lower()
-                if file_extension == 'pdf':
-                    encoded_file = f"data:application/{file_extension};base64,{encoded_data}"
-                elif file_extension == 'ppt':
-                    encoded_file = f"data:application/vnd.ms-powerpoint;base64,{encoded_data}"
-                elif file_extension == 'pptx':
-                    encoded_file = f"data:application/vnd.openxmlformats-officedocument.presentationml.presentation;base64,{encoded_data}"
-                elif file_extension == 'xls':
-                    encoded_file = f"data:application/vnd.ms-excel;base64,{encoded_data}"
-                elif file_extension == 'xlsx':
-                    encoded_file = f"data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{encoded_data}"
-                elif file_extension == 'doc':
-                    encoded_file = f"data:application/msword;base64,{encoded_data}"
-                elif file_extension == 'docx':
-                    encoded_file = f"data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{encoded_data}"
-                elif file_extension in ['jpg', 'jpeg', 'png']:
-                    encoded_file = f"data:image/{file_extension};base64,{encoded_data}"
-                else:
-                    encoded_file = None
-                size_formatted = convert_size(document.size)
-                # Create a dictionary containing document information and base64 content
-                doc_info = {
-                    'id': document.id,
-                    'name': document.name,
-                    'doc_type': document.doc_type,
-                    'size': size_formatted,
-                    'doc': encoded_file
-                }
-
-                documents_data.append(doc_info)
+        include_content = include_content_requested(request)
+        fields = get_requested_fields(request)
 
-        # Return all documents with their information and base64 content
+        def get_doc_info(document):
+            size_formatted = convert_size(document.size)
+            # Create a dictionary containing document information and a link to its content
+            doc_info = {
+                'id': document.id,
+                'name': document.name,
+                'doc_type': document.doc_type,
+                'size': size_formatted,
+                'content_url': document_content_url(request, document),
+                'thumbnail_url': document_preview_url(request, document, 'thumbnail'),
+                'preview_url': document_preview_url(request, document, 'preview'),
+            }
+            if include_content:
+                doc_info['doc'] = Base64File.for_document(document)
+            return select_fields(doc_info, fields)
+
+        if include_content:
+            # Return all documents with their information and base64 content, one document at a time
+            documents_data = (get_doc_info(document) for document in documents.iterator())
+            return StreamingJSONResponse({'statusCode': '1', 'documents': documents_data}, status=200)
+        documents_data = [get_doc_info(document) for document in documents]
         return Response({'statusCode': '1', 'documents': documents_data}, status=200)
 
     except Exception as e:
@@ -369,14 +347,67 @@ def get_documentby_doc_id(request):
 
 
 @api_view(['GET'])
+@permission_classes([HasDocumentToken | AllowAll])
+def download_document(request, doc_id):
+    if verify_document_token(request.GET.get('token'), doc_id) or request.user.is_admin:
+        documents = Document.objects.all()
+    else:
+        documents = Document.objects.filter(user=request.user)
+    try:
+        document = documents.get(pk=doc_id)
+    except Document.DoesNotExist:
+        return Response({'statusCode': '0', 'error': 'Document not found'}, status=404)
+
+    try:
+        as_attachment = request.GET.get('download') in ['1', 'true']
+        return serve_document(request, document, as_attachment=as_attachment)
+    except FileNotFoundError:
+        return Response({'statusCode': '0', 'error': 'Document file not found'}, status=404)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([HasDocumentToken | AllowAll])
+def get_document_preview(request, doc_id, size):
+    if size not in PREVIEW_SIZES:
+        return Response({'statusCode': '0', 'error': 'Invalid preview size'}, status=400)
+    if verify_document_token(request.GET.get('token'), doc_id) or request.user.is_admin:
+        documents = Document.objects.all()
+    else:
+        documents = Document.objects.filter(user=request.user)
+    try:
+        document = documents.get(pk=doc_id)
+    except Document.DoesNotExist:
+        return Response({'statusCode': '0', 'error': 'Document not found'}, status=404)
+    if not has_previews(document):
+        return Response({'statusCode': '0', 'error': 'No preview available for this document'}, status=404)
+
+    try:
+        response = serve_preview(request, document, size)
+        if response is None:
+            # Not generated yet (older upload or failed render), try once on demand
+            generate_previews(document)
+            response = serve_preview(request, document, size)
+        if response is None:
+            return Response({'statusCode': '0', 'error': 'Preview not found'}, status=404)
+        return response
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 def update_document(request):
+    # Multipart uploads are streamed to disk and validated while they arrive
+    upload_handler = install_upload_handler(request)
     # doc_id, doc
     doc_id = request.data.get('doc_id')
-    category = request.data.get('category')
     doc_name = request.data.get('name')
     doc = request.data.get('doc')
 
+    if upload_handler and upload_handler.error:
+        return Response({'statusCode': '0', 'error': upload_handler.error}, status=400)
     if not doc_name:
         return Response({'statusCode': '0', 'error': 'Please provide file name'}, status=400)
     if not doc:
@@ -391,20 +422,24 @@ def update_document(request):
         return Response({'statusCode': '0', 'error': 'Document not found'}, status=404)
 
     try:
-        if doc:
+        encoded_file = None
+        if isinstance(doc, UploadedFile):
+            # Already size-checked, hashed and sniffed by ValidatingUploadHandler
+            file_extension = doc.extension
+            if file_extension not in get_allowed_extension(document.doc_type):
+                return Response({'statusCode': '0', 'message': 'Please upload a valid ' + document.doc_type + ' file'},
+                                status=400)
+            content = doc
+            size = doc.size
+        else:
             format, docstr = doc.split(';base64,')
             decoded_doc = base64.b64decode(docstr.encode())
+            if len(decoded_doc) > MAX_UPLOAD_SIZE:
+                return Response({'statusCode': '0', 'messege': 'file size must be less than 25 MB'}, status=400)
 
             file_extension = document.doc.path.split('.')[-1].lower()
-
-            new_filename = f'{doc_name}.{file_extension}'
-            new_path = os.path.join(os.path.dirname(document.doc.path), doc_name)
-
-            if os.path.exists(document.doc.path):
-                os.remove(document.doc.path)
-
-            with open(new_path, 'wb') as file:
-                file.write(decoded_doc)
+            content = ContentFile(decoded_doc)
+            size = len(decoded_doc)
 
             if file_extension == 'pdf':
                 encoded_file = f"data:application/{file_extension};base64,{docstr}"
@@ -422,28 +457,27 @@ def update_document(request):
                 encoded_file = f"data:application/vnd.openxmlformats-officedocument.wordprocessingml.document;base64,{docstr}"
             elif file_extension in ['jpg', 'jpeg', 'png']:
                 encoded_file = f"data:image/{file_extension};base64,{docstr}"
-            else:
-                encoded_file = None
 
-            # Update document metadata
-            document.doc_type = file_extension
-            document.name = doc_name
-            document.category = category
-            document.doc = new_path
-            document.size = len(decoded_doc) / (1024 * 1024)  # Size in MB
-            document.save()
+        new_filename = f'{doc_name}.{file_extension}'
 
-            doc_info = {
-                'id': document.id,
-                'name': document.name,
-                'doc_type': document.doc_type,
-                'size': document.size,
-                'doc': encoded_file
-            }
-            return Response({'statusCode': '1', 'data': doc_info, 'message': 'Document updated successfully'},
-                            status=200)
-        else:
-            return Response({'statusCode': '0', 'error': 'No document data provided for update'}, status=400)
+        # Update document file and metadata, the previous blob is released when no other document uses it
+        document.doc.save(new_filename, content, save=False)
+        document.name = new_filename
+        document.size = size
+        document.save()
+
+        doc_info = {
+            'id': document.id,
+            'name': document.name,
+            'doc_type': document.doc_type,
+            'size': document.size,
+            'content_url': document_content_url(request, document),
+            'thumbnail_url': document_preview_url(request, document, 'thumbnail'),
+            'preview_url': document_preview_url(request, document, 'preview'),
+            'doc': encoded_file
+        }
+        return Response({'statusCode': '1', 'data': doc_info, 'message': 'Document updated successfully'},
+                        status=200)
     except Exception as e:
         return Response({'statusCode': '0', 'error': str(e)}, status=500)
 
@@ -463,14 +497,9 @@ def delete_document(request):
                 {"statusCode": 0, "message": "Document with id " + format(doc_id) + " does not exist"}, status=400)
 
         document = Document.objects.get(pk=doc_id, user=request.user)
-        # Get the path of the document file
-        document_path = document.doc.path
+        # The stored file is removed once no other document shares it
         document.delete()
 
-        # Check if the file exists and delete it from the storage folder
-        if os.path.exists(document_path):
-            os.remove(document_path)
-
         return Response({'statusCode': '1', 'message': 'Document deleted successfully'}, status=200)
     except Document.DoesNotExist:
         return Response({'statusCode': '0', 'error': 'Document not found'}, status=400)
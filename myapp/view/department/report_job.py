@@ -0,0 +1,70 @@
+import os
+
+from django.http import FileResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from ...model.department import ReportJob
+from ...utils.common import convert_size
+from ...utils.decoraters import IsAuthenticated, AllowAll
+from ...utils.jobs import queue_report_job, expire_report_job
+from ...utils.reports import REPORT_EXPORT_FORMATS
+
+
+def get_report_job_state(job):
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'export_format': job.export_format,
+        'filters': job.filters,
+        'error': job.error,
+        'created_on': job.created_on,
+        'finished_on': job.finished_on,
+    }
+
+
+def create_report_job_response(request, scope, convert_size):
+    export_format = request.data.get('export_format', 'xlsx')
+    if export_format not in REPORT_EXPORT_FORMATS:
+        return Response({'statusCode': '0', 'error': 'Invalid export format'}, status=400)
+    try:
+        job = queue_report_job(request.user, scope, request.data, export_format, convert_size)
+        return Response({'statusCode': '1', 'data': get_report_job_state(job)}, status=202)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_report_job(request):
+    """
+    Queues a storage report export of the user's departments. Takes the
+    filters of downloadExcelReport and returns a job id to poll.
+    """
+    return create_report_job_response(request, ReportJob.SCOPE_USER, convert_size)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAll])
+def get_report_job(request, job_id):
+    try:
+        job = ReportJob.objects.get(pk=job_id, user=request.user)
+    except ReportJob.DoesNotExist:
+        return Response({'statusCode': '0', 'error': 'Report job not found'}, status=404)
+    return Response({'statusCode': '1', 'data': get_report_job_state(expire_report_job(job))}, status=200)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAll])
+def download_report_job(request, job_id):
+    try:
+        job = ReportJob.objects.get(pk=job_id, user=request.user)
+    except ReportJob.DoesNotExist:
+        return Response({'statusCode': '0', 'error': 'Report job not found'}, status=404)
+    if job.status != ReportJob.STATUS_DONE:
+        return Response({'statusCode': '0', 'error': 'Report is not ready'}, status=409)
+    if not os.path.exists(job.artifact_path):
+        return Response({'statusCode': '0', 'error': 'Report has expired, please request it again'}, status=410)
+    return FileResponse(open(job.artifact_path, 'rb'), as_attachment=True,
+                        filename=f'department_file_storage_report.{job.export_format}',
+                        content_type=REPORT_EXPORT_FORMATS[job.export_format])
@@ -0,0 +1,363 @@
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .document import get_category_error
+from ...model.department import Document, UploadSession
+from ...signals import on_documents_created
+from ...utils.common import get_allowed_extension, get_file_extension, get_doc_type
+from ...utils.decoraters import IsAuthenticated
+from ...utils.storage import blob_name, blob_storage
+from ...utils.uploads import MAX_UPLOAD_SIZE, HASH_BLOCK_SIZE, DOCUMENT_EXTENSIONS, SessionFile, hash_file, \
+    install_bulk_upload_handler, extract_archive_member
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MB
+MAX_CHUNK_SIZE = 5 * 1024 * 1024  # 5 MB
+UPLOAD_SESSION_MAX_AGE = timedelta(days=1)
+BULK_MAX_FILES = 500
+BULK_UPLOAD_WORKERS = 4
+
+
+def get_session_state(session):
+    return {
+        'session_id': str(session.id),
+        'name': session.name,
+        'total_size': session.total_size,
+        'chunk_size': session.chunk_size,
+        'received_size': session.received_size,
+        'next_chunk': session.next_chunk,
+        'total_chunks': -(-session.total_size // session.chunk_size),
+        'is_completed': session.is_completed,
+    }
+
+
+def discard_session(session):
+    if os.path.exists(session.temp_path):
+        os.remove(session.temp_path)
+    session.delete()
+
+
+def discard_stale_sessions(user):
+    threshold = timezone.now() - UPLOAD_SESSION_MAX_AGE
+    for session in UploadSession.objects.filter(user=user, is_completed=False, updated_on__lt=threshold):
+        discard_session(session)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def init_upload_session(request):
+    doc_category = request.data.get('category')
+    sub_cat_id = request.data.get('sub_category')
+    doc_type = request.data.get('fileType')
+    document_name = request.data.get('name')
+    mime_type = request.data.get('mimeType')
+    total_size = request.data.get('total_size')
+    chunk_size = request.data.get('chunk_size', DEFAULT_CHUNK_SIZE)
+    checksum = request.data.get('checksum', '')
+
+    if not doc_category:
+        return Response({'statusCode': '0', 'error': 'Please provide category'}, status=400)
+    if not doc_type:
+        return Response({'statusCode': '0', 'error': 'Please provide file type'}, status=400)
+    if not document_name:
+        return Response({'statusCode': '0', 'error': 'Please provide file name'}, status=400)
+    if not mime_type:
+        return Response({'statusCode': '0', 'error': 'Please provide mime type'}, status=400)
+    if not sub_cat_id:
+        return Response({'statusCode': '0', 'error': 'Please provide sub category'}, status=400)
+    if not total_size:
+        return Response({'statusCode': '0', 'error': 'Please provide total size'}, status=400)
+
+    try:
+        total_size = int(total_size)
+        chunk_size = int(chunk_size)
+    except (TypeError, ValueError):
+        return Response({'statusCode': '0', 'error': 'total_size and chunk_size must be integers'}, status=400)
+    if total_size > MAX_UPLOAD_SIZE:
+        return Response({'statusCode': '0', 'messege': 'file size must be less than 25 MB'}, status=400)
+    if total_size <= 0 or not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        return Response({'statusCode': '0', 'error': 'invalid total_size or chunk_size'}, status=400)
+
+    category_error = get_category_error(request, doc_category, sub_cat_id)
+    if category_error:
+        return category_error
+
+    extension = get_file_extension(f'data:{mime_type}')
+    if extension not in get_allowed_extension(doc_type.lower()):
+        return Response({'statusCode': '0', 'message': 'Please upload a valid ' + doc_type + ' file'}, status=400)
+
+    try:
+        discard_stale_sessions(request.user)
+        session = UploadSession.objects.create(
+            user=request.user,
+            cat_id=doc_category,
+            sub_cat_id=sub_cat_id,
+            name=document_name + '.' + extension,
+            doc_type=doc_type.lower(),
+            total_size=total_size,
+            chunk_size=chunk_size,
+            checksum=checksum.lower(),
+        )
+        os.makedirs(os.path.dirname(session.temp_path), exist_ok=True)
+        open(session.temp_path, 'wb').close()
+        return Response({'statusCode': '1', 'data': get_session_state(session)}, status=201)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_upload_session(request, session_id):
+    try:
+        session = UploadSession.objects.get(pk=session_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return Response({'statusCode': '0', 'error': 'Upload session not found'}, status=404)
+    return Response({'statusCode': '1', 'data': get_session_state(session)}, status=200)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, session_id, chunk_no):
+    chunk_checksum = request.META.get('HTTP_X_CHUNK_CHECKSUM', '').lower()
+    if not chunk_checksum:
+        return Response({'statusCode': '0', 'error': 'Please provide X-Chunk-Checksum header'}, status=400)
+
+    try:
+        with transaction.atomic():
+            try:
+                session = UploadSession.objects.select_for_update().get(pk=session_id, user=request.user)
+            except UploadSession.DoesNotExist:
+                return Response({'statusCode': '0', 'error': 'Upload session not found'}, status=404)
+
+            if session.is_completed:
+                return Response({'statusCode': '0', 'error': 'Upload session already finalized'}, status=409)
+            if chunk_no < session.next_chunk:
+                # Retried chunk that was already stored
+                return Response({'statusCode': '1', 'data': get_session_state(session)}, status=200)
+            if chunk_no > session.next_chunk:
+                return Response({'statusCode': '0', 'error': 'Chunks must be uploaded in order',
+                                 'data': get_session_state(session)}, status=409)
+
+            limit = min(session.chunk_size, session.total_size - session.received_size)
+            sha256 = hashlib.sha256()
+            written = 0
+            stream = request.stream
+            with open(session.temp_path, 'r+b') as file:
+                # Drop whatever an interrupted attempt left after the last good chunk
+                file.truncate(session.received_size)
+                file.seek(session.received_size)
+                while stream is not None:
+                    block = stream.read(HASH_BLOCK_SIZE)
+                    if not block:
+                        break
+                    written += len(block)
+                    if written > limit:
+                        file.truncate(session.received_size)
+                        return Response({'statusCode': '0', 'error': 'Chunk exceeds the expected size'}, status=400)
+                    sha256.update(block)
+                    file.write(block)
+
+                is_last_chunk = session.received_size + written == session.total_size
+                if written == 0 or (written < limit and not is_last_chunk):
+                    file.truncate(session.received_size)
+                    return Response({'statusCode': '0', 'error': 'Incomplete chunk'}, status=400)
+                if sha256.hexdigest() != chunk_checksum:
+                    file.truncate(session.received_size)
+                    return Response({'statusCode': '0', 'error': 'Chunk checksum mismatch'}, status=400)
+
+            session.received_size += written
+            session.next_chunk += 1
+            session.save(update_fields=['received_size', 'next_chunk', 'updated_on'])
+        return Response({'statusCode': '1', 'data': get_session_state(session)}, status=200)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload_session(request, session_id):
+    try:
+        with transaction.atomic():
+            try:
+                # Locked like upload_chunk, a retried or doubled finalize waits and then finds the session completed
+                session = UploadSession.objects.select_for_update().get(pk=session_id, user=request.user)
+            except UploadSession.DoesNotExist:
+                return Response({'statusCode': '0', 'error': 'Upload session not found'}, status=404)
+
+            if session.is_completed:
+                return Response({'statusCode': '0', 'error': 'Upload session already finalized'}, status=409)
+            if session.received_size != session.total_size:
+                return Response({'statusCode': '0', 'error': 'Upload is incomplete',
+                                 'data': get_session_state(session)}, status=400)
+
+            checksum = (request.data.get('checksum') or session.checksum).lower()
+            if not checksum:
+                return Response({'statusCode': '0', 'error': 'Please provide checksum'}, status=400)
+            if hash_file(session.temp_path) != checksum:
+                discard_session(session)
+                return Response({'statusCode': '0', 'error': 'File checksum mismatch, please upload again'},
+                                status=400)
+
+            with open(session.temp_path, 'rb') as file:
+                session_file = SessionFile(file, name=session.name)
+                session_file.sha256 = checksum
+                Document.objects.create(
+                    user=request.user,
+                    name=session.name,
+                    cat_id=session.cat_id,
+                    sub_cat_id=session.sub_cat_id,
+                    doc_type=session.doc_type,
+                    size=session.total_size,
+                    doc=session_file
+                )
+            session.is_completed = True
+            session.save(update_fields=['is_completed', 'updated_on'])
+        if os.path.exists(session.temp_path):
+            os.remove(session.temp_path)
+        return Response({'statusCode': '1', 'message': 'Document Uploaded Successfully'}, status=201)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
+
+
+def get_bulk_members(uploads):
+    """
+    One entry per document in a bulk upload: uploaded files as they are and
+    the members of uploaded zip archives. Problems found while receiving a
+    file are kept in 'error' for the report.
+    """
+    members = []
+    for upload in uploads:
+        if upload.upload_error or upload.extension != 'zip':
+            members.append({'file': upload.name, 'upload': upload, 'error': upload.upload_error})
+            continue
+        try:
+            archive = zipfile.ZipFile(upload)
+        except zipfile.BadZipFile:
+            members.append({'file': upload.name, 'error': 'Invalid zip archive'})
+            continue
+        for info in archive.infolist():
+            file_name = os.path.basename(info.filename)
+            # Skip folders and the metadata added by macOS/Windows archivers
+            if info.is_dir() or info.filename.startswith('__MACOSX/') or file_name.startswith('.') \
+                    or file_name.lower() == 'thumbs.db':
+                continue
+            members.append({'file': info.filename, 'archive': archive, 'info': info})
+    return members
+
+
+def store_bulk_member(member, allowed_extensions):
+    """
+    Runs in the bulk upload thread pool: extracts, validates and hashes one
+    file and moves it into the blob store. Must not touch the database.
+    """
+    result = {'file': member['file']}
+    upload = member.get('upload')
+    try:
+        if member.get('error'):
+            raise ValueError(member['error'])
+        name = os.path.basename(member['file'])
+        extension = os.path.splitext(name)[1][1:].lower()
+        if extension not in allowed_extensions:
+            raise ValueError('Please upload a valid file, allowed types are ' + ', '.join(allowed_extensions))
+        if len(name) > Document._meta.get_field('name').max_length:
+            raise ValueError('File name is too long')
+        if upload is None:
+            upload = extract_archive_member(member['archive'], member['info'], extension)
+        digest_name = blob_name(upload.sha256, extension)
+        created = not blob_storage.exists(digest_name)
+        result.update(name=name, blob=blob_storage.save(digest_name, upload), sha256=upload.sha256,
+                      size=upload.size, doc_type=get_doc_type(extension), created=created)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        if upload is not None and 'archive' in member:
+            upload.close()
+    return result
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_upload_documents(request):
+    # Every file is validated while it arrives, but a bad file only fails its own entry of the report
+    upload_handler = install_bulk_upload_handler(request, request.GET.get('fileType'))
+    if upload_handler is None:
+        return Response({'statusCode': '0', 'error': 'Please send the files as multipart/form-data'}, status=400)
+    doc_category = request.data.get('category')
+    sub_cat_id = request.data.get('sub_category')
+    doc_type = request.data.get('fileType')
+    uploads = request.FILES.getlist('files') + request.FILES.getlist('archive')
+
+    if upload_handler.error:
+        return Response({'statusCode': '0', 'error': upload_handler.error}, status=400)
+    if not doc_category:
+        return Response({'statusCode': '0', 'error': 'Please provide category'}, status=400)
+    if not sub_cat_id:
+        return Response({'statusCode': '0', 'error': 'Please provide sub category'}, status=400)
+    if not uploads:
+        return Response({'statusCode': '0', 'error': 'Please provide files or a zip archive'}, status=400)
+
+    category_error = get_category_error(request, doc_category, sub_cat_id)
+    if category_error:
+        return category_error
+    allowed_extensions = get_allowed_extension(doc_type.lower()) if doc_type else DOCUMENT_EXTENSIONS
+
+    members = get_bulk_members(uploads)
+    if len(members) > BULK_MAX_FILES:
+        return Response({'statusCode': '0', 'error': f'At most {BULK_MAX_FILES} files can be uploaded at once'},
+                        status=400)
+
+    try:
+        # File I/O, decompression and hashing release the GIL, the inserts happen once afterwards
+        with ThreadPoolExecutor(max_workers=BULK_UPLOAD_WORKERS) as executor:
+            results = list(executor.map(lambda member: store_bulk_member(member, allowed_extensions), members))
+
+        stored = [result for result in results if 'error' not in result]
+        documents = []
+        for result in stored:
+            document = Document(
+                user=request.user,
+                name=result['name'],
+                cat_id=doc_category,
+                sub_cat_id=sub_cat_id,
+                doc_type=result['doc_type'],
+                size=result['size'],
+                doc=result['blob'],
+            )
+            document.set_file_fields()
+            documents.append(document)
+        try:
+            with transaction.atomic():
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Document.objects.bulk_create(documents)
+                    # bulk_create sends no post_save signals
+                    on_documents_created(documents)
+                else:
+                    # bulk_create leaves the ids unset here (SQLite), the report and search index need them
+                    for document in documents:
+                        document.save()
+        except Exception:
+            for result in stored:
+                if result['created']:
+                    blob_storage.delete(result['blob'])
+            raise
+
+        report = []
+        created_documents = iter(documents)
+        for result in results:
+            if 'error' in result:
+                report.append({'file': result['file'], 'status': 'failed', 'error': result['error']})
+            else:
+                report.append({'file': result['file'], 'status': 'uploaded', 'id': next(created_documents).pk})
+        status_code = '1' if documents else '0'
+        return Response({'statusCode': status_code, 'uploaded': len(documents),
+                         'failed': len(results) - len(documents), 'files': report},
+                        status=201 if documents else 400)
+    except Exception as e:
+        return Response({'statusCode': '0', 'error': str(e)}, status=500)
@@ -1,2 +1,4 @@
 workers = 3  # Adjust the number of workers based on your server's resources
 bind = "0.0.0.0:8000"
+# Send FileResponse bodies with os.sendfile(), used by DOCUMENT_SERVE_MODE = 'sendfile'
+sendfile = True
@@ -151,6 +151,35 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Listing endpoints return metadata and a per-document content_url; clients
+# that still need the base64 file content inline send include_content=true.
+DOCUMENT_INCLUDE_CONTENT_DEFAULT = False
+# Lifetime in seconds of the signed token embedded in content_url
+DOCUMENT_CONTENT_TOKEN_MAX_AGE = 60 * 60
+# How document downloads are sent:
+#   'python'           - streamed in blocks by the worker
+#   'sendfile'         - real file handed to the WSGI server, gunicorn copies it with os.sendfile()
+#   'x-accel-redirect' - nginx serves DOCUMENT_ACCEL_REDIRECT_PREFIX + the path inside MEDIA_ROOT
+#   'x-sendfile'       - Apache mod_xsendfile / lighttpd serve the absolute path
+DOCUMENT_SERVE_MODE = 'python'
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Dashboard responses are cached until documents or departments change (see myapp/utils/caching.py).
+# Local memory is per process, with several workers use a shared backend like in settings_prod.py.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'default',
+    },
+    'dashboard': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dashboard',
+    },
+}
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+# Upper bound for entries missed by invalidation, e.g. after changes made with queryset.update()
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -29,3 +29,25 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 # uploaded document folder path
 MEDIA_ROOT = 'F:\\py\\documents'
 MEDIA_URL = '/media/'
+
+# Keep the gunicorn workers free for API requests, see DOCUMENT_SERVE_MODE in settings.py.
+# With 'x-accel-redirect' nginx needs an internal location matching the prefix:
+#   location /protected-media/ {
+#       internal;
+#       alias /path/to/MEDIA_ROOT/;
+#   }
+DOCUMENT_SERVE_MODE = os.getenv('DOCUMENT_SERVE_MODE', 'sendfile')
+DOCUMENT_ACCEL_REDIRECT_PREFIX = os.getenv('DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# The gunicorn workers must share the dashboard cache for invalidation to reach all of them.
+# Set DASHBOARD_CACHE_URL (redis://...) to use Redis, which needs the django-redis package.
+if os.getenv('DASHBOARD_CACHE_URL'):
+    CACHES['dashboard'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('DASHBOARD_CACHE_URL'),
+    }
+else:
+    CACHES['dashboard'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('DASHBOARD_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'dashboard')),
+    }
@@ -0,0 +1,28 @@
+import os
+from .settings import *
+
+ROOT_URLCONF = 'myproject.urls'
+
+# Test database, SQLite unless a PostgreSQL database is given like in settings_prod.py.
+# The query plan tests in myapp/tests.py check the plans of whichever database runs them.
+if os.getenv('DB_NAME'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME'),
+            'USER': os.getenv('DB_USER'),
+            'PASSWORD': os.getenv('DB_PASSWORD'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'test.sqlite3'),
+        }
+    }
+
+# Seeding users is slow with Argon2
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']